@@ -8,6 +8,10 @@
   Serial commands are interpreted when the data is available, storing all data to an array (serialBuffer)
   with the processIncomingByte function, before interpreting them in the process_data function. This
   process discards any command that exceeds the buffer limit set by MAX_INPUT.
+
+  Ramps ('r' command) are run by the Arduino. Each step is timed from the start of the ramp with millis()
+  in loop() and takes effect at the next zero cross. Every step is reported back on the serial port so the
+  PC can follow the ramp. Any other command except 'h' stops a running ramp.
     
   Edited by e - 2025/07/07
   */
@@ -70,6 +74,10 @@
   #define SHUTTER_INACTIVE              LOW
 #endif
 
+// Limits on the time between ramp steps in ms
+#define RAMP_INTERVAL_MIN             1
+#define RAMP_INTERVAL_MAX             60000
+
 // Default camera trigger pulse length. Used if an 'i' command is received
 // before a 'p' command
 
@@ -88,6 +96,8 @@ void processIncomingByte (const byte inByte);
 void vPhaseISR( void );
 void mainMenu( void );
 void drawBargraph( uint16_t value );
+void setSerialValue( uint16_t value );
+void startRamp( const char* data );
 
 
 
@@ -107,6 +117,13 @@ bool updateWave = true;                               // Flags when the 'Wave' d
 bool shutterActive = false;                           // Flags when the shutter has been activated
 uint32_t shutterStartTime = 0;                        // Time at which shutter pulse started
 uint16_t shutterMs = SHUTTER_MS_DEFAULT;              // Duration of shutter pulse in MS
+bool rampActive = false;                              // Flags when a ramp is running
+int16_t rampValue = 0;                                // Duty cycle of the current ramp step
+int16_t rampStop = 0;                                 // Final duty cycle of the ramp
+int16_t rampStep = 1;                                 // Change in duty cycle per step, negative for ramps down
+uint32_t rampIntervalMs = 0;                          // Time between ramp steps in ms
+uint32_t rampStartTime = 0;                           // Time at which the ramp started
+uint32_t rampSteps = 0;                               // Number of ramp steps taken
 
 
 
@@ -127,6 +144,12 @@ void processInputString( const char* data )
 {
   uint32_t val;
 
+  // Any new instruction takes over from a running ramp
+  if ( rampActive && ( data[ 0 ] != 'h' ) ) {
+    rampActive = false;
+    Serial.println( "Ramp stopped " + String( serialValue ) );
+  }
+
   switch( data[ 0 ] ) {
     case 's' : 
         serialPhaseTime = manualPhaseTime;//Trial line
@@ -161,7 +184,8 @@ void processInputString( const char* data )
                        "p \t- Sets the pulse length in milliseconds for the 'i' command (10-1000).\n"
                        "w | W\t- Set half (w) or full (W) wave output. (Default half)\n"
                        "dxxxx \t- Sets the duty cycle of the shaker, where 'xxxx' is a number between 0-1000\n"
-                       "ixxxx \t- Initialises the system. Turns on the camera and sets the duty cycle, where 'xxxx' is a number between 0-1000\n"));
+                       "ixxxx \t- Initialises the system. Turns on the camera and sets the duty cycle, where 'xxxx' is a number between 0-1000\n"
+                       "rssss,eeee,tttt,nnn \t- Ramps the duty cycle from ssss to eeee in steps of nnn every tttt ms. Any other command except h stops the ramp\n"));
       break;
     case 'i' :
 #if defined I_AUTO_SERIAL
@@ -180,11 +204,12 @@ void processInputString( const char* data )
       val = strtol( &data[ 1 ], NULL, 10 );
       if ( val > 1000 ) {
         Serial.println( "Invalid value setting duty cycle" );  break;  }
-      serialValue = val;
-      val *= PHASE_TIME_MAX;
-      serialPhaseTime = PHASE_TIME_MAX - PHASE_TIME_OFFSET - (uint16_t)( (val)  / PHASE_TIME_SCALE_DIVISOR );
+      setSerialValue( val );
       Serial.println("Duty Cycle set to " + String( serialValue ) + "/1000" );                          // Print out Duty Cycle
       break;
+    case 'r' :
+      startRamp( data );
+      break;
     case 'p' :
       val = strtol( &data[ 1 ], NULL, 10 );
       if ( ( val < 10 ) || ( val > 1000 ) ) {
@@ -196,6 +221,54 @@ void processInputString( const char* data )
 
 
 
+//--------------------------------------------------------------------------------
+// Set the serial duty cycle and the timer value that produces it
+// INPUT PARAMETERS
+//   value: duty cycle 0-1000
+// RETURN VALUE: none
+//--------------------------------------------------------------------------------
+void setSerialValue( uint16_t value )
+{
+  uint32_t val = (uint32_t)value * PHASE_TIME_MAX;
+  serialValue = value;
+  serialPhaseTime = PHASE_TIME_MAX - PHASE_TIME_OFFSET - (uint16_t)( (val)  / PHASE_TIME_SCALE_DIVISOR );
+}
+
+
+
+//--------------------------------------------------------------------------------
+// Parse a ramp instruction 'rssss,eeee,tttt,nnn' and start the ramp at ssss. The
+// remaining steps are taken by loop(). Reports "Ramp ssss", or "Ramp complete ssss"
+// if there is nothing more to do.
+// INPUT PARAMETERS
+//   data: Pointer to the string data (must be NULL terminated)
+// RETURN VALUE: none
+//--------------------------------------------------------------------------------
+void startRamp( const char* data )
+{
+  char* end;
+  long start = strtol( &data[ 1 ], &end, 10 );
+  long stop = ( *end == ',' ) ? strtol( end + 1, &end, 10 ) : -1;
+  long interval = ( *end == ',' ) ? strtol( end + 1, &end, 10 ) : -1;
+  long step = ( *end == ',' ) ? strtol( end + 1, &end, 10 ) : 1;
+
+  if ( ( start < 0 ) || ( start > 1000 ) || ( stop < 0 ) || ( stop > 1000 ) || ( step < 1 ) || ( step > 1000 ) ||
+       ( interval < RAMP_INTERVAL_MIN ) || ( interval > RAMP_INTERVAL_MAX ) ) {
+    Serial.println( "Invalid ramp" );  return;  }
+
+  rampValue = start;
+  rampStop = stop;
+  rampStep = ( stop < start ) ? -step : step;
+  rampIntervalMs = interval;
+  rampStartTime = millis();
+  rampSteps = 0;
+  rampActive = ( start != stop );
+  setSerialValue( start );
+  Serial.println( ( rampActive ? "Ramp " : "Ramp complete " ) + String( rampValue ) );
+}
+
+
+
 //--------------------------------------------------------------------------------
 // Read the next byte received from the user agent and add it to the command
 // buffer. Monitor the number of received bytes and if the buffer overflows, set
@@ -491,6 +564,19 @@ void loop()
     }
   }
 
+  // Take the next ramp step when it is due. Steps are timed from the start of the
+  // ramp so that they don't drift, and the last step lands exactly on the stop value
+  if ( rampActive && ( ( now - rampStartTime ) >= ( rampSteps + 1 ) * rampIntervalMs ) ) {
+    rampSteps++;
+    rampValue += rampStep;
+    if ( ( ( rampStep > 0 ) && ( rampValue >= rampStop ) ) || ( ( rampStep < 0 ) && ( rampValue <= rampStop ) ) ) {
+      rampValue = rampStop;
+      rampActive = false;
+    }
+    setSerialValue( rampValue );
+    Serial.println( ( rampActive ? "Ramp " : "Ramp complete " ) + String( rampValue ) );
+  }
+
   // Handle the shutter pulse if it is active
   if ( shutterActive ) {
     if ( ( now - shutterStartTime ) >= shutterMs ) {
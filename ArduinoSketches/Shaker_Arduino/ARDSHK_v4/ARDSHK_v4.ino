@@ -8,6 +8,10 @@
   Serial commands are interpreted when the data is available, storing all data to an array (serialBuffer)
   with the processIncomingByte function, before interpreting them in the process_data function. This
   process discards any command that exceeds the buffer limit set by MAX_INPUT.
+
+  Ramps ('r' command) are run by the Arduino. Each step is timed from the start of the ramp with millis()
+  in loop() and takes effect at the next zero cross. Every step is reported back on the serial port so the
+  PC can follow the ramp. Any other command except 'h' stops a running ramp.
     
   */
 
@@ -31,11 +35,57 @@ boolean phaseComplete = false;                                      // phaseComp
 const byte TONE_ADDRESS = 42;                                       // Set address of tone generating Arduino
 volatile long serialDuty = 500;                                       // Variable for storing the serial duty cycle as a percentage
 volatile long workingDuty = 500;                                      // Variable to store duty cycle variable for use in registers
+const long RAMP_INTERVAL_MIN = 1;                                   // Limits on the time between ramp steps in ms
+const long RAMP_INTERVAL_MAX = 60000;                               //
+boolean rampActive = false;                                         // Flags when a ramp is running
+long rampValue = 0;                                                 // Duty cycle of the current ramp step
+long rampStop = 0;                                                  // Final duty cycle of the ramp
+long rampStep = 1;                                                  // Change in duty cycle per step, negative for ramps down
+unsigned long rampIntervalMs = 0;                                   // Time between ramp steps in ms
+unsigned long rampStartTime = 0;                                    // Time at which the ramp started
+unsigned long rampSteps = 0;                                        // Number of ramp steps taken
+
+/* Set the serial duty cycle and the register value that produces it */
+void setSerialDuty (long duty) {
+  serialDuty = duty;                                                                    // Store duty cycle
+  workingDuty = serialDuty * OCR1A/1000L;                                               // Convert to bits for setting OCR1B
+}
+
+/* Ramp Command (rssss,eeee,tttt,nnn) - start a ramp at ssss, loop() takes the remaining steps */
+void startRamp (const char *data) {
+  char *end;
+  long start = strtol(&data[1], &end, 10);                                              // Parse comma separated values after the 'r'
+  long stop = (*end == ',') ? strtol(end + 1, &end, 10) : -1;                           // |
+  long interval = (*end == ',') ? strtol(end + 1, &end, 10) : -1;                       // |
+  long step = (*end == ',') ? strtol(end + 1, &end, 10) : 1;                            // |_______________________________________
+  if (start < 0 || start > 1000 || stop < 0 || stop > 1000 || step < 1 || step > 1000 ||
+      interval < RAMP_INTERVAL_MIN || interval > RAMP_INTERVAL_MAX) {                   // Check that the ramp is valid
+    Serial.println(F("Invalid ramp"));                                                    // Error for user information
+    return;
+  }
+  rampValue = start;                                                                    // Store ramp settings
+  rampStop = stop;                                                                      // |
+  rampStep = (stop < start) ? -step : step;                                             // |
+  rampIntervalMs = interval;                                                            // |
+  rampStartTime = millis();                                                             // |
+  rampSteps = 0;                                                                        // |_______________________________________
+  rampActive = (start != stop);                                                         // Nothing more to do if start is stop
+  setSerialDuty(start);                                                                 // First step
+  Serial.println((rampActive ? "Ramp " : "Ramp complete ") + String(rampValue));        // Report progress
+}
 
 /* Serial Processing (Execute Stored Commands) */
 void process_data (const char *data) {
   int index = 0;                                                                        // Index number for stored data
   volatile static int pulsetime = 200;                                                  // Set pulse length for triggering the camera
+  if (rampActive && data[0] != 'h' && data[0] != 0) {                                   // Any new command takes over from a running ramp
+    rampActive = false;                                                                   // |
+    Serial.println("Ramp stopped " + String(serialDuty));                                 // |_______________________________________
+  }
+  if (data[0] == 'r') {                                                                 // RAMP, the whole line is the ramp command
+    startRamp(data);                                                                      //
+    return;                                                                               //
+  }
   for (index = 0; isPrintable(data[index]); index++) {                                  // While data is readable, check the command
     switch (data[index]) {                                                                // Switch each array index
       case '0' ... '9':                                                                     // Ignore numbers
@@ -74,14 +124,15 @@ void process_data (const char *data) {
         break;
       case 'h':                                                                             // HELP COMMANDS
         Serial.print("\nMaximum command length = ");                                          // Warning for maximum input length
-        Serial.println(MAX_INPUT);
+        Serial.println(MAX_INPUT - 1);
         Serial.println(F("\nHere are the valid commands for use with this equipment:\n"
                          "h \t- Lists commands for use with this system\n"
                          "s \t- Puts shaker in serial control.\n"
                          "m \t- Puts shaker in manual control. (Default) \n"
                          "p \t- Sets the pulse length in milliseconds for the 'i' command.\n"
                          "dxxxx \t- Sets the duty cycle of the shaker, where 'xxxx' is a number between 0-1000\n"
-                         "ixxxx \t- Initialises the system. Turns on the camera and sets the duty cycle, where 'xxxx' is a number between 0-1000\n"));
+                         "ixxxx \t- Initialises the system. Turns on the camera and sets the duty cycle, where 'xxxx' is a number between 0-1000\n"
+                         "rssss,eeee,tttt,nnn \t- Ramps the duty cycle from ssss to eeee in steps of nnn every tttt ms. Any other command except h stops the ramp\n"));
         break;
       case 's':                                                                             // CHANGE to serial control
         control = true;                                                                   
@@ -112,7 +163,7 @@ void processIncomingByte (const byte inByte) {
     case '\n':                                                                              // Process data when new line read
       if (dataCorrupt) {                                                                      // Check if data is corrupt
         Serial.print("\nBuffer overflow. Please enter ");                                       // Print error
-        Serial.print(String(MAX_INPUT));                                                        // |
+        Serial.print(String(MAX_INPUT - 1));                                                    // |
         Serial.println(" characters maximum.\n");                                               // |_________________
         dataCorrupt = false;                                                                    // Reset corrupt flag
       }
@@ -124,7 +175,7 @@ void processIncomingByte (const byte inByte) {
     case '\r':                                                                            // Ignore carriage return
       break;
     default:                                                                              // Default operation adds data to buffer if it hasn't overflowed
-      if (index <= (MAX_INPUT - 1)) {                                                       // Check pointer hasn't moved past the size of the array
+      if (index < (MAX_INPUT - 1)) {                                                        // Check pointer leaves room for the terminating 0
         serialBuffer[index++] = inByte;                                                       // Move the byte to the array
       }
       else if(!dataCorrupt) {                                                               // Verify the dataCorrupt flag isn't currently set and the index isn't in range
@@ -263,6 +314,17 @@ void loop() {
     ADCSRA |= bit (ADSC) | bit (ADIE);                                              // Start Conversion and Enable Interrupt
   }
   
+  if (rampActive && millis() - rampStartTime >= (rampSteps + 1) * rampIntervalMs) {  // Take the next ramp step when it is due, timed from the start so steps don't drift
+    rampSteps++;                                                                    // |
+    rampValue += rampStep;                                                          // |
+    if ((rampStep > 0 && rampValue >= rampStop) || (rampStep < 0 && rampValue <= rampStop)) {  // Last step lands exactly on the stop value
+      rampValue = rampStop;                                                           // |
+      rampActive = false;                                                             // |
+    }                                                                               // |
+    setSerialDuty(rampValue);                                                       // |
+    Serial.println((rampActive ? "Ramp " : "Ramp complete ") + String(rampValue));  // |_______________________________________
+  }
+
   if (Serial.available() > 0) {                                                   // Check for serial data
     mainMenu();                                                                     // Reset the LCD
     processIncomingByte(Serial.read());                                             // Read the incoming character and process it into the incoming buffer
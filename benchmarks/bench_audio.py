@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+from shaker.audio_duty import frame_frequency
+
+AUDIO_RATE = 48000
+
+
+def stepped_tone(seconds):
+    """Tone stepping through duty cycles every second as written by the shaker into the camera audio"""
+    duty = 400 + np.arange(seconds) % 300
+    freqs = 1000 + 15 * np.repeat(duty, AUDIO_RATE)
+    wave = np.sin(2 * np.pi * np.cumsum(freqs) / AUDIO_RATE) + \
+        0.01 * np.random.default_rng(0).normal(size=len(freqs))
+    return wave, duty
+
+
+@pytest.mark.parametrize('seconds', [10, 30])
+def test_frame_frequency(benchmark, seconds):
+    """Stepped tone at 50 fps"""
+    frames = 50 * seconds
+    wave, duty = stepped_tone(seconds)
+
+    result = benchmark(frame_frequency, wave, frames, AUDIO_RATE)
+    assert len(result) == frames
+    np.testing.assert_allclose(result[25::50], 1000 + 15 * duty, atol=2)
+
+
+def test_frame_frequency_long(benchmark):
+    """10 minute video at 50 fps. The frames are transformed in batches so memory stays bounded."""
+    seconds = 600
+    frames = 50 * seconds
+    wave, duty = stepped_tone(seconds)
+
+    result = benchmark.pedantic(frame_frequency, args=(wave, frames, AUDIO_RATE), rounds=1, iterations=1)
+    assert len(result) == frames
+    np.testing.assert_allclose(result[25::50], 1000 + 15 * duty, atol=2)
@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('skopt')
+pytest.importorskip('labvision')
+import labvision.images
+
+from shaker import settings
+from shaker.balance import Balancer
+from shaker.centre_mass import com_balls
+from shaker.simulation import SimulatedRig
+from conftest import FakeDisplayer, hexagon
+
+N_CALLS = 20
+LEVEL = (120, -80)
+
+
+@pytest.mark.parametrize('iterations', [1, 3])
+def test_level(benchmark, settings_dir, no_sleep, monkeypatch, iterations):
+    """End to end levelling of a simulated rig. Records how close to level the optimiser finishes for
+    different numbers of measurements per evaluation."""
+    monkeypatch.setattr(labvision.images, 'Displayer', FakeDisplayer)
+    boundary_pts = hexagon(480, 640)
+    rig = SimulatedRig(boundary_pts, level=LEVEL, seed=0)
+    settings.update_settings_file(motor_pos='0,0', motor_limits=[(-400, 400), (-400, 400)],
+                                  motor_pts=[(200, 100), (450, 100), (450, 350), (200, 350)],
+                                  boundary_pts=(boundary_pts, *rig.centre))
+
+    def level():
+        rig.motors.movexy(0, 0)
+        balancer = Balancer(rig.shaker, rig.camera, rig.motors, measure_fn=com_balls)
+        return balancer.level(iterations=iterations, ncalls=N_CALLS)
+
+    result = benchmark.pedantic(level, rounds=1, iterations=1)
+    benchmark.extra_info['cost'] = float(result.fun)
+    benchmark.extra_info['distance_from_level'] = float(np.hypot(result.x[0] - LEVEL[0], result.x[1] - LEVEL[1]))
+    assert len(result.func_vals) == N_CALLS
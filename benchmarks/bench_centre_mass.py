@@ -0,0 +1,25 @@
+import pytest
+
+from shaker.centre_mass import find_com
+from shaker.settings import SETTINGS_com_balls, SETTINGS_com_bubble
+from conftest import RESOLUTIONS, hexagon, tray_image
+
+
+@pytest.mark.parametrize('resolution', RESOLUTIONS)
+def test_find_com(benchmark, resolution):
+    height, width = RESOLUTIONS[resolution]
+    bw_img = tray_image(height, width)[:, :, 0] < 100
+    x, y = benchmark(find_com, bw_img)
+    assert abs(x - width / 2) < 0.05 * width
+    assert abs(y - height / 2) < 0.05 * height
+
+
+@pytest.mark.parametrize('resolution', RESOLUTIONS)
+@pytest.mark.parametrize('com_settings, particles', [(SETTINGS_com_balls, 'balls'), (SETTINGS_com_bubble, 'bubbles')],
+                         ids=['com_balls', 'com_bubble'])
+def test_com_img_fn(benchmark, no_sleep, resolution, com_settings, particles):
+    pytest.importorskip('labvision')
+    height, width = RESOLUTIONS[resolution]
+    img = tray_image(height, width, particles=particles)
+    img_processing = com_settings['img_processing']
+    benchmark(img_processing['img_fn'], img, hexagon(height, width), img_settings=img_processing)
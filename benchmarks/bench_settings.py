@@ -0,0 +1,13 @@
+from shaker import settings
+
+
+def test_update_settings_file_read(benchmark, settings_dir):
+    settings.update_settings_file(motor_pos='0,0')
+    result = benchmark(settings.update_settings_file)
+    assert result['motor_pos'] == '0,0'
+
+
+def test_update_settings_file_write(benchmark, settings_dir):
+    result = benchmark(settings.update_settings_file, motor_pos='10,-20',
+                       motor_limits=[(-400, 400), (-400, 400)])
+    assert settings.update_settings_file()['motor_pos'] == result['motor_pos'] == '10,-20'
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('labequipment')
+from shaker import shaker as shaker_module
+from conftest import EmulatedPort
+
+RATE = 100
+N_VALUES = 100
+
+
+@pytest.fixture(scope='module')
+def emulated_shaker():
+    port = EmulatedPort()
+    original = shaker_module.Arduino
+    shaker_module.Arduino = lambda *args: port
+    try:
+        # above RATE so that every value of the sequence is sent
+        yield shaker_module.Shaker(max_rate=2 * RATE), port
+    finally:
+        shaker_module.Arduino = original
+
+
+def test_sequence_timing(benchmark, emulated_shaker):
+    """Duration of a 1 s sequence and how far each duty change is from its scheduled time"""
+    shaker, port = emulated_shaker
+    values = 600 - np.arange(N_VALUES)
+
+    def run():
+        port.sent = []
+        shaker.sequence(values, RATE)
+        return port.sent
+
+    sent = benchmark.pedantic(run, rounds=3, iterations=1)
+    times = np.array([t for t, _ in sent[:N_VALUES]])
+    errors = times - times[0] - np.arange(N_VALUES) / RATE
+    benchmark.extra_info['max_timing_error'] = float(np.max(np.abs(errors)))
+    benchmark.extra_info['mean_timing_error'] = float(np.mean(np.abs(errors)))
+    assert [line for _, line in sent[:N_VALUES]] == ['d{:03}'.format(v) for v in values]
+    assert np.max(np.abs(errors)) < 0.01
@@ -0,0 +1,66 @@
+import os
+import types
+import time
+
+import numpy as np
+import pytest
+
+from shaker.simulation import SimulatedRig
+# bench_balance imports FakeDisplayer from here
+from tests.conftest import FakeDisplayer  # noqa: F401
+
+os.environ.setdefault('MPLBACKEND', 'Agg')
+
+RESOLUTIONS = {'480p': (480, 640), '1080p': (1080, 1920), '2160p': (2160, 3840)}
+
+
+def hexagon(height, width):
+    """Boundary polygon filling most of an image of the given size"""
+    cx, cy, r = width / 2, height / 2, 0.45 * height
+    angles = np.arange(6) * np.pi / 3
+    return tuple((int(cx + r * np.cos(a)), int(cy + r * np.sin(a))) for a in angles)
+
+
+def tray_image(height, width, particles='balls', seed=0):
+    """Frame of a level tray of particles inside the hexagonal boundary"""
+    rig = SimulatedRig(hexagon(height, width), particles=particles, n_particles=400,
+                       radius=int(height / 60), img_shape=(height, width), seed=seed)
+    return rig.camera.get_frame()
+
+
+@pytest.fixture
+def no_sleep(monkeypatch):
+    """Remove the fixed sleeps in centre_mass and balance"""
+    from shaker import balance, centre_mass
+    fake_time = types.SimpleNamespace(sleep=lambda t: None, time=time.time)
+    monkeypatch.setattr(centre_mass, 'time', fake_time)
+    monkeypatch.setattr(balance, 'time', fake_time)
+
+
+@pytest.fixture
+def settings_dir(tmp_path, monkeypatch):
+    """Settings and levelling files written to tmp_path"""
+    from shaker import settings
+    monkeypatch.setattr(settings, 'SETTINGS_PATH', str(tmp_path) + '/')
+    return tmp_path
+
+
+class EmulatedPort:
+    """Stands in for the shaker Arduino. Records the time each line is sent and takes latency seconds per line."""
+
+    def __init__(self, *args, latency=0.0005):
+        self.latency = latency
+        self.sent = []
+
+    def send_serial_line(self, line):
+        self.sent.append((time.time(), line))
+        time.sleep(self.latency)
+
+    def read_serial_line(self):
+        return 'Serial control enabled.'
+
+    def read_all(self):
+        return ''
+
+    def quit_serial(self):
+        pass
@@ -21,6 +21,7 @@ setuptools.setup(
         'pywin32',
         'numpy',
         'pandas',
+        'tables',
         'matplotlib',
         'scipy',
         'typing',
@@ -28,6 +29,9 @@ setuptools.setup(
         'labequipment @ git+https://github.com/MikeSmithLabTeam/labequipment',
         'skopt @ git+https://github.com/MikeSmithLabTeam/skopt',
     ],
+    extras_require={
+        'benchmark': ['pytest', 'pytest-benchmark'],
+    },
     test_suite='nose.collector',
     tests_require=['nose'],
     include_package_data=True,
@@ -0,0 +1,206 @@
+import threading
+import time
+import numpy as np
+
+from labequipment.arduino import Arduino
+from .settings import rig_settings
+from .serial_monitor import instrument
+
+
+class RingBuffer:
+    """Fixed size numpy buffer that keeps the most recent rows appended to it"""
+
+    def __init__(self, size: int, columns: int = 2):
+        self.data = np.zeros((size, columns))
+        self.size = size
+        self.count = 0
+
+    def append(self, row):
+        self.data[self.count % self.size] = row
+        self.count += 1
+
+    def get(self):
+        """Return a copy of the stored rows in the order they were appended"""
+        if self.count <= self.size:
+            return self.data[:self.count].copy()
+        start = self.count % self.size
+        return np.concatenate((self.data[start:], self.data[:start]))
+
+
+class AccelerometerReader:
+    """AccelerometerReader continuously reads the accelerometer attached to the shaker in a background thread.
+
+    Every line sent by the accelerometer Arduino is parsed and the peak z-acceleration (Γ), the last
+    comma separated value on the line, is stored with the time it was received in a ring buffer. Queries
+    are answered from the buffer so they return immediately without waiting on the serial port.
+
+    Events such as duty cycle changes can be added with mark so that they can be saved with the stream.
+
+    If the port raises anything other than a malformed line the reader stops and keeps the exception in error.
+    From then on every query and wait raises it, so a lost accelerometer is never mistaken for stale data.
+
+    ----Example Usage: ----
+
+    with Shaker() as shaker, AccelerometerReader() as acc:
+        shaker.set_duty(500)
+        acc.mark('duty', 500)
+        time.sleep(5)
+        gamma = acc.mean(2)     # mean over last 2 seconds
+        acc.save('acceleration_stream.csv')
+    """
+
+    def __init__(self, ard=None, buffer_size: int = 100000, rig=None):
+        """
+        ard : optional instance of Arduino. If not supplied the port in ACCELEROMETER_SHAKER is opened
+        and closed again by quit. The link statistics are recorded by serial_monitor.
+        buffer_size : number of samples kept.
+        rig : name in RIGS in settings whose ACCELEROMETER_SHAKER port is opened.
+        """
+        self._own_ard = ard is None
+        if ard is None:
+            ard = Arduino(rig_settings(rig)['ACCELEROMETER_SHAKER'])
+        self.ard = instrument(ard, 'accelerometer' if rig is None else rig + '.accelerometer')
+        self.buffer = RingBuffer(buffer_size)
+        self.events = []
+        # Exception that stopped the reader thread
+        self.error = None
+        self._lock = threading.Lock()
+        self._new_sample = threading.Condition(self._lock)
+        self._running = True
+        self._thread = threading.Thread(target=self._read, daemon=True)
+        self._thread.start()
+
+    def _read(self):
+        while self._running:
+            try:
+                line = self.ard.read_serial_line()
+                peak_z = float(line.split(',')[-1])
+            except (ValueError, AttributeError, IndexError):
+                # Partial, empty or malformed lines are skipped
+                continue
+            except Exception as error:
+                if self._running:
+                    with self._lock:
+                        self.error = error
+                        # wake up waits so that they raise it
+                        self._new_sample.notify_all()
+                break
+            with self._lock:
+                self.buffer.append((time.time(), peak_z))
+                self._new_sample.notify_all()
+
+    def samples(self, since: float = None, until: float = None):
+        """Times and Γ values of samples received between since and until (time.time() values)
+
+        Returns
+        -------
+        times, values as numpy arrays
+        """
+        with self._lock:
+            self._check()
+            data = self.buffer.get()
+        keep = np.ones(len(data), dtype=bool)
+        if since is not None:
+            keep &= data[:, 0] >= since
+        if until is not None:
+            keep &= data[:, 0] <= until
+        return data[keep, 0], data[keep, 1]
+
+    def last(self, seconds: float):
+        """Times and Γ values of samples received in the last seconds"""
+        return self.samples(since=time.time() - seconds)
+
+    def mean(self, seconds: float):
+        """Mean peak Γ over the last seconds. Returns nan if there are no samples."""
+        _, values = self.last(seconds)
+        return np.mean(values) if len(values) else np.nan
+
+    def latest(self):
+        """Time and Γ of most recent sample or (nan, nan)"""
+        with self._lock:
+            self._check()
+            if self.buffer.count == 0:
+                return np.nan, np.nan
+            t, value = self.buffer.data[(self.buffer.count - 1) % self.buffer.size]
+        return t, value
+
+    def wait_for_samples(self, n: int, since: float, timeout: float = 10):
+        """Block until at least n samples have been received since time since, or timeout seconds elapse.
+        Returns times, values of the samples since since."""
+        deadline = time.time() + timeout
+        times, values = self.samples(since=since)
+        while len(values) < n and time.time() < deadline:
+            with self._lock:
+                self._new_sample.wait(timeout=deadline - time.time())
+            times, values = self.samples(since=since)
+        return times, values
+
+    def wait_until_settled(self, since: float, window: float = 1.0, tolerance: float = 0.02, timeout: float = 10):
+        """Block until the readings received after since are stationary.
+
+        The readings are stationary when the means of the last two windows of samples differ by less than
+        tolerance and the standard error of the mean of the last window is less than tolerance.
+
+        Args:
+            since (float): time (time.time()) of the change, e.g. the duty change. Earlier samples are ignored.
+            window (float, optional): length of each averaging window in seconds. Defaults to 1.0.
+            tolerance (float, optional): tolerance in Γ. Defaults to 0.02.
+            timeout (float, optional): maximum time to wait after since. Defaults to 10.
+
+        Returns:
+            mean, uncertainty, settle_time, settled: mean Γ and its standard error over the last window, time
+            after since at which the steady readings began and whether the readings settled before timeout.
+        """
+        settled = False
+        while True:
+            times, values = self.samples(since=since)
+            t_end = times[-1] if len(times) else since
+            current = values[times > t_end - window]
+            previous = values[(times > t_end - 2 * window) & (times <= t_end - window)]
+            if len(current) > 1 and len(previous) > 1 and t_end - since >= 2 * window:
+                uncertainty = np.std(current) / np.sqrt(len(current))
+                settled = (abs(np.mean(current) - np.mean(previous)) < tolerance) and (uncertainty < tolerance)
+            if settled or time.time() - since > timeout:
+                break
+            self.wait_for_samples(len(values) + 1, since=since, timeout=max(since + timeout - time.time(), 0))
+
+        if len(current) == 0:
+            return np.nan, np.nan, np.nan, False
+        uncertainty = np.std(current) / np.sqrt(len(current))
+        return np.mean(current), uncertainty, max(t_end - window - since, 0), settled
+
+    def _check(self):
+        """Raise the exception that stopped the reader. Call with the lock held."""
+        if self.error is not None:
+            raise self.error
+
+    def mark(self, label: str, value=None):
+        """Record an event (e.g. a duty change) at the current time"""
+        t = time.time()
+        with self._lock:
+            self.events.append((t, label, value))
+        return t
+
+    def save(self, filename: str):
+        """Save the buffered stream as csv (time, peak_z) and the events to filename with _events appended"""
+        with self._lock:
+            data = self.buffer.get()
+            events = list(self.events)
+        np.savetxt(filename, data, delimiter=',', header='time,peak_z', comments='')
+        root, ext = filename.rsplit('.', 1) if '.' in filename else (filename, 'csv')
+        with open(root + '_events.' + ext, 'w') as f:
+            f.write('time,label,value\n')
+            for t, label, value in events:
+                f.write('{},{},{}\n'.format(t, label, value))
+
+    def quit(self):
+        self._running = False
+        self._thread.join(timeout=2)
+        if self._own_ard:
+            self.ard.quit_serial()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.quit()
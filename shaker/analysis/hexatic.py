@@ -0,0 +1,116 @@
+import numpy as np
+
+'''
+Local hexatic order parameter calculated directly from particle positions.
+
+    psi6_j = 1/N sum_k exp(6 i theta_jk)
+
+where the sum is over the N nearest neighbours k of particle j and theta_jk is the angle of the
+bond between them. All particles in all frames are processed together: the frame number is
+added as a third coordinate, scaled so that particles in different frames are always further
+apart than any two particles in the same frame, and a single KD-tree query finds the neighbours
+of every particle.
+
+The boundary polygon is the one stored in the settings file:
+
+    pts, cx, cy = update_settings_file()['boundary_pts']
+
+Particles outside the boundary, or closer to it than their furthest neighbour, do not have a
+complete shell of neighbours and are given an order of nan.
+'''
+
+
+def local_hexatic(x, y, frames=None, boundary_pts=None, n_neighbours=6):
+    """Complex local hexatic order of every particle
+
+    Args:
+        x (array): x coordinates of particles
+        y (array): y coordinates of particles
+        frames (array, optional): frame number of each particle. Defaults to None (all in one frame).
+        boundary_pts (list of (x, y), optional): boundary polygon. Defaults to None which does no clipping.
+        n_neighbours (int, optional): number of nearest neighbours. Defaults to 6.
+
+    Returns:
+        complex array of psi6 with nan for particles without a complete set of neighbours
+    """
+    from scipy.spatial import cKDTree
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    frames = np.zeros(len(x)) if frames is None else np.asarray(frames, dtype=float)
+    psi6 = np.full(len(x), np.nan, dtype=complex)
+    if len(x) == 0:
+        return psi6
+
+    # Separate frames by more than the largest distance within a frame
+    separation = 2 * (np.ptp(x) + np.ptp(y)) + 1
+    tree = cKDTree(np.stack((x, y, frames * separation), axis=1))
+    k = min(n_neighbours + 1, len(x))
+    dist, nbrs = tree.query(tree.data, k=k, workers=-1)
+    dist, nbrs = dist[:, 1:], nbrs[:, 1:]
+
+    dx = x[nbrs] - x[:, None]
+    dy = y[nbrs] - y[:, None]
+    psi6 = np.mean(np.exp(6j * np.arctan2(dy, dx)), axis=1)
+
+    complete = (k == n_neighbours + 1) & np.all(frames[nbrs] == frames[:, None], axis=1)
+    if boundary_pts is not None:
+        inside = inside_polygon(x, y, boundary_pts)
+        complete &= inside & (distance_to_polygon(x, y, boundary_pts) > dist[:, -1])
+    psi6[~complete] = np.nan
+    return psi6
+
+
+def hexatic_order(dataframe, boundary_pts=None, n_neighbours=6):
+    """Add hexatic_order and hexatic_order_abs columns to a tracking dataframe indexed by frame
+
+    The dataframe must have x and y columns. Returns a copy of the dataframe.
+    """
+    psi6 = local_hexatic(dataframe['x'].to_numpy(), dataframe['y'].to_numpy(),
+                         frames=dataframe.index.to_numpy(), boundary_pts=boundary_pts,
+                         n_neighbours=n_neighbours)
+    dataframe = dataframe.copy()
+    dataframe['hexatic_order'] = psi6
+    dataframe['hexatic_order_abs'] = np.abs(psi6)
+    return dataframe
+
+
+def image_order(bw_img, boundary_pts=None, n_neighbours=6):
+    """Global hexatic order, the mean |psi6|, of the particles in a thresholded image
+
+    Particles are the connected regions of bw_img and are located at their centres. Touching particles merge into
+    one region, so this is a quick proxy for the order while an experiment runs rather than a replacement for
+    the tracking software. Returns nan if no particle has a complete set of neighbours.
+    """
+    from scipy import ndimage
+
+    labels, n = ndimage.label(bw_img)
+    if n == 0:
+        return np.nan
+    y, x = np.array(ndimage.center_of_mass(bw_img, labels, np.arange(1, n + 1))).T
+    order = np.abs(local_hexatic(x, y, boundary_pts=boundary_pts, n_neighbours=n_neighbours))
+    return np.nanmean(order) if np.any(~np.isnan(order)) else np.nan
+
+
+def inside_polygon(x, y, pts):
+    """True for points (x, y) inside the polygon with vertices pts. Vectorised ray casting."""
+    pts = np.asarray([[pt[0], pt[1]] for pt in pts], dtype=float)
+    x0, y0 = pts[:, 0], pts[:, 1]
+    x1, y1 = np.roll(x0, -1), np.roll(y0, -1)
+    x = np.asarray(x, dtype=float)[:, None]
+    y = np.asarray(y, dtype=float)[:, None]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        crosses = ((y0 > y) != (y1 > y)) & (x < (x1 - x0) * (y - y0) / (y1 - y0) + x0)
+    return np.count_nonzero(crosses, axis=1) % 2 == 1
+
+
+def distance_to_polygon(x, y, pts):
+    """Shortest distance from points (x, y) to the edges of the polygon with vertices pts"""
+    pts = np.asarray([[pt[0], pt[1]] for pt in pts], dtype=float)
+    start = pts
+    edge = np.roll(pts, -1, axis=0) - pts
+    points = np.stack((np.asarray(x, dtype=float), np.asarray(y, dtype=float)), axis=1)
+    rel = points[:, None, :] - start[None, :, :]
+    t = np.clip(np.sum(rel * edge, axis=2) / np.sum(edge * edge, axis=1), 0, 1)
+    nearest = start[None, :, :] + t[:, :, None] * edge[None, :, :]
+    return np.min(np.linalg.norm(points[:, None, :] - nearest, axis=2), axis=1)
@@ -0,0 +1,79 @@
+import os
+import json
+
+'''
+A dataset manifest records which input files (raw videos, .hdf5 tracking files, acceleration logs)
+fed each derived product, together with a fingerprint of each input. When the analysis is rerun
+only products whose inputs have been added, removed or modified need to be recomputed.
+
+The manifest is stored as a json file:
+
+    {
+        "product name": {
+            "inputs": {"relative/path/to/input": [size, mtime_ns], ...},
+            "result": ...
+        }
+    }
+
+Small results (e.g. the global order parameter and duty cycle of a video) can be stored in the
+manifest itself so that they can be reused without touching the inputs again.
+'''
+
+
+def fingerprint(filepath):
+    """Cheap fingerprint of a file from its size and modification time. Does not read the file so
+    is independent of file size."""
+    stat = os.stat(filepath)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+class Manifest:
+    def __init__(self, filepath):
+        """Manifest records the inputs of each derived product in a dataset
+
+        filepath : path to json file in which manifest is stored. Input paths are stored relative to
+        the folder containing this file so the dataset can be moved.
+        """
+        self.filepath = filepath
+        self.root = os.path.dirname(os.path.abspath(filepath))
+        try:
+            with open(filepath) as f:
+                self.products = json.loads(f.read())
+        except FileNotFoundError:
+            self.products = {}
+
+    def relpath(self, filepath):
+        try:
+            return os.path.relpath(os.path.abspath(filepath), self.root).replace('\\', '/')
+        except ValueError:
+            # Different drive on windows
+            return os.path.abspath(filepath).replace('\\', '/')
+
+    def fingerprints(self, inputs):
+        return {self.relpath(filepath): fingerprint(filepath) for filepath in inputs}
+
+    def is_stale(self, product, inputs, outputs=()):
+        """Returns True if product needs to be recomputed because it has not been made, one of its
+        output files is missing or the set of inputs or their fingerprints have changed"""
+        if product not in self.products:
+            return True
+        if not all(os.path.exists(output) for output in outputs):
+            return True
+        return self.products[product]['inputs'] != self.fingerprints(inputs)
+
+    def record(self, product, inputs, result=None):
+        """Store the fingerprints of the inputs used to make product and optionally its result"""
+        self.products[product] = {'inputs': self.fingerprints(inputs),
+                                  'result': result}
+
+    def result(self, product):
+        return self.products[product]['result']
+
+    def remove(self, product):
+        self.products.pop(product, None)
+
+    def save(self):
+        tmp_filepath = self.filepath + '.tmp'
+        with open(tmp_filepath, 'w') as f:
+            f.write(json.dumps(self.products, indent=1))
+        os.replace(tmp_filepath, self.filepath)
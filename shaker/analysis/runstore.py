@@ -0,0 +1,228 @@
+import os
+import warnings
+import numpy as np
+
+'''
+Columnar store of phase diagram measurements.
+
+Every row is one duty step of one run at one area fraction and holds the columns in COLUMNS.
+The store is saved as a single .npz file so the whole phase diagram can be loaded and aggregated
+with a handful of vectorised numpy operations, whatever the number of area fractions and repeats.
+
+Runs are averaged step by step by default, which assumes every run at an area fraction visited the same duty
+cycles in the same order. Runs from adaptive sweeps visit different duty cycles in different orders and are
+aggregated with by='duty', which averages the rows at the same (rounded) duty cycle instead.
+'''
+
+COLUMNS = ('area_fraction', 'run', 'step', 'duty', 'gamma', 'order')
+
+
+class RunStore:
+    def __init__(self, filepath=None):
+        """RunStore holds one row per (area fraction, run, duty step)
+
+        filepath : .npz file the store is loaded from and saved to. If the file doesn't exist the store starts empty.
+        """
+        self.filepath = filepath
+        if filepath is not None and os.path.exists(filepath):
+            with np.load(filepath) as data:
+                self.data = {column: data[column] for column in COLUMNS}
+        else:
+            self.data = {column: np.zeros(0, dtype=int if column in ('run', 'step') else float)
+                         for column in COLUMNS}
+
+    def __len__(self):
+        return np.size(self.data['run'])
+
+    def __getitem__(self, column):
+        return self.data[column]
+
+    def add_run(self, area_fraction, run, duty, gamma, order):
+        """Add the measurements of one run, replacing any previous measurements of that run.
+        duty, gamma and order are sequences with one value per duty step in the order they were measured."""
+        duty, gamma, order = np.broadcast_arrays(np.asarray(duty, dtype=float),
+                                                 np.asarray(gamma, dtype=float),
+                                                 np.asarray(order, dtype=float))
+        self.remove_run(area_fraction, run)
+        n = np.size(duty)
+        new = {'area_fraction': np.full(n, area_fraction, dtype=float),
+               'run': np.full(n, run, dtype=int),
+               'step': np.arange(n),
+               'duty': duty,
+               'gamma': gamma,
+               'order': order}
+        self.data = {column: np.concatenate((self.data[column], new[column])) for column in COLUMNS}
+
+    def remove_run(self, area_fraction, run):
+        keep = ~((self.data['area_fraction'] == area_fraction) & (self.data['run'] == run))
+        self.data = {column: values[keep] for column, values in self.data.items()}
+
+    def save(self, filepath=None):
+        filepath = self.filepath if filepath is None else filepath
+        tmp_filepath = filepath + '.tmp.npz'
+        np.savez(tmp_filepath, **self.data)
+        os.replace(tmp_filepath, filepath)
+
+    def _columns(self, min_step, by):
+        """Rows with step >= min_step and the column of each in the curves of its area fraction"""
+        selected = self.data['step'] >= min_step
+        if by == 'step':
+            return selected, self.data['step'][selected] - min_step
+        if by != 'duty':
+            raise ValueError("by must be 'step' or 'duty', not " + repr(by))
+        # Rows at the same duty share a column. Columns are in decreasing duty as in a cooling sweep.
+        keys = np.stack((self.data['area_fraction'][selected], -np.round(self.data['duty'][selected])), axis=1)
+        groups, inverse = np.unique(keys, axis=0, return_inverse=True)
+        first = np.searchsorted(groups[:, 0], groups[:, 0])
+        return selected, (np.arange(len(groups)) - first)[inverse.ravel()]
+
+    def aggregate(self, min_step=0, by='step'):
+        """Mean and standard deviation of duty, gamma and order over all runs at each (area fraction, step)
+
+        min_step : steps below this are excluded. The first step of each run is taken straight after the ramp
+        from the starting duty and is often discarded.
+        by : 'step' averages the runs step by step. 'duty' averages the rows at the same duty cycle, rounded to an
+        integer; step is then the position of the duty cycle in decreasing order, counted from min_step.
+
+        Returns a dict of 1D arrays sorted by area fraction then step with keys
+        area_fraction, step, n, duty_mean, duty_std, gamma_mean, gamma_std, order_mean, order_std
+        """
+        selected, col = self._columns(min_step, by)
+        keys = np.stack((self.data['area_fraction'][selected], col), axis=1)
+        groups, inverse = np.unique(keys, axis=0, return_inverse=True)
+        inverse = inverse.ravel()
+        n = np.bincount(inverse, minlength=len(groups))
+
+        result = {'area_fraction': groups[:, 0], 'step': groups[:, 1].astype(int) + min_step, 'n': n}
+        for column in ('duty', 'gamma', 'order'):
+            values = self.data[column][selected]
+            mean = np.bincount(inverse, weights=values, minlength=len(groups)) / n
+            var = np.bincount(inverse, weights=(values - mean[inverse])**2,
+                              minlength=len(groups)) / n
+            result[column + '_mean'] = mean
+            result[column + '_std'] = np.sqrt(var)
+        return result
+
+    def curves(self, min_step=0, by='step'):
+        """Aggregated curves as 2D arrays with one row per area fraction, padded with nan
+
+        Returns area_fractions (n_af,) and a dict of (n_af, max_steps) arrays with the same keys as aggregate.
+        """
+        agg = self.aggregate(min_step=min_step, by=by)
+        area_fractions, row = np.unique(agg['area_fraction'], return_inverse=True)
+        col = agg['step'] - min_step
+        shape = (len(area_fractions), col.max() + 1 if len(col) else 0)
+        curves = {}
+        for key, values in agg.items():
+            if key in ('area_fraction', 'step'):
+                continue
+            curve = np.full(shape, np.nan)
+            curve[row, col] = values
+            curves[key] = curve
+        return area_fractions, curves
+
+    def transitions(self, min_step=0, by='step'):
+        """Gamma at which the mean order parameter crosses the middle of its range for every area fraction
+
+        Returns area_fractions, gamma_transition, order_mid as 1D arrays. gamma_transition is nan if
+        the mean curve does not cross its midpoint.
+        """
+        area_fractions, curves = self.curves(min_step=min_step, by=by)
+        gamma_transition, order_mid = mid_crossing(
+            curves['gamma_mean'], curves['order_mean'])
+        return area_fractions, gamma_transition, order_mid
+
+    def runs(self, min_step=0, by='step'):
+        """Measurements of every run as 3D arrays with shape (n_af, max_runs, max_steps), padded with nan
+
+        by is as for aggregate.
+        Returns area_fractions (n_af,), n_runs (n_af,) and a dict with keys duty, gamma and order
+        """
+        selected, col = self._columns(min_step, by)
+        area_fractions, row = np.unique(self.data['area_fraction'][selected], return_inverse=True)
+        runs = np.stack((row, self.data['run'][selected]), axis=1)
+        unique_runs, run_index = np.unique(runs, axis=0, return_inverse=True)
+        # position of each run within its area fraction
+        first = np.searchsorted(unique_runs[:, 0], unique_runs[:, 0])
+        slot = (np.arange(len(unique_runs)) - first)[run_index.ravel()]
+        n_runs = np.bincount(unique_runs[:, 0], minlength=len(area_fractions))
+
+        shape = (len(area_fractions), n_runs.max() if len(n_runs) else 0, col.max() + 1 if len(col) else 0)
+        result = {}
+        for column in ('duty', 'gamma', 'order'):
+            values = np.full(shape, np.nan)
+            values[row, slot, col] = self.data[column][selected]
+            result[column] = values
+        return area_fractions, n_runs, result
+
+    def bootstrap_transitions(self, n_boot=2000, confidence=0.95, min_step=0, seed=None, by='step'):
+        """Transition gamma for every area fraction with bootstrap confidence intervals
+
+        The runs at each area fraction are resampled with replacement n_boot times. The mean curve of each
+        resample and its mid-order crossing are calculated for all resamples and area fractions in one
+        vectorised operation.
+
+        Returns area_fractions, gamma_transition, lower, upper where gamma_transition is calculated
+        from all the runs and lower, upper are the percentile confidence interval from the resamples. The interval
+        need not contain gamma_transition, so lower may be above it or upper below it.
+        """
+        area_fractions, n_runs, runs = self.runs(min_step=min_step, by=by)
+        n_af, max_runs, _ = runs['gamma'].shape
+        rng = np.random.default_rng(seed)
+
+        # (n_boot, n_af, max_runs) indices of resampled runs. Slots beyond n_runs are masked out.
+        sample = np.floor(rng.random((n_boot, n_af, max_runs)) * n_runs[None, :, None]).astype(int)
+        used = np.arange(max_runs)[None, None, :] < n_runs[None, :, None]
+        af = np.arange(n_af)[None, :, None]
+
+        with np.errstate(invalid='ignore'), warnings.catch_warnings():
+            warnings.simplefilter('ignore', category=RuntimeWarning)
+            curves = {}
+            for column in ('gamma', 'order'):
+                resampled = np.where(used[..., None], runs[column][af, sample], np.nan)
+                curves[column] = np.nanmean(resampled, axis=2)
+            boot, _ = mid_crossing(curves['gamma'], curves['order'])
+            alpha = (1 - confidence) / 2
+            lower, upper = np.nanpercentile(boot, [100 * alpha, 100 * (1 - alpha)], axis=0)
+
+        _, gamma_transition, _ = self.transitions(min_step=min_step, by=by)
+        return area_fractions, gamma_transition, lower, upper
+
+
+def mid_crossing(gamma, order):
+    """Find gamma where order first crosses the middle of its range
+
+    gamma and order have shape (..., n_points) and may be padded with nan. Points are sorted by gamma along the
+    last axis and the crossing is linearly interpolated between the two points either side of the midpoint.
+    All leading dimensions (e.g. area fraction, bootstrap sample) are handled in a single vectorised pass.
+
+    Returns gamma_transition, order_mid with shape (...)
+    """
+    gamma = np.asarray(gamma, dtype=float)
+    order = np.asarray(order, dtype=float)
+    invalid = np.isnan(gamma) | np.isnan(order)
+    gamma = np.where(invalid, np.inf, gamma)
+    sort = np.argsort(gamma, axis=-1)
+    gamma = np.take_along_axis(gamma, sort, axis=-1)
+    order = np.take_along_axis(np.where(invalid, np.nan, order), sort, axis=-1)
+    valid = ~np.take_along_axis(invalid, sort, axis=-1)
+
+    with np.errstate(invalid='ignore'):
+        order_max = np.nanmax(np.where(valid, order, -np.inf), axis=-1)
+        order_min = np.nanmin(np.where(valid, order, np.inf), axis=-1)
+        order_mid = (order_max - order_min) / 2 + order_min
+
+        above = order >= order_mid[..., None]
+        cross = (above[..., :-1] != above[..., 1:]) & valid[..., :-1] & valid[..., 1:]
+        found = cross.any(axis=-1)
+        first = np.argmax(cross, axis=-1)[..., None]
+
+        g0 = np.take_along_axis(gamma, first, axis=-1)[..., 0]
+        g1 = np.take_along_axis(gamma, first + 1, axis=-1)[..., 0]
+        o0 = np.take_along_axis(order, first, axis=-1)[..., 0]
+        o1 = np.take_along_axis(order, first + 1, axis=-1)[..., 0]
+        gamma_transition = g0 + (order_mid - o0) * (g1 - g0) / (o1 - o0)
+
+    gamma_transition = np.where(found, gamma_transition, np.nan)
+    order_mid = np.where(valid.any(axis=-1), order_mid, np.nan)
+    return gamma_transition, order_mid
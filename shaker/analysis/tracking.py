@@ -0,0 +1,110 @@
+import os
+import warnings
+import numpy as np
+import pandas as pd
+
+'''
+Helpers to read the .hdf5 dataframes written by the particle tracking software.
+
+The tracking dataframes are indexed by frame number and can be several GB in size.
+When a store is written in pandas "table" format the frames and columns needed can be
+selected on disk with where= / columns= so only the data actually used is read.
+Stores written in the default "fixed" format cannot be queried and have to be read in
+full; convert_to_table converts them once so that subsequent reads are selective.
+'''
+
+
+def _get_key(store, key=None):
+    """Return the key of the dataframe in the store. If not specified the store must contain a single dataframe"""
+    if key is not None:
+        return key
+    keys = store.keys()
+    if len(keys) != 1:
+        raise ValueError(
+            "key must be specified for stores containing more than one dataframe: " + str(keys))
+    return keys[0]
+
+
+def is_table(filepath, key=None):
+    """Returns True if the dataframe in filepath is stored in queryable table format"""
+    with pd.HDFStore(filepath, mode='r') as store:
+        return store.get_storer(_get_key(store, key)).is_table
+
+
+def read_tracking(filepath, frames=None, columns=None, key=None):
+    """Read selected frames and columns from a tracking .hdf5 file
+
+    Args:
+        filepath (str): path to .hdf5 file produced by the tracking software
+        frames (int or list[int], optional): frame number(s) to read. Defaults to None which reads all frames.
+        columns (list[str], optional): columns to read. Defaults to None which reads all columns.
+        key (str, optional): key of dataframe in store. Defaults to None which uses the only dataframe in the store.
+
+    Returns:
+        pandas dataframe indexed by frame number with index name 'index'
+    """
+    if frames is not None and pd.api.types.is_scalar(frames):
+        frames = [frames]
+
+    with pd.HDFStore(filepath, mode='r') as store:
+        key = _get_key(store, key)
+        if store.get_storer(key).is_table:
+            where = None if frames is None else 'index in ' + \
+                str([int(frame) for frame in frames])
+            dataframe = store.select(key, where=where, columns=columns)
+        else:
+            warnings.warn(filepath + " is in fixed format and must be read in full. Use convert_to_table to allow selective reads.")
+            dataframe = store.select(key)
+            if frames is not None:
+                dataframe = dataframe.loc[frames]
+            if columns is not None:
+                dataframe = dataframe[columns]
+
+    dataframe.index.name = 'index'
+    return dataframe
+
+
+def convert_to_table(filepath, key=None, data_columns=None, complevel=None):
+    """Rewrite a fixed format tracking .hdf5 file in table format so that it can be read selectively
+
+    The frame index is always indexed. data_columns are additional columns that are indexed and can be
+    used in where queries. Every other dataframe in the store is copied across unchanged. The file is
+    written to a temporary file and then replaces the original.
+    Returns True if the file was converted and False if it was already in table format.
+    """
+    tmp_filepath = filepath + '.tmp'
+    with pd.HDFStore(filepath, mode='r') as store:
+        key = _get_key(store, key)
+        if store.get_storer(key).is_table:
+            return False
+        # other keys are copied one at a time so only one dataframe is in memory at once
+        with pd.HDFStore(tmp_filepath, mode='w', complevel=complevel) as tmp_store:
+            for other in store.keys():
+                if other.strip('/') == key.strip('/'):
+                    tmp_store.put(key, store.select(key), format='table', data_columns=data_columns)
+                else:
+                    tmp_store.put(other, store.select(other),
+                                  format='table' if store.get_storer(other).is_table else 'fixed')
+    os.replace(tmp_filepath, filepath)
+    return True
+
+
+def frame_order_stats(dataframe, column='hexatic_order_abs'):
+    """Global order parameter statistics of every frame in a tracking dataframe in a single pass
+
+    Particles with nan values of column (e.g. at the boundary) are ignored.
+
+    Returns a dataframe indexed by frame with columns order_mean, order_std and count
+    """
+    values = dataframe[column].to_numpy(dtype=float)
+    frames = dataframe.index.to_numpy()
+    valid = ~np.isnan(values)
+    frame_numbers, inverse = np.unique(frames[valid], return_inverse=True)
+    values = values[valid]
+
+    count = np.bincount(inverse, minlength=len(frame_numbers))
+    mean = np.bincount(inverse, weights=values, minlength=len(frame_numbers)) / count
+    var = np.bincount(inverse, weights=(values - mean[inverse])**2,
+                      minlength=len(frame_numbers)) / count
+    return pd.DataFrame({'order_mean': mean, 'order_std': np.sqrt(var), 'count': count},
+                        index=pd.Index(frame_numbers, name='frame'))
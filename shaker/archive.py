@@ -0,0 +1,314 @@
+import json
+import os
+import time
+import numpy as np
+
+'''
+Record and replay of levelling sessions.
+
+An archive is a folder containing
+
+    archive.json        frame shape, dtype, chunk size and anything passed as info (boundary, settings...)
+    events.jsonl        one json line per event: frames, duty changes, motor moves and evaluations
+    frames_00000.npy    frames in chunks of chunk_size, written and read as memory-mapped arrays
+
+Every line of events.jsonl has a type, the time it happened and the state of the rig at that time (motor
+position, duty cycle, evaluation number). Frame events also have the index of the frame in the archive.
+The events file is flushed on every line so an archive is readable up to the last frame even if the session
+crashes. Frames are stored as grayscale by default, which is all the centre of mass functions use.
+
+Record by passing a writer to Balancer:
+
+    with ArchiveWriter('Z:/levelling/2024_01_01') as recorder:
+        balancer = Balancer(shaker, cam, motors, measure_fn=com_balls, recorder=recorder)
+        balancer.level()
+
+Replay by driving Balancer with a ReplayRig, many times faster than real time because nothing waits for the
+shaker:
+
+    rig = ReplayRig(Archive('Z:/levelling/2024_01_01'))
+    balancer = Balancer(rig.shaker, rig.camera, rig.motors, measure_fn=com_balls)
+    balancer.com_settings = replay_settings(balancer.com_settings)
+    balancer.level(iterations=5, ncalls=30)
+
+or recompute the centre of mass of every recorded frame with different image settings using replay_com.
+'''
+
+HEADER = 'archive.json'
+EVENTS = 'events.jsonl'
+
+
+class ArchiveWriter:
+    def __init__(self, path, chunk_size=64, grayscale=True, info=None):
+        """Records frames and events to the archive folder path, which is created if necessary. An existing
+        archive in path is overwritten.
+
+        chunk_size : number of frames in each memory-mapped chunk file
+        grayscale : store only the first channel of colour frames
+        info : dict of json serialisable information stored in archive.json
+        """
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.chunk_size = chunk_size
+        self.grayscale = grayscale
+        self.info = {} if info is None else dict(info)
+        # State of the rig added to every event
+        self.state = {}
+        self.n_frames = 0
+        self._chunk = None
+        self._frame_shape = None
+        self._dtype = None
+        self._events = open(os.path.join(path, EVENTS), 'w', buffering=1)
+
+    def camera(self, cam):
+        return RecordingCamera(cam, self)
+
+    def shaker(self, shaker):
+        return RecordingShaker(shaker, self)
+
+    def motors(self, motors):
+        return RecordingMotors(motors, self)
+
+    def log(self, event_type, **values):
+        """Record an event. values are stored with the current state."""
+        record = dict(self.state, type=event_type, time=time.time())
+        record.update(values)
+        self._events.write(json.dumps(record, default=_to_json) + '\n')
+
+    def add_frame(self, img, **values):
+        """Store a frame and record a frame event. Returns the index of the frame."""
+        img = np.asarray(img)
+        if self.grayscale and img.ndim == 3:
+            img = img[:, :, 0]
+        if self._frame_shape is None:
+            self._frame_shape = img.shape
+            self._dtype = img.dtype
+            self.save_header()
+        elif img.shape != self._frame_shape:
+            raise ValueError("Frame shape " + str(img.shape) + " does not match archive " + str(self._frame_shape))
+
+        chunk, row = divmod(self.n_frames, self.chunk_size)
+        if row == 0:
+            self._flush_chunk()
+            self._chunk = np.lib.format.open_memmap(
+                _chunk_filename(self.path, chunk), mode='w+', dtype=self._dtype,
+                shape=(self.chunk_size,) + self._frame_shape)
+        self._chunk[row] = img
+        index = self.n_frames
+        self.n_frames += 1
+        self.log('frame', index=index, **values)
+        return index
+
+    def _flush_chunk(self):
+        if self._chunk is not None:
+            self._chunk.flush()
+            self._chunk = None
+
+    def save_header(self):
+        header = {'chunk_size': self.chunk_size,
+                  'frame_shape': self._frame_shape,
+                  'dtype': None if self._dtype is None else np.dtype(self._dtype).str,
+                  'grayscale': self.grayscale,
+                  'info': self.info}
+        with open(os.path.join(self.path, HEADER), 'w') as f:
+            f.write(json.dumps(header, default=_to_json))
+
+    def close(self):
+        self._flush_chunk()
+        self.save_header()
+        self._events.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class RecordingCamera:
+    """Records every frame taken by cam"""
+
+    def __init__(self, cam, writer):
+        self.cam = cam
+        self.writer = writer
+
+    def get_frame(self):
+        img = self.cam.get_frame()
+        self.writer.add_frame(img)
+        return img
+
+    def __getattr__(self, name):
+        return getattr(self.__dict__['cam'], name)
+
+
+class RecordingShaker:
+    """Records duty cycle changes and ramps and keeps the current duty cycle in the writer state"""
+
+    def __init__(self, shaker, writer):
+        self.shaker = shaker
+        self.writer = writer
+
+    def set_duty(self, val: int):
+        self.shaker.set_duty(val)
+        self.writer.state['duty'] = int(val)
+        self.writer.log('duty')
+
+    def set_duty_and_record(self, val: int):
+        self.shaker.set_duty_and_record(val)
+        self.writer.state['duty'] = int(val)
+        self.writer.log('duty', record=True)
+
+    def ramp(self, start: int, stop: int, rate: float, *args, **kwargs):
+        self.writer.log('ramp_start', start=int(start), stop=int(stop), rate=float(rate))
+        self.shaker.ramp(start, stop, rate, *args, **kwargs)
+        self.writer.state['duty'] = 0 if kwargs.get('stop_at_end') else int(stop)
+        self.writer.log('ramp_stop')
+
+    def __getattr__(self, name):
+        return getattr(self.__dict__['shaker'], name)
+
+
+class RecordingMotors:
+    """Records motor moves and keeps the motor position in the writer state"""
+
+    def __init__(self, motors, writer):
+        self.motors = motors
+        self.writer = writer
+        self.writer.state['motor'] = [int(motors.x), int(motors.y)]
+
+    def movexy(self, x: int, y: int):
+        self.motors.movexy(x, y)
+        self.writer.state['motor'] = [int(self.motors.x), int(self.motors.y)]
+        self.writer.log('move')
+
+    def __getattr__(self, name):
+        return getattr(self.__dict__['motors'], name)
+
+
+class Archive:
+    def __init__(self, path):
+        """Read only access to an archive written by ArchiveWriter"""
+        self.path = path
+        with open(os.path.join(path, HEADER)) as f:
+            header = json.loads(f.read())
+        self.chunk_size = header['chunk_size']
+        self.frame_shape = tuple(header['frame_shape']) if header['frame_shape'] else None
+        self.grayscale = header['grayscale']
+        self.info = header['info']
+        with open(os.path.join(path, EVENTS)) as f:
+            self.events = [json.loads(line) for line in f if line.strip()]
+        self.frame_events = [event for event in self.events if event['type'] == 'frame']
+        self._chunks = {}
+
+    def __len__(self):
+        return len(self.frame_events)
+
+    def frame(self, index, bgr=True):
+        """Frame index as stored or, for grayscale archives with bgr=True, as a 3 channel image"""
+        if not 0 <= index < len(self):
+            raise IndexError("frame index out of range")
+        chunk, row = divmod(index, self.chunk_size)
+        if chunk not in self._chunks:
+            self._chunks[chunk] = np.load(_chunk_filename(self.path, chunk), mmap_mode='r')
+        img = self._chunks[chunk][row]
+        if bgr and img.ndim == 2:
+            img = np.repeat(img[:, :, None], 3, axis=2)
+        return np.array(img)
+
+    def select(self, event_type):
+        return [event for event in self.events if event['type'] == event_type]
+
+    def positions(self):
+        """Motor position of every frame as an (n_frames, 2) array"""
+        return np.array([event.get('motor', [np.nan, np.nan]) for event in self.frame_events], dtype=float)
+
+
+class ReplayRig:
+    """Drives Balancer from an archive
+
+    The camera returns recorded frames taken at the recorded motor position nearest to the current motor
+    position, cycling through them in the order they were recorded. The shaker does nothing. Levelling can
+    then be repeated with different optimiser or image processing settings against real frames.
+    """
+
+    def __init__(self, archive, motor_pos=(0, 0)):
+        self.archive = archive
+        self.motors = _ReplayMotors(*motor_pos)
+        self.shaker = _ReplayShaker()
+        self.camera = _ReplayCamera(self)
+        positions = archive.positions()
+        valid = ~np.isnan(positions).any(axis=1)
+        self.sites, inverse = np.unique(positions[valid], axis=0, return_inverse=True)
+        frames = np.flatnonzero(valid)
+        self.site_frames = [frames[inverse.ravel() == site] for site in range(len(self.sites))]
+        self._next = np.zeros(len(self.sites), dtype=int)
+
+    def next_frame(self):
+        """Index of the next frame to replay at the current motor position"""
+        if len(self.sites) == 0:
+            raise ValueError("Archive has no frames with motor positions")
+        distance = np.hypot(self.sites[:, 0] - self.motors.x, self.sites[:, 1] - self.motors.y)
+        site = np.argmin(distance)
+        frames = self.site_frames[site]
+        index = frames[self._next[site] % len(frames)]
+        self._next[site] += 1
+        return index
+
+
+class _ReplayMotors:
+    def __init__(self, x=0, y=0):
+        self.x = x
+        self.y = y
+
+    def movexy(self, x: int, y: int):
+        self.x = x
+        self.y = y
+
+
+class _ReplayShaker:
+    def set_duty(self, val: int):
+        pass
+
+    def set_duty_and_record(self, val: int):
+        pass
+
+    def ramp(self, *args, **kwargs):
+        pass
+
+
+class _ReplayCamera:
+    def __init__(self, rig):
+        self.rig = rig
+
+    def get_frame(self):
+        return self.rig.archive.frame(self.rig.next_frame())
+
+
+def replay_com(archive, pts, img_processing, frames=None):
+    """Centre of mass of recorded frames using img_processing settings like SETTINGS_com_balls['img_processing']
+
+    Returns an (n_frames, 2) array of x, y
+    """
+    frames = range(len(archive)) if frames is None else frames
+    return np.array([img_processing['img_fn'](archive.frame(index), pts, img_settings=img_processing)
+                     for index in frames])
+
+
+def replay_settings(com_settings):
+    """Copy of SETTINGS_com_balls / SETTINGS_com_bubble with the shaker waits set to zero for replaying"""
+    shaker_settings = dict(com_settings['shaker_settings'], wait_time=0, measure_time=0, ramp_time=0)
+    return dict(com_settings, shaker_settings=shaker_settings)
+
+
+def _chunk_filename(path, chunk):
+    return os.path.join(path, 'frames_{:05}.npy'.format(chunk))
+
+
+def _to_json(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if callable(value):
+        return getattr(value, '__name__', str(value))
+    raise TypeError("Cannot store " + repr(value) + " in archive")
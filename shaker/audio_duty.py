@@ -23,12 +23,37 @@ def read_audio_file(file, frames):
 
 
 def frame_frequency(wave, frames, audio_rate):
-    waves = np.array_split(wave, frames)
-    freqs = np.array(
-        [fourier_transform_peak(wav, 1 / audio_rate) for wav in waves])
+    """Peak frequency of the audio in each of frames equal chunks of wave.
+
+    Chunks are split as np.array_split would split them. The first len(wave) % frames
+    chunks are one sample longer so the chunks are transformed in two batches, one for each length,
+    rather than one fft per frame.
+    """
+    wave = np.asarray(wave)
+    short, n_long = divmod(len(wave), frames)
+    split = n_long * (short + 1)
+    freqs = np.concatenate((
+        _batch_peak(wave[:split].reshape(n_long, short + 1), 1 / audio_rate),
+        _batch_peak(wave[split:].reshape(frames - n_long, short), 1 / audio_rate)))
     return freqs
 
 
+FFT_BATCH = 256
+
+
+def _batch_peak(sigs, time_step, n=48000, batch=FFT_BATCH):
+    """Equivalent to fourier_transform_peak applied to each row of sigs.
+
+    Rows are transformed batch at a time so memory does not grow with the length of the video.
+    """
+    freq = np.fft.rfftfreq(n, time_step)
+    peaks = np.zeros(len(sigs))
+    for start in range(0, len(sigs), batch):
+        ft = np.abs(np.fft.rfft(sigs[start:start + batch], n, axis=1))
+        peaks[start:start + batch] = freq[np.argmax(ft, axis=1)]
+    return peaks
+
+
 def fourier_transform_peak(sig, time_step):
     ft = np.abs(np.fft.fft(sig, 48000))
     freq = np.fft.fftfreq(48000, time_step)
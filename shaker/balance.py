@@ -1,25 +1,26 @@
 import os
+import threading
 import time
 import numpy as np
-import matplotlib.pyplot as plt
-from PyQt6.QtWidgets import QApplication, QInputDialog, QMessageBox
-from IPython.display import display, clear_output
 
-from .settings import SETTINGS_PATH, TRACK_LEVEL, update_settings_file,SETTINGS_com_balls, SETTINGS_com_bubble
-from .plotting import update_plot, draw_img_axes
-from .centre_mass import find_boundary,  measure_com
+from .settings import rig_settings, update_settings_file
+from .centre_mass import find_boundary,  measure_com_repeated
+from . import telemetry
 
+# GUI (PyQt6, labvision display), plotting (matplotlib, cv2) and optimisation (skopt) are imported
+# where they are used so that importing this module stays fast and works headless.
 
-# from scipy.optimize import minimize
-# Pip install my version "pip install git+https://github.com/mikesmithlab/scikit-optimize" which contains fixes
-from skopt.skopt import gp_minimize
-from labvision.images import Displayer, draw_circle, draw_polygon, write_img
-
+# When telemetry is enabled the time spent in each part of every evaluation is appended to a file named after
+# TRACK_LEVEL ending in TIMING_SUFFIX and all the spans of a levelling run are saved as a Chrome trace ending in
+# TRACE_SUFFIX.
+TIMING_SUFFIX = '_timing.jsonl'
+TRACE_SUFFIX = '_trace.json'
 
 
 
 class Balancer:
-    def __init__(self, shaker=None, camera=None, motors=None, measure_fn=None):
+    def __init__(self, shaker=None, camera=None, motors=None, measure_fn=None, recorder=None, rig=None,
+                 display=True):
         """Balancer class handles levelling a shaker. 
 
         shaker an instance of Shaker() which controls vibration of shaker
@@ -29,6 +30,11 @@ class Balancer:
 
         Optional:
         boundary_pts : Tuple of x,y coordinates defining the boundary of the system. If not specified, the user will be prompted to define the boundary.
+        recorder : an ArchiveWriter. Every frame, duty change, motor move and evaluation is recorded so the session can be replayed.
+        rig : name of the rig in RIGS in settings. Its settings file, levelling files and measurement settings are used.
+        display : show the camera image and levelling plot in windows. GUI backends only work in the main thread,
+            so pass False to level from another thread, e.g. in a RigScheduler job. The levelling data and the
+            final image are saved either way.
 
         The basic principle is find the centre of the experiment by manually selecting the boundary.
         Type of boundary is defined by shape. The balancer then compares the centre as defined manually 
@@ -37,38 +43,58 @@ class Balancer:
 
         """
         self.measurement_counter = 0
+        self.rig = rig
+        values = rig_settings(rig)
+        self.track_file = values['SETTINGS_PATH'] + values['TRACK_LEVEL']
+        self.timing_file = self.track_file[:-4] + TIMING_SUFFIX
+        self.trace_file = self.track_file[:-4] + TRACE_SUFFIX
+        self.recorder = recorder
+        if recorder is not None:
+            shaker, camera, motors = recorder.shaker(shaker), recorder.camera(camera), recorder.motors(motors)
         self.shaker = shaker
         self.motors = motors
         self.cam = camera
         self.measure_fn = measure_fn
 
         if measure_fn.__name__ == 'com_balls':
-            self.com_settings = SETTINGS_com_balls
+            self.com_settings = values['SETTINGS_com_balls']
         elif measure_fn.__name__ == 'com_bubble':
-            self.com_settings = SETTINGS_com_bubble
+            self.com_settings = values['SETTINGS_com_bubble']
         else:
             raise ValueError(
                 "measure_fn must be com_balls or com_bubble")
 
         # Store datapoints for future use. Track_levelling are a list of x,y motor coords, expt_com is a list of particles C.O.M coords.
         try:
-            os.remove(SETTINGS_PATH + TRACK_LEVEL)
+            os.remove(self.track_file)
         except:
             print("No previous levelling data found")
+        if os.path.exists(self.timing_file):
+            os.remove(self.timing_file)
 
         self.track_levelling = [[0, 0, 0, 0, 0, 0]]
         self.expt_com = []
 
-        self.shaker.set_duty(update_settings_file()['shaker_warmup_duty'])
+        self.shaker.set_duty(update_settings_file(rig=rig)['shaker_warmup_duty'])
         img = self.cam.get_frame()
-        self.disp = Displayer(img, title=' ')
-        plt.ion()
-        self.fig, self.ax = plt.subplots(nrows=1, ncols=1, figsize=(6, 6))
+        self.disp = None
+        self.monitor = None
+        if display:
+            from labvision.images import Displayer
+            from .plotting import LevellingMonitor
+
+            self.disp = Displayer(img, title=' ')
+            self.monitor = LevellingMonitor()
 
         # Passing False means these values are drawn from file
         self.set_boundary(set_boundary_pts=False)
         self.set_motor_limits(set_limits=False)
 
+        if recorder is not None:
+            recorder.info.update(measure_fn=measure_fn.__name__, com_settings=self.com_settings,
+                                 boundary_pts=(self.pts, self.cx, self.cy), motor_limits=self.motor_limits)
+            recorder.save_header()
+
     def set_boundary(self, set_boundary_pts=True, shape='polygon'):
         """A way of user selecting boundary or can use pre-existin points"""
         self.boundary_shape = shape
@@ -76,9 +102,9 @@ class Balancer:
         if set_boundary_pts:
             self.pts, self.cx, self.cy = find_boundary(
                 self.cam, shape=self.boundary_shape)
-            update_settings_file(boundary_pts=(self.pts, self.cx, self.cy))
+            update_settings_file(boundary_pts=(self.pts, self.cx, self.cy), rig=self.rig)
         else:
-            self.pts, self.cx, self.cy = update_settings_file()['boundary_pts']
+            self.pts, self.cx, self.cy = update_settings_file(rig=self.rig)['boundary_pts']
 
         return (self.pts, self.cx, self.cy)
 
@@ -99,7 +125,7 @@ class Balancer:
             search = True
             while search:
                 # Ask user for some trial motor positions and move motors
-                x_motor, y_motor = user_coord_request(corners[i])
+                x_motor, y_motor = user_coord_request(corners[i], rig=self.rig)
                 self.motors.movexy(x_motor, y_motor)
 
                 # Make sure we only take few measurements
@@ -134,18 +160,20 @@ class Balancer:
                                  (y1, y2)]
             self.motor_pts = [(sx1, sy1), (sx2, sy1), (sx2, sy2), (sx1, sy2)]
             update_settings_file(
-                motor_limits=self.motor_limits, motor_pts=self.motor_pts)
+                motor_limits=self.motor_limits, motor_pts=self.motor_pts, rig=self.rig)
             print(
                 "Motor limits set interactively [(x1,x2),(y1,y2)] : ", self.motor_limits)
         # read in motor limits from settings file
         else:
-            self.motor_limits = update_settings_file()['motor_limits']
-            self.motor_pts = update_settings_file()['motor_pts']
+            self.motor_limits = update_settings_file(rig=self.rig)['motor_limits']
+            self.motor_pts = update_settings_file(rig=self.rig)['motor_pts']
             print(
                 "Motor limits from config file [(x1,x2),(y1,y2)] : ", self.motor_limits)
 
         self._update_display((self.cx, self.cy), show_motor_lims=True)
-        time.sleep(5)
+        if self.disp is not None:
+            # time to look at the limits
+            time.sleep(5)
 
         return self.motor_limits
 
@@ -171,38 +199,57 @@ class Balancer:
         
 
         """
+        # from scipy.optimize import minimize
+        # Pip install my version "pip install git+https://github.com/mikesmithlab/scikit-optimize" which contains fixes
+        from skopt.skopt import gp_minimize
+
         # Number of measurements to average to get an estimate of centre of mass of particles
         self.iterations = iterations
 
         def min_fn(new_xy_coords):
             "Adjust the motor positions to match input"
-            self.motors.movexy(new_xy_coords[0], new_xy_coords[1])
-
-            # Evaluate new x,y coordinates
-            x, y, _ = self._measure(caller='min_fn')
-
-            # Work out how far away com is from centre
-            cost = ((self.cx - x)**2+(self.cy - y)**2)**0.5
-
+            start = telemetry.mark()
+            evaluation = len(self.track_levelling)
+            if self.recorder is not None:
+                self.recorder.state['evaluation'] = evaluation
+            with telemetry.span('balance.evaluation', evaluation=evaluation):
+                self.motors.movexy(new_xy_coords[0], new_xy_coords[1])
+
+                # Evaluate new x,y coordinates
+                x, y, _ = self._measure(caller='min_fn')
+
+                # Work out how far away com is from centre
+                cost = ((self.cx - x)**2+(self.cy - y)**2)**0.5
+
+            if self.recorder is not None:
+                self.recorder.log('evaluation', x_com=x, y_com=y, cost=cost)
+            if telemetry.enabled():
+                # only this thread's spans in case other rigs are levelling at the same time
+                telemetry.save_breakdown(self.timing_file, since=start, thread=threading.get_ident(),
+                                         evaluation=evaluation,
+                                         x_motor=int(self.motors.x), y_motor=int(self.motors.y), cost=float(cost))
             return cost
 
         # The bit that minimises the cost function
-        result_gp = gp_minimize(min_fn, self.motor_limits, n_initial_points=6,
-                                n_calls=ncalls, acq_optimizer="sampling", verbose=False)
-        self._prep_expt(result_gp)
+        start = telemetry.mark()
+        try:
+            result_gp = gp_minimize(min_fn, self.motor_limits, n_initial_points=6,
+                                    n_calls=ncalls, acq_optimizer="sampling", verbose=False)
+            self._prep_expt(result_gp)
+        finally:
+            # Saved even if levelling is interrupted
+            if telemetry.enabled():
+                telemetry.save_chrome_trace(self.trace_file, since=start)
         
         return result_gp
 
+    @telemetry.traced('balance.measure')
     def _measure(self, caller='other', *args):
-        """Take a collection of measurements, calculate current com"""
-        xvals = []
-        yvals = []
-        for _ in range(int(self.iterations)):
-            x0, y0 = measure_com(
-                self.cam, self.shaker, self.pts, settings=self.com_settings, debug=False)
-            xvals.append(x0)
-            yvals.append(y0)
-            self.measurement_counter += 1
+        """Take a collection of measurements, calculate current com. Each image is processed while the next
+        measurement anneals the tray."""
+        xvals, yvals = measure_com_repeated(
+            self.cam, self.shaker, self.pts, settings=self.com_settings, iterations=int(self.iterations))
+        self.measurement_counter += len(xvals)
 
         x = np.mean(xvals)
         y = np.mean(yvals)
@@ -221,14 +268,20 @@ class Balancer:
 
     def _prep_expt(self, result_gp):
         """Once the levelling is complete, we want to prepare for the experiment. Move motors to optimum position and save copy of all the data."""
+        from labvision.images import write_img
+
         # Get the best motor positions from the optimisation
         x, y = result_gp.x
+        self._update_plot(force=True)
         self.motors.movexy(x, y)
         img = self._update_display((x, y), show_motor_lims=True)
-        write_img(img, SETTINGS_PATH +
-                  TRACK_LEVEL[:-4] + '.png')
+        write_img(img, self.track_file[:-4] + '.png')
 
+    @telemetry.traced('balance.update_display')
     def _update_display(self, point, show_motor_lims=False):
+        from labvision.images import draw_circle, draw_polygon
+        from .plotting import draw_img_axes
+
         img = self.cam.get_frame()
 
         img = draw_img_axes(img)
@@ -254,18 +307,23 @@ class Balancer:
             img = draw_circle(
                 img, point[2], point[3], rad=4, color=colour, thickness=-1)
 
+        if self.disp is None:
+            return img
         self.disp.close_window()
         self.disp.window_name = 'Levelling : (X_motor, Y_motor), (x_com, y_com), (cx, cy) : (' + str(self.motors.x) + ',' + str(
             self.motors.y) + '), (' + str(point[0]) + ',' + str(point[1]) + '), (' + str(self.cx) + ',' + str(self.cy) + ')'
         self.disp.update_im(img)
         return img
 
-    def _update_plot(self):
-        update_plot(self.fig, self.ax, self.track_levelling)
+    @telemetry.traced('balance.update_plot')
+    def _update_plot(self, force=False):
+        if self.monitor is not None:
+            self.monitor.update(self.track_levelling, force=force)
         
 
+    @telemetry.traced('balance.save_data')
     def _save_data(self):
-        with open(SETTINGS_PATH + TRACK_LEVEL, 'a') as f:
+        with open(self.track_file, 'a') as f:
             np.savetxt(f, np.array([self.track_levelling[-1]]), delimiter=",")
 
 
@@ -275,6 +333,7 @@ Helper functions
 --------------------------------------------------------------------------------------------------------------------------"""
 
 def get_yes_no_input():
+    from PyQt6.QtWidgets import QApplication, QMessageBox
     app = QApplication([])
     reply = QMessageBox.question(None, 'Message', "Are you happy with point?",
                                  QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No, QMessageBox.StandardButton.No)
@@ -284,10 +343,11 @@ def get_yes_no_input():
         return False
 
 
-def user_coord_request(position):
+def user_coord_request(position, rig=None):
+    from PyQt6.QtWidgets import QApplication, QInputDialog
     app = QApplication([])
     formatted = False
-    text_coords = update_settings_file()['motor_pos']
+    text_coords = update_settings_file(rig=rig)['motor_pos']
     while not formatted:
         text_coords, ok = QInputDialog.getText(None, "Set Coordinates", "Set coords for " + position +
                                                " for integer x and y motor positions: x, y", text=text_coords)
@@ -1,17 +1,16 @@
 
 import numpy as np
-import pandas as pd
-import matplotlib.pyplot as plt
 from tqdm import tqdm
 import time
 
 from labequipment.accelerometer import pk_acceleration
 from .shaker import Shaker
+from .accelerometer import AccelerometerReader
 from labequipment.arduino import Arduino
-from .settings import SETTINGS_PATH, ACCELEROMETER_SHAKER, ACCELEROMETER_FILE
+from .settings import rig_settings
 
 
-def calibrate_accelerometer(start=250, stop=750, step=25):
+def calibrate_accelerometer(start=250, stop=750, step=25, rig=None):
     """
     A function that measures peak_z acceleration values at different duty cycles.
 
@@ -19,13 +18,14 @@ def calibrate_accelerometer(start=250, stop=750, step=25):
     start [int] : initial duty cycle value 
     stop [int] : final duty cycle value
     step [int] : change in duty size each iteration
+    rig [str] : name of the rig in RIGS in settings. Defaults to the module level settings.
 
     ---- Output: ----
     duty_cycles [numpy array]: array containing duty cycle values
     acceleration_measurements [numpy array] : array containing peak_z acceleration measurements
     """
 
-    with Shaker() as shaker, Arduino(ACCELEROMETER_SHAKER) as acc_obj:
+    with Shaker(rig=rig) as shaker, Arduino(rig_settings(rig)['ACCELEROMETER_SHAKER']) as acc_obj:
         peak_z = pk_acceleration(acc_obj)  # measure acceleration
         shaker.set_duty(0)  # set duty
         duty_cycles = np.arange(start, stop, step)
@@ -40,9 +40,52 @@ def calibrate_accelerometer(start=250, stop=750, step=25):
     return duty_cycles, acceleration_measurements
 
 
-def plot_acceleration_calibration():
+def calibrate_accelerometer_adaptive(start=250, stop=750, step=25, window=1.0, tolerance=0.02, timeout=10, rig=None):
+    """
+    Measures peak_z acceleration values at different duty cycles, moving on to the next duty cycle as soon
+    as the accelerometer readings are stationary rather than after a fixed wait. The accelerometer is read
+    continuously and all the steady state samples in the last window are averaged.
+
+    ----Input: ----
+    start [int] : initial duty cycle value 
+    stop [int] : final duty cycle value
+    step [int] : change in duty size each iteration
+    window [float] : length of averaging window in seconds. Readings are stationary when the means of two consecutive windows agree.
+    tolerance [float] : tolerance in Γ for the mean and its uncertainty
+    timeout [float] : maximum time to wait at each duty cycle
+    rig [str] : name of the rig in RIGS in settings. Defaults to the module level settings.
+
+    ---- Output: ----
+    duty_cycles [numpy array]: array containing duty cycle values
+    acceleration_measurements [numpy array] : array containing mean peak_z acceleration measurements
+    uncertainties [numpy array] : standard error of each acceleration measurement
+    settle_times [numpy array] : time in seconds for the acceleration to settle after each duty change. nan if it did not settle before timeout.
+    """
+    with Shaker(rig=rig) as shaker, AccelerometerReader(rig=rig) as acc_obj:
+        shaker.set_duty(0)  # set duty
+        duty_cycles = np.arange(start, stop, step)
+        acceleration_measurements = []
+        uncertainties = []
+        settle_times = []
+        for duty_cycle in tqdm(duty_cycles):  # loop through all duty cycles
+            shaker.set_duty(duty_cycle)
+            t = acc_obj.mark('duty', duty_cycle)
+            peak_z, uncertainty, settle_time, settled = acc_obj.wait_until_settled(
+                t, window=window, tolerance=tolerance, timeout=timeout)
+            acceleration_measurements.append(peak_z)
+            uncertainties.append(uncertainty)
+            settle_times.append(settle_time if settled else np.nan)
+
+    return duty_cycles, np.array(acceleration_measurements), np.array(uncertainties), np.array(settle_times)
+
+
+def plot_acceleration_calibration(rig=None):
     """Quick function to look at calibration curve for accelerometer attached to shaker"""
-    df = pd.read_csv(SETTINGS_PATH + ACCELEROMETER_FILE)
+    import pandas as pd
+    import matplotlib.pyplot as plt
+
+    values = rig_settings(rig)
+    df = pd.read_csv(values['SETTINGS_PATH'] + values['ACCELEROMETER_FILE'])
     plt.figure()
     plt.plot(df['duty_cycle'], df['acceleration'], 'r-')
     plt.plot(df['duty_cycle'], df['acceleration'], 'kx')
@@ -54,16 +97,20 @@ def plot_acceleration_calibration():
 
 # code to run a calibration cycle
 if __name__ == "__main__":
-    duty_cycles, acceleration = calibrate_accelerometer(
+    import matplotlib.pyplot as plt
+
+    duty_cycles, acceleration, uncertainty, settle_times = calibrate_accelerometer_adaptive(
         start=0, stop=940, step=10)  # run calibration cycle
     # save data to txt files
     np.savetxt("acceleration_data4.txt", acceleration[1:])
     np.savetxt("duty_cycle_data4.txt", duty_cycles[1:])
+    np.savetxt("acceleration_uncertainty_data4.txt", uncertainty[1:])
+    np.savetxt("settle_time_data4.txt", settle_times[1:])
 
     # plotting
     fig = plt.figure()
     plt.xlabel('Duty Cycle')
     plt.ylabel('Peak z-acc ($\Gamma$)')
-    plt.plot(duty_cycles[1:], acceleration[1:], '.-')
+    plt.errorbar(duty_cycles[1:], acceleration[1:], yerr=uncertainty[1:], fmt='.-')
     plt.grid()
     plt.show()
@@ -0,0 +1,108 @@
+import os
+from functools import lru_cache
+import numpy as np
+
+from .settings import rig_settings
+
+MAX_DUTY = 999
+
+
+class AccelerationCalibration:
+    """Converts between duty cycle and peak acceleration Γ using the accelerometer calibration.
+
+    The calibration points are made monotone (isotonic regression) and interpolated with a monotone
+    cubic (pchip). The interpolant is evaluated once at every integer duty cycle and all subsequent lookups
+    are vectorised np.interp / np.searchsorted calls on this table.
+
+    ----Example Usage: ----
+
+    cal = AccelerationCalibration.from_file()
+    cal.gamma([500, 600])     # Γ at duty cycles 500 and 600
+    cal.duty(2.5)             # smallest duty cycle giving Γ >= 2.5
+    """
+
+    def __init__(self, duty_cycles, acceleration):
+        # scipy is only needed to build the table so is not imported with the shaker
+        from scipy.interpolate import PchipInterpolator
+
+        duty_cycles = np.asarray(duty_cycles, dtype=float)
+        acceleration = np.asarray(acceleration, dtype=float)
+        valid = ~(np.isnan(duty_cycles) | np.isnan(acceleration))
+        duty_cycles, acceleration = duty_cycles[valid], acceleration[valid]
+
+        # Average repeated duty cycles
+        duty_cycles, inverse = np.unique(duty_cycles, return_inverse=True)
+        acceleration = np.bincount(inverse, weights=acceleration) / np.bincount(inverse)
+        if len(duty_cycles) < 2:
+            raise ValueError("Calibration needs at least 2 different duty cycles")
+
+        self.duty_cycles = duty_cycles
+        self.acceleration = _isotonic(acceleration)
+
+        self.table_duty = np.arange(MAX_DUTY + 1)
+        interpolant = PchipInterpolator(self.duty_cycles, self.acceleration, extrapolate=False)
+        table_gamma = interpolant(np.clip(self.table_duty, duty_cycles[0], duty_cycles[-1]))
+        # Guard against rounding making the table decrease anywhere
+        self.table_gamma = np.maximum.accumulate(table_gamma)
+
+    @classmethod
+    def from_file(cls, filename=None, rig=None):
+        """Load calibration from csv file with columns duty_cycle and acceleration. Defaults to
+        SETTINGS_PATH + ACCELEROMETER_FILE of rig in RIGS, looked up when called. The fitted calibration is cached
+        until the file is modified."""
+        if filename is None:
+            values = rig_settings(rig)
+            filename = values['SETTINGS_PATH'] + values['ACCELEROMETER_FILE']
+        return _load_calibration(filename, os.path.getmtime(filename))
+
+    def gamma(self, duty):
+        """Peak acceleration Γ at duty cycle(s) duty"""
+        return np.interp(duty, self.table_duty, self.table_gamma)
+
+    def duty(self, gamma):
+        """Smallest integer duty cycle(s) giving an acceleration of at least gamma. Values outside
+        the calibrated range are clipped to the range of calibrated duty cycles."""
+        index = np.searchsorted(self.table_gamma, gamma, side='left')
+        return self.table_duty[np.clip(index, int(np.ceil(self.duty_cycles[0])), int(self.duty_cycles[-1]))]
+
+    def ramp_schedule(self, g0: float, g1: float, rate: float):
+        """Duty cycles and times at which to apply them to ramp linearly in Γ from g0 to g1
+
+        Args:
+            g0 (float): initial acceleration
+            g1 (float): final acceleration
+            rate (float): rate in Γ per second
+
+        Returns:
+            duty_cycles, times: integer duty cycles and the time in seconds after the start of the ramp at which
+            each should be applied. Every duty cycle between the start and end is used once.
+        """
+        d0, d1 = int(self.duty(g0)), int(self.duty(g1))
+        step = 1 if d1 >= d0 else -1
+        duty_cycles = np.arange(d0, d1 + step, step)
+        times = np.abs(self.gamma(duty_cycles) - self.gamma(d0)) / rate
+        # Where Γ is flat several duty cycles share a time. Only the last of them is needed.
+        keep = np.append(np.diff(times) > 0, True)
+        return duty_cycles[keep], times[keep]
+
+
+@lru_cache(maxsize=8)
+def _load_calibration(filename, mtime):
+    data = np.genfromtxt(filename, delimiter=',', names=True)
+    return AccelerationCalibration(data['duty_cycle'], data['acceleration'])
+
+
+def _isotonic(values):
+    """Closest non-decreasing sequence to values in least squares (pool adjacent violators)"""
+    means = []
+    weights = []
+    for value in values:
+        means.append(value)
+        weights.append(1)
+        while len(means) > 1 and means[-2] > means[-1]:
+            weight = weights[-2] + weights[-1]
+            means[-2] = (means[-2] * weights[-2] + means[-1] * weights[-1]) / weight
+            weights[-2] = weight
+            means.pop()
+            weights.pop()
+    return np.repeat(means, weights)
@@ -1,14 +1,19 @@
-import numpy as np
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 
+from . import telemetry
 
-from labvision.images.cropmask import viewer
-from labvision.images import threshold, median_blur, apply_mask, mask_polygon, bgr_to_gray
-from labvision.camera.camera_config import CameraType
-
+# labvision is imported inside the functions that use it so that settings, which imports
+# this module, can be imported quickly and without a display.
 
 
-panasonic = CameraType.PANASONICHCX1000  # creating camera object.
+def __getattr__(name):
+    if name == 'panasonic':
+        from labvision.camera.camera_config import CameraType
+        return CameraType.PANASONICHCX1000  # creating camera object.
+    raise AttributeError("module " + __name__ + " has no attribute " + name)
 
 # --------------------------------------------------------------------
 """Find COM of boundary and particles"""
@@ -18,6 +23,8 @@ def find_boundary(cam, shape='polygon'):
     """find_boundary is a utility method to allow the user to define the boundary of the system. 
     This can be used in Balancer during initialiation or called independently and the result passed to Balancer.
     """
+    from labvision.images.cropmask import viewer
+
     img = cam.get_frame()
     pts = viewer(img, shape)
     cx, cy = find_centre(pts)
@@ -43,29 +50,40 @@ def find_com(bw_img):
 """Image Processing Functions to find Centre of Mass"""
 
 
-def com_balls(img, pts, img_settings=None, debug=False):
-    # take image and analyse to find centre of mass of system
+def particle_mask(img, pts, img_settings=None, debug=False):
+    """Thresholded image of the particles inside the boundary pts"""
+    from labvision.images import threshold, median_blur, apply_mask, mask_polygon, bgr_to_gray
+
     bw_img = bgr_to_gray(img)
     img_threshold = threshold(median_blur(
         bw_img, kernel=(img_settings['blur_kernel'])), value=img_settings['threshold'], invert=img_settings['invert'], configure=debug)
-    img_masked = apply_mask(
+    return apply_mask(
         img_threshold, mask_polygon(np.shape(img_threshold), pts))
+
+
+def com_balls(img, pts, img_settings=None, debug=False):
+    # take image and analyse to find centre of mass of system
+    img_masked = particle_mask(img, pts, img_settings=img_settings, debug=debug)
     x0, y0 = find_com(img_masked)
     time.sleep(0.5)
     return x0, y0
 
 
 def com_bubble(img, pts, img_settings=None, debug=False):
-    bw_img = bgr_to_gray(img)
-    img_threshold = threshold(median_blur(
-        bw_img, kernel=(img_settings['blur_kernel'])), value=img_settings['threshold'], invert=img_settings['invert'], configure=debug)
-    img_masked = apply_mask(
-        img_threshold, mask_polygon(np.shape(img_threshold), pts))
+    img_masked = particle_mask(img, pts, img_settings=img_settings, debug=debug)
     x0, y0 = find_com(img_masked)
     time.sleep(0.5)
     return x0, y0
 
 
+def frame_order(img, pts, img_settings=None, debug=False):
+    """Quick global hexatic order of the particles in img, thresholded with the img_processing settings of
+    SETTINGS_com_balls. Used as a proxy for the order while an experiment runs."""
+    from .analysis.hexatic import image_order
+
+    return image_order(particle_mask(img, pts, img_settings=img_settings, debug=debug), boundary_pts=pts)
+
+
 # --------------------------------------------------------------------
 """Function to control a measurement of the centre of mass of the system"""
 
@@ -92,47 +110,84 @@ def measure_com(cam, shaker, pts, settings=None, debug=False):
     -------
     x,y coordinates on the image corresponding ot the centre of mass of the particles. These are floats.
     """
+    img = anneal_and_capture(cam, shaker, settings)
+    return process_frame(img, pts, settings, debug=debug)
+
+
+def anneal_and_capture(cam, shaker, settings):
+    """Anneal the tray with the shaker_settings in settings, let it settle and take an image"""
     shaker_settings = settings['shaker_settings']
-    img_processing = settings['img_processing']
 
     # reset everything by raising duty cycle and then ramping down to lower value
-    shaker.set_duty(shaker_settings['initial_duty'])
-    time.sleep(shaker_settings['wait_time'])
+    with telemetry.span('measure_com.anneal'):
+        shaker.set_duty(shaker_settings['initial_duty'])
+        with telemetry.span('measure_com.wait'):
+            time.sleep(shaker_settings['wait_time'])
 
-    if shaker_settings['ramp_time'] > 0:
-        shaker.ramp(shaker_settings['initial_duty'],
-                    shaker_settings['measure_duty'], np.abs(shaker_settings['initial_duty']-shaker_settings['measure_duty'])/shaker_settings['ramp_time'])
-    else:
-        shaker.set_duty(shaker_settings['measure_duty'])
-    time.sleep(shaker_settings['measure_time'])
+        if shaker_settings['ramp_time'] > 0:
+            shaker.ramp(shaker_settings['initial_duty'],
+                        shaker_settings['measure_duty'], np.abs(shaker_settings['initial_duty']-shaker_settings['measure_duty'])/shaker_settings['ramp_time'])
+        else:
+            shaker.set_duty(shaker_settings['measure_duty'])
+    with telemetry.span('measure_com.settle'):
+        time.sleep(shaker_settings['measure_time'])
 
-    # take image and analyse to find centre of mass of system
-    img = cam.get_frame()
-    x0, y0 = img_processing['img_fn'](
-        img, pts, img_settings=img_processing, debug=debug)
+    with telemetry.span('camera.get_frame'):
+        return cam.get_frame()
+
+
+def process_frame(img, pts, settings, debug=False, thread=None):
+    """Centre of mass of the particles in img using the img_processing settings in settings
+
+    thread is the threading.get_ident() of the thread the processing is done for when it runs in a worker, so that
+    telemetry.breakdown(thread=...) counts the processing with that thread. Defaults to the current thread.
+    """
+    img_processing = settings['img_processing']
+    thread = threading.get_ident() if thread is None else thread
+    with telemetry.span('measure_com.processing', img_fn=img_processing['img_fn'].__name__, thread=thread):
+        x0, y0 = img_processing['img_fn'](
+            img, pts, img_settings=img_processing, debug=debug)
 
     return x0, y0
 
 
-def get_measurement(shaker, cam, boundary_pts, settings=None, iterations=10):
+def measure_com_repeated(cam, shaker, pts, settings=None, iterations=10, debug=False, workers=2):
+    """Repeated measure_com with capture and processing pipelined
+
+    Each image is processed in a worker thread while the shaker anneals the tray for the next measurement, so only
+    the processing of the last image adds to the time taken. The results are gathered at the end in the order the
+    images were taken. With debug the thresholding is interactive, so images are processed one at a time on this
+    thread as in measure_com.
+
+    Returns
+    -------
+    arrays of the x and y coordinates of every measurement
+    """
+    if debug:
+        coms = [measure_com(cam, shaker, pts, settings=settings, debug=True) for _ in range(iterations)]
+    else:
+        owner = threading.get_ident()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(process_frame, anneal_and_capture(cam, shaker, settings), pts, settings,
+                                       thread=owner)
+                       for _ in range(iterations)]
+        coms = [future.result() for future in futures]
+    coms = np.array(coms, dtype=float).reshape(-1, 2)
+    return coms[:, 0], coms[:, 1]
+
+
+def get_measurement(shaker, cam, boundary_pts, settings=None, iterations=10, rig=None):
     """This is similar to the above but is used as a simple function
-    that can be called to work out the centre of mass from repeated measurements."""
+    that can be called to work out the centre of mass from repeated measurements.
+    rig is the name in RIGS in settings whose settings file holds the centre of the boundary."""
     #Imported here to avoid circular import
-    from .settings import update_settings_file, SETTINGS_com_balls
+    from .settings import update_settings_file
     
-    x_vals = []
-    y_vals = []
-    for _ in range(iterations):
-        x,y = measure_com(cam, shaker, boundary_pts, settings=settings)
-        x_vals.append(x)
-        y_vals.append(y)
-    mean_x = sum(x_vals)/len(x_vals)
-    mean_y = sum(y_vals)/len(y_vals)
-    x_vals = np.array(x_vals)
-    y_vals = np.array(y_vals)
-
-    cx = update_settings_file()['boundary_pts'][1]
-    cy = update_settings_file()['boundary_pts'][2]
+    x_vals, y_vals = measure_com_repeated(cam, shaker, boundary_pts, settings=settings, iterations=iterations)
+    mean_x = np.mean(x_vals)
+    mean_y = np.mean(y_vals)
+
+    cx, cy = update_settings_file(rig=rig)['boundary_pts'][1:]
 
     mean_r = np.sum(((x_vals-cx)**2 + (y_vals-cy)**2)**0.5)/len(x_vals)
     
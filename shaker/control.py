@@ -0,0 +1,199 @@
+import threading
+import time
+import numpy as np
+
+
+class AccelerationController:
+    """PI controller for the peak acceleration Γ with a feed-forward term from the calibration.
+
+    The controller works in units of Γ. The requested acceleration is
+
+        Γ_request = Γ_target + kp * e + ki * ∫ e dt,     e = Γ_target - Γ_measured
+
+    and is converted to a duty cycle with the calibration. With kp = ki = 0 this is the open loop
+    duty cycle from the calibration. The integral term removes the steady state error caused by the
+    calibration drifting with temperature and load. The integral is not updated while the request is
+    outside the calibrated range (anti-windup).
+    """
+
+    def __init__(self, calibration, kp: float = 0.5, ki: float = 1.0):
+        """calibration is an AccelerationCalibration. kp is dimensionless and ki is in 1/s."""
+        self.calibration = calibration
+        self.kp = kp
+        self.ki = ki
+        self.gamma_limits = (calibration.table_gamma[0], calibration.table_gamma[-1])
+        self.reset(0)
+
+    def reset(self, target: float):
+        """Set a new target acceleration and clear the integral. Returns the feed-forward duty cycle."""
+        self.target = target
+        self.integral = 0
+        return int(self.calibration.duty(target))
+
+    def update(self, measured: float, dt: float):
+        """Returns the duty cycle to apply given the acceleration measured over the last dt seconds"""
+        error = self.target - measured
+        request = self.target + self.kp * error + self.ki * (self.integral + error * dt)
+        saturated = (request > self.gamma_limits[1] and error > 0) or (
+            request < self.gamma_limits[0] and error < 0)
+        if not saturated:
+            self.integral += error * dt
+        request = self.target + self.kp * error + self.ki * self.integral
+        return int(self.calibration.duty(request))
+
+
+def control_loop(controller, set_duty, measure, target: float, tolerance: float = 0.05, hold_time: float = 1.0,
+                 interval: float = 0.2, timeout: float = 30, clock=time.time, sleep=time.sleep):
+    """Drive the acceleration to target and wait until it holds there
+
+    Args:
+        controller (AccelerationController): the controller
+        set_duty (callable): applies a duty cycle e.g. Shaker.set_duty
+        measure (callable): returns the current measured Γ, e.g. the mean of the accelerometer stream over the last interval. May return nan if no data.
+        target (float): target Γ
+        tolerance (float, optional): Γ is on target when within tolerance. Defaults to 0.05.
+        hold_time (float, optional): Γ must stay on target for hold_time seconds. Defaults to 1.0.
+        interval (float, optional): time between control updates in seconds. Defaults to 0.2.
+        timeout (float, optional): give up after timeout seconds. Defaults to 30.
+        clock, sleep (callable, optional): time functions, replaced when simulating.
+
+    Returns:
+        time_to_target, duty: time in seconds from the start to when Γ entered the tolerance band for the last time
+        (nan if it did not hold within timeout) and the last duty cycle applied.
+    """
+    start = clock()
+    duty = controller.reset(target)
+    set_duty(duty)
+    last = start
+    on_target_since = None
+    while clock() - start < timeout:
+        sleep(interval)
+        measured = measure()
+        now = clock()
+        if np.isnan(measured):
+            continue
+        duty = controller.update(measured, now - last)
+        last = now
+        set_duty(duty)
+
+        if abs(target - measured) < tolerance:
+            if on_target_since is None:
+                on_target_since = now
+            if now - on_target_since >= hold_time:
+                return on_target_since - start, duty
+        else:
+            on_target_since = None
+    return np.nan, duty
+
+
+class AccelerationRegulator:
+    """Keeps the acceleration at a target until it is stopped by running the PI controller in a background thread.
+
+    control_loop returns once Γ has reached the target, after which the duty cycle is fixed. The regulator keeps
+    correcting the duty cycle for the whole experiment, so drift with temperature or load while the shaker
+    runs is corrected too. Nothing else should set the duty cycle while the regulator runs.
+
+    If a step raises, e.g. a serial error in set_duty, regulation stops, the exception is kept in error and stop
+    (or leaving the with block) raises it.
+
+    ----Example Usage: ----
+
+    with AccelerometerReader() as acc:
+        regulator = shaker.regulate_acceleration(2.5, acc)
+        ...                         # record at Γ = 2.5
+        regulator.set_target(3.0)
+        ...
+        regulator.stop()
+    """
+
+    def __init__(self, controller, set_duty, measure, interval: float = 0.2, tolerance: float = 0.05,
+                 clock=time.time, sleep=None):
+        """controller, set_duty and measure are as for control_loop. Γ is measured and the duty cycle updated every
+        interval seconds. Γ is on target when within tolerance. sleep defaults to a wait that stop interrupts."""
+        self.controller = controller
+        self.set_duty = set_duty
+        self.measure = measure
+        self.interval = interval
+        self.tolerance = tolerance
+        self.clock = clock
+        self._stop = threading.Event()
+        self.sleep = self._stop.wait if sleep is None else sleep
+        self._lock = threading.Lock()
+        self._thread = None
+        # Exception that stopped regulation
+        self.error = None
+        self.duty = None
+        self.measured = np.nan
+        self._last = None
+
+    @property
+    def target(self):
+        return self.controller.target
+
+    def set_target(self, target: float):
+        """Change the target. The feed-forward duty cycle for the new target is applied straight away."""
+        with self._lock:
+            self.duty = self.controller.reset(target)
+            self.set_duty(self.duty)
+            self._last = self.clock()
+
+    def on_target(self):
+        """True if the last measured Γ was within tolerance of the target"""
+        return abs(self.target - self.measured) < self.tolerance
+
+    def step(self):
+        """Measure Γ and update the duty cycle once. Returns the duty cycle applied."""
+        measured = self.measure()
+        with self._lock:
+            now = self.clock()
+            if not np.isnan(measured):
+                self.measured = measured
+                self.duty = self.controller.update(measured, now - self._last)
+                self.set_duty(self.duty)
+            self._last = now
+            return self.duty
+
+    def start(self, target: float):
+        """Set target and start regulating in a background thread"""
+        if self.running():
+            raise RuntimeError("Regulator is already running")
+        self.set_target(target)
+        self.error = None
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        try:
+            while not self._stop.is_set():
+                self.sleep(self.interval)
+                if not self._stop.is_set():
+                    self.step()
+        except Exception as error:
+            self.error = error
+
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def stop(self):
+        """Stop regulating. The last duty cycle stays applied. Returns it. Raises the exception that stopped
+        regulation early, if there was one."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+            if self.error is not None:
+                raise self.error
+        return self.duty
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *args):
+        try:
+            self.stop()
+        except Exception:
+            # an exception from the with block takes precedence
+            if exc_type is None:
+                raise
@@ -0,0 +1,310 @@
+import inspect
+import os
+import secrets
+import sys
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+from multiprocessing.connection import Client, Listener
+
+from .settings import DAEMON
+
+'''
+Local daemon that keeps the shaker and stepper Arduinos open.
+
+Opening a port resets the Arduino, so Shaker() and StepperXY() take several seconds to start and quitting
+puts the shaker back into manual mode. The daemon opens them once and serves them to any number of client
+processes (notebooks, experiment scripts, analysis) on localhost. Connecting takes milliseconds.
+
+Clients authenticate with a key shared with the daemon. Messages are pickled, so anyone with the key can run code
+in the daemon: the key is read from the environment variable SHAKER_DAEMON_AUTHKEY or from DAEMON['AUTHKEY_FILE'],
+never from the repository. Create a random key file readable only by you once with
+
+    python -m shaker.daemon --new-key
+
+Start the daemon in its own terminal:
+
+    python -m shaker.daemon
+
+and use the devices from anywhere else:
+
+    with DaemonClient() as client:
+        shaker = client.device('shaker')
+        motors = client.device('motors')
+        shaker.set_duty(500)
+        motors.movexy(100, 0)
+        print(motors.x, motors.y)
+
+        with client.lock('shaker', 'motors'):
+            # no other client can use the shaker or motors until the block exits
+            balancer = Balancer(shaker, cam, motors, measure_fn=com_balls)
+
+Remote devices have the public methods and attributes of the real devices, except the methods in
+BLOCKED_METHODS that would close a port or hand the shaker back to manual control for every client. Every call
+holds the lock of its device, so commands from different clients are never interleaved on a serial port. lock
+holds devices for a whole sequence of calls. Locks held by a client are released if it disconnects.
+'''
+
+AUTHKEY_ENV = 'SHAKER_DAEMON_AUTHKEY'
+# Keys the daemon refuses to use. The first is the example key that used to be in settings.
+PLACEHOLDER_AUTHKEYS = (b'shaker_SETAUTHKEY', b'')
+
+# Methods that end the daemon's use of a device. Only the daemon calls them, when it exits.
+BLOCKED_METHODS = frozenset(('quit', 'close', 'switch_manual_mode'))
+
+
+class DaemonError(Exception):
+    """An exception raised by a device in the daemon"""
+
+
+def load_authkey():
+    """Key shared by the daemon and its clients from $SHAKER_DAEMON_AUTHKEY or DAEMON['AUTHKEY_FILE']"""
+    key = os.environ.get(AUTHKEY_ENV)
+    if key is not None:
+        return _check_authkey(key.encode())
+    filename = os.path.expanduser(DAEMON['AUTHKEY_FILE'])
+    try:
+        with open(filename, 'rb') as f:
+            return _check_authkey(f.read().strip())
+    except FileNotFoundError:
+        raise ValueError("No daemon authkey. Set " + AUTHKEY_ENV + " or create " + filename +
+                         " with python -m shaker.daemon --new-key") from None
+
+
+def new_authkey(filename=None):
+    """Write a random key to filename, readable only by the user. Defaults to DAEMON['AUTHKEY_FILE'].
+    Returns the key."""
+    filename = os.path.expanduser(DAEMON['AUTHKEY_FILE'] if filename is None else filename)
+    key = secrets.token_hex(32).encode()
+    fd = os.open(filename, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(key)
+    return key
+
+
+def _check_authkey(key):
+    if key in PLACEHOLDER_AUTHKEYS:
+        raise ValueError("Refusing to use the placeholder daemon authkey. Set " + AUTHKEY_ENV +
+                         " or create a key with python -m shaker.daemon --new-key")
+    return key
+
+
+class ShakerDaemon:
+    def __init__(self, devices, address=None, authkey=None):
+        """Serves devices to clients
+
+        devices : dict of name : device object e.g. {'shaker': Shaker(), 'motors': StepperXY()}
+        address : (host, port) to listen on. Defaults to DAEMON['ADDRESS']. Port 0 picks a free port.
+        authkey : bytes clients must know. Defaults to load_authkey().
+        """
+        self.devices = devices
+        self.locks = {name: threading.RLock() for name in devices}
+        self.authkey = load_authkey() if authkey is None else _check_authkey(authkey)
+        self.listener = Listener(DAEMON['ADDRESS'] if address is None else address, authkey=self.authkey)
+        self.address = self.listener.address
+        self._running = False
+        self._threads = []
+
+    def serve_forever(self):
+        self._running = True
+        while self._running:
+            try:
+                conn = self.listener.accept()
+            except Exception:
+                # failed authentication or listener closed
+                continue
+            if not self._running:
+                conn.close()
+                break
+            thread = threading.Thread(target=self._serve, args=(conn,), daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        self.listener.close()
+
+    def start(self):
+        """Serve in a background thread"""
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self._running = False
+        # wake up accept
+        try:
+            Client(self.address, authkey=self.authkey).close()
+        except Exception:
+            pass
+
+    def _serve(self, conn):
+        held = []
+        try:
+            while True:
+                try:
+                    op, device, name, args, kwargs = conn.recv()
+                except (EOFError, OSError):
+                    break
+                try:
+                    result = ('ok', self._handle(op, device, name, args, kwargs, held))
+                except Exception as error:
+                    result = ('error', type(error).__name__ + ': ' + str(error))
+                try:
+                    conn.send(result)
+                except (EOFError, OSError):
+                    break
+                except Exception as error:
+                    # result could not be pickled
+                    conn.send(('error', type(error).__name__ + ': ' + str(error)))
+        finally:
+            for device in held:
+                self.locks[device].release()
+            conn.close()
+
+    def _handle(self, op, device, name, args, kwargs, held):
+        if op == 'devices':
+            return {name: _describe(obj) for name, obj in self.devices.items()}
+        if op == 'shutdown':
+            self.stop()
+            return None
+        if device not in self.devices:
+            raise KeyError("No device " + str(device))
+        if op == 'acquire':
+            self.locks[device].acquire()
+            held.append(device)
+            return None
+        if op == 'release':
+            if device in held:
+                held.remove(device)
+                self.locks[device].release()
+            return None
+        if name.startswith('_'):
+            raise AttributeError("Private attribute " + name)
+        if name in BLOCKED_METHODS:
+            raise AttributeError(name + " would close " + device + " for every client and can only be called by "
+                                 "the daemon")
+        with self.locks[device]:
+            attr = getattr(self.devices[device], name)
+            if op == 'get':
+                return attr
+            if op == 'call':
+                result = attr(*args, **kwargs)
+                # e.g. Shaker.ramp(wait=False) carries on in the daemon after the call returns
+                return None if isinstance(result, Future) else result
+        raise ValueError("Unknown operation " + str(op))
+
+
+class DaemonClient:
+    def __init__(self, address=None, authkey=None):
+        """Connection to a ShakerDaemon. Defaults to DAEMON['ADDRESS'] in settings and load_authkey()."""
+        self.conn = Client(DAEMON['ADDRESS'] if address is None else address,
+                           authkey=load_authkey() if authkey is None else authkey)
+        # one request at a time on the connection when the client is shared between threads
+        self._lock = threading.Lock()
+        self._devices = None
+
+    def _request(self, op, device=None, name='', args=(), kwargs=None):
+        with self._lock:
+            self.conn.send((op, device, name, args, {} if kwargs is None else kwargs))
+            status, result = self.conn.recv()
+        if status == 'error':
+            raise DaemonError(result)
+        return result
+
+    def call(self, device, name, *args, **kwargs):
+        return self._request('call', device, name, args, kwargs)
+
+    def get(self, device, name):
+        return self._request('get', device, name)
+
+    def devices(self):
+        """dict of device name : {attribute name : True if callable}"""
+        if self._devices is None:
+            self._devices = self._request('devices')
+        return self._devices
+
+    def device(self, name):
+        """Proxy with the public methods and attributes of device name"""
+        return RemoteDevice(self, name, self.devices()[name])
+
+    @contextmanager
+    def lock(self, *devices):
+        """Hold devices for the duration of the block. Devices are acquired in sorted order, whatever order they
+        are given in, so two clients locking the same devices cannot deadlock."""
+        devices = sorted(devices)
+        acquired = []
+        try:
+            for device in devices:
+                self._request('acquire', device)
+                acquired.append(device)
+            yield
+        finally:
+            for device in reversed(acquired):
+                self._request('release', device)
+
+    def shutdown(self):
+        """Stop the daemon"""
+        self._request('shutdown')
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class RemoteDevice:
+    """Calls methods and reads attributes of a device in the daemon"""
+
+    def __init__(self, client, name, attributes):
+        self.__dict__.update(_client=client, _name=name, _attributes=attributes)
+
+    def __getattr__(self, attr):
+        if attr not in self._attributes:
+            raise AttributeError(self._name + " has no attribute " + attr)
+        if self._attributes[attr]:
+            return lambda *args, **kwargs: self._client.call(self._name, attr, *args, **kwargs)
+        return self._client.get(self._name, attr)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        # the daemon owns the device so leaving a with block does not close it
+        pass
+
+
+def _describe(obj):
+    # getattr_static so properties are not evaluated
+    names = [name for name in dir(obj) if not name.startswith('_') and name not in BLOCKED_METHODS]
+    return {name: callable(inspect.getattr_static(obj, name, None)) for name in names}
+
+
+if __name__ == "__main__":
+    from .shaker import Shaker
+    from .stepperXY import StepperXY
+
+    if '--new-key' in sys.argv:
+        new_authkey()
+        print('New daemon authkey written to ' + os.path.expanduser(DAEMON['AUTHKEY_FILE']))
+        sys.exit()
+    # fail before opening the ports if there is no key
+    authkey = load_authkey()
+
+    devices = {}
+    for name, device in (('shaker', Shaker), ('motors', StepperXY)):
+        try:
+            devices[name] = device()
+        except Exception as error:
+            print('Could not open ' + name + ' : ' + str(error))
+
+    daemon = ShakerDaemon(devices, authkey=authkey)
+    print('Serving ' + ', '.join(devices) + ' on ' + str(daemon.address))
+    try:
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for device in devices.values():
+            device.__exit__()
@@ -3,24 +3,25 @@ import matplotlib.pyplot as plt
 import numpy as np
 import moviepy.editor as mp
 from scipy.io.wavfile import read as wavread
+from shaker.analysis.tracking import read_tracking
 '''
 This script generates histograms of the magnitude of the global order parameter for 4 selected videos/.hdf5 files
 Requires 4 videos and their corresponding .hdf5 files from the particle tracking software
 '''
 
-def magnitude_hexatic(dataframe,framenumber):
+def magnitude_hexatic(filepath,framenumber):
     '''
-    Extracts the hexatic order from a pandas dataframe.
-    Calculates the magnitude of the order.
+    Extracts the hexatic order for one frame from a .hdf5 file.
+    Only the requested frame and column are read if the file is in table format.
 
     Inputs:
-    dataframe : pandas dataframe 
+    filepath : path to .hdf5 file
+    framenumber : frame to extract
 
     Outputs : 
     order : array of magnitudes of heaxtic_order param
     '''
-    framedata = dataframe.loc[[framenumber]]
-    mag_hexatic = framedata[["hexatic_order_abs"]]
+    mag_hexatic = read_tracking(filepath, frames=framenumber, columns=["hexatic_order_abs"])
     
     return mag_hexatic
 
@@ -61,25 +62,15 @@ video_file_2 = path+"19980010.MP4"
 video_file_3 = path+"19980020.MP4"
 video_file_4 = path+"19980029.MP4"
 
-data_frame_1 = pd.read_hdf(data_filename_1) #read in .hdf5 file
-data_frame_2 = pd.read_hdf(data_filename_2)
-data_frame_3 = pd.read_hdf(data_filename_3)
-data_frame_4 = pd.read_hdf(data_filename_4)
-
-data_frame_1.index.name='index' 
-data_frame_2.index.name="index"
-data_frame_3.index.name="index"
-data_frame_4.index.name="index"
-
 duty_1 = video_to_duty(video_file_1) /10   #calc duty from audio freq
 duty_2 = video_to_duty(video_file_2) /10
 duty_3 = video_to_duty(video_file_3) /10
 duty_4 = video_to_duty(video_file_4) /10
 
-order_1 = magnitude_hexatic(data_frame_1, framenumber)  #extract magnitude of hexatic order param from dataframe
-order_2 = magnitude_hexatic(data_frame_2, framenumber)
-order_3 = magnitude_hexatic(data_frame_3, framenumber)
-order_4 = magnitude_hexatic(data_frame_4, framenumber)
+order_1 = magnitude_hexatic(data_filename_1, framenumber)  #extract magnitude of hexatic order param from .hdf5 file
+order_2 = magnitude_hexatic(data_filename_2, framenumber)
+order_3 = magnitude_hexatic(data_filename_3, framenumber)
+order_4 = magnitude_hexatic(data_filename_4, framenumber)
 
 fig, ((ax1,ax2),(ax3,ax4)) = plt.subplots(2,2, sharey=True)    #plot distributions of 3 selected videos
 
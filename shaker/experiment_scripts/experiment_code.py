@@ -1,31 +1,25 @@
-import numpy as np
-import time
-from tqdm import tqdm
 from shaker.shaker import Shaker
-from labequipment.arduino import Arduino
-from shaker.settings import accelerometer_shaker
+from shaker.accelerometer import AccelerometerReader
+from shaker.schedule import ScheduleRunner, cooling_sweep, adaptive_sweep
+from shaker.settings import update_settings_file, SETTINGS_com_balls
+from shaker.centre_mass import frame_order
+import numpy as np
 '''
 This script runs an experiment on the shaker.
 It sets the duty, records the current acceleration of the shaker, records a video of the shaker 
 and saves the acceleration data to a file.
+The experiment is described by a schedule (see shaker.schedule) which is executed against absolute times.
+The accelerometer is read continuously in the background and the full stream, together with
+the time of every action, is saved alongside the acceleration data.
+
+If ADAPTIVE is True the sweep starts on a grid of COARSE_STEP and then adds recordings where the
+order changes fastest until MAX_RECORDINGS have been made, so the recordings cluster around the melting transition.
+The order is estimated after each recording from a frame of the live camera (see shaker.centre_mass.frame_order)
+inside the boundary in the settings file. Each point is still approached by ramping down, from the previous point
+if it was higher or from START otherwise. The acceleration data file is written in the order the videos were
+recorded, as for the uniform sweep, so that it lines up with the videos. The duty cycles are therefore not in
+order: set GROUP_BY = 'duty' in phase_diagram_analysis.py so runs are averaged at each duty cycle.
 '''
-def pk_acceleration(ard):
-    """
-    This function reads data from RPi Pico accelerometer and outputs current
-    peak z-acceleration reading.
-
-    ----Input: ----
-    Object: Reads data from RPi Pico
-
-    ----Returns: ----
-    peak_z [float] : Peak accleration measured. (Γ)
-    
-    """
-    ard.flush()
-    line = ard.read_serial_line()
-    data_vals = line.split(',')
-    peak_z = float(data_vals[-1])
-    return peak_z
 
 if __name__ == '__main__':
     START = 710
@@ -33,21 +27,40 @@ if __name__ == '__main__':
     STEP = -5
     RATE = 0.25
 
-    with Shaker() as shaker_obj, Arduino(accelerometer_shaker) as acc_obj:
-        duties = np.arange(START,END,STEP)    #create arrays of duty values
-        acc = []
-        d0 = START+5  #initial duty value
-
-        for duty in tqdm(duties):   #perform experiment (cooling cycle)
-            shaker_obj.ramp(d0, duty, RATE, -1) 
-            shaker_obj.set_duty(duty)   #set duty
-            time.sleep(6)
-            acceleration = pk_acceleration(acc_obj) #record acceleration
-            acc.append(acceleration) 
-            shaker_obj.set_duty_and_record(duty)    #start recording
-            time.sleep(3)
-            shaker_obj.set_duty_and_record(duty)    #stop recording
-            time.sleep(1)
-            d0 = duty
-    
-    np.savetxt("acceleration_data_3.txt", acc, delimiter=",")   #save acceleration data
\ No newline at end of file
+    ADAPTIVE = False
+    COARSE_STEP = -20
+    MAX_RECORDINGS = 15
+
+    with Shaker() as shaker_obj, AccelerometerReader() as acc_obj:
+        runner = ScheduleRunner(shaker_obj, acc_obj)
+
+        if ADAPTIVE:
+            from labvision.camera import Camera
+            from shaker.centre_mass import panasonic
+            cam = Camera(cam_type=panasonic)
+            boundary_pts = update_settings_file()['boundary_pts'][0]
+            d0 = [START - STEP]
+            gammas = {}
+
+            def measure(duty):
+                if duty > d0[0]:
+                    shaker_obj.set_duty(START - STEP)   #remelt before approaching from above
+                    d0[0] = START - STEP
+                schedule = cooling_sweep(duty, duty - 1, -1, RATE, settle_time=6, record_time=3, gap=1, measure=2)
+                schedule[0]['start'] = int(d0[0])
+                d0[0] = duty
+                gammas[duty] = runner.run(schedule)[0][1]
+                #the shaker stays at duty after the recording so the frame shows the state that was recorded
+                return frame_order(cam.get_frame(), boundary_pts, img_settings=SETTINGS_com_balls['img_processing'])
+
+            duties, _ = adaptive_sweep(measure, START, END, COARSE_STEP, min_step=abs(STEP), max_points=MAX_RECORDINGS)
+            acc = [gammas[duty] for duty in duties]
+        else:
+            schedule = cooling_sweep(START, END, STEP, RATE, settle_time=6, record_time=3, gap=1, measure=2)
+            measurements = runner.run(schedule)     #perform experiment (cooling cycle)
+            acc = [acceleration for _, acceleration in measurements]
+
+        runner.save_log("schedule_log_3.csv")   #save scheduled and actual time of every action
+        acc_obj.save("acceleration_stream_3.csv")   #save full accelerometer stream and events
+
+    np.savetxt("acceleration_data_3.txt", acc, delimiter=",")   #save acceleration data
@@ -1,71 +1,96 @@
+import os
+import re
+import sys
+import glob
 import numpy as np
 import matplotlib.pyplot as plt
-import filehandling
+from shaker.analysis.manifest import Manifest
+from shaker.analysis.runstore import RunStore
 '''
 This script deal with the averaging and plotting of data from a shaker experiment.
-It requires data files (.txt) generated by the process_data.py file (text files containing: [global order param],[duty] stacked in columns)
-This script also requires acceleration data files (.txt) generated by the experiment code scripts.
-This calculates the mean and st. deviation of the acceleration, global order param and the duty then plots a graph of the global order param 
-against the acceleration.
-The script then calculates the acceleration corresponding to the mean of the order parameter.
-The order and acceleration data is saved to a .txt file.
+It requires data files (data_N.txt) generated by the process_data.py file (text files containing: [global order param],[duty] stacked in columns)
+and the acceleration data files (acceleration_data_N.txt) generated by the experiment code scripts in the same folder.
+The area fraction is taken from the folder name e.g. videos/08_02_area_f_0.599/set_1/
+
+Every run found below root is added to a single columnar store (runs.npz). Only runs whose files are new or have
+changed since the last time the script was run are loaded. The mean and st. deviation of the acceleration, global order
+param and the duty are then calculated for every area fraction in one pass, together with the acceleration corresponding
+to the middle of the order parameter range with a bootstrap confidence interval. The global order param is plotted against acceleration for every area fraction.
 
 '''
-path="videos/08_02_area_f_0.599/"
+MIN_STEP = 1    #first point of every run is measured straight after the initial ramp and is discarded
+GROUP_BY = 'step'   #'duty' for runs from adaptive sweeps, which visit different duty cycles in a different order
 
-def order_mid(ydata):
+def area_fraction(path):
     '''
-    Calculates the middle of the global order parameter data
+    Extracts the area fraction from a folder name containing area_f_<area fraction>
     '''
-    global_order_mid = (max(ydata)-min(ydata)) / 2 + min(ydata)
-    return global_order_mid
-
-#load in acc data + duty cycles + counts 
-data1 = np.loadtxt(path+"data_1.txt", dtype=float)
-data2 = np.loadtxt(path+"data_2.txt", dtype=float)
-data3 = np.loadtxt(path+"data_3.txt", dtype=float)
-#data4 = np.loadtxt(path+"data_4.txt", dtype=float)
-#data5 = np.loadtxt(path+"data_5.txt", dtype=float)
-
-acc_1 = np.loadtxt(path+"acceleration_data_1.txt", dtype=float)
-acc_2 = np.loadtxt(path+"acceleration_data_2.txt", dtype=float)
-acc_3 = np.loadtxt(path+"acceleration_data_3.txt", dtype=float)
-#acc_4 = np.loadtxt(path+"acceleration_data_4.txt", dtype=float)
-#acc_5 = np.loadtxt(path+"acceleration_data_5.txt", dtype=float)
+    match = re.search(r'area_f_([0-9]*\.?[0-9]+)', path.replace('\\', '/'))
+    if match is None:
+        raise ValueError("No area fraction in path: " + path)
+    return float(match.group(1))
 
-#stack data columns
-order_data = np.stack((data1[:,0], data2[:,0], data3[:,0]), axis=1)
-acc_data = np.stack((acc_1, acc_2, acc_3), axis=1)
-duty_data = np.stack((data1[:,1], data2[:,1], data3[:,1]), axis=1)
+def update_store(root, store, manifest):
+    '''
+    Adds every run below root whose data or acceleration file has changed to the store.
+    Each run is assigned an id the first time it is seen which is kept in the manifest.
+    Returns the number of runs added or updated.
+    '''
+    updated = 0
+    for data_file in sorted(glob.glob(os.path.join(root, "**", "data_*.txt"), recursive=True)):
+        path, filename = os.path.split(data_file)
+        acc_file = os.path.join(path, "acceleration_" + filename)
+        if not os.path.exists(acc_file):
+            continue
+        inputs = [data_file, acc_file]
+        product = manifest.relpath(data_file) + ":runstore"
+        if not manifest.is_stale(product, inputs, outputs=[store.filepath]):
+            continue
 
-#calc mean and std
-mean_order = np.mean(order_data, axis=1)
-std_order = np.std(order_data, axis=1)
-mean_duty = np.mean(duty_data, axis=1)
-std_duty = np.std(duty_data, axis=1)
-mean_acc = np.mean(acc_data, axis=1)
-std_acc = np.std(acc_data, axis=1)
+        phi = area_fraction(path)
+        if product in manifest.products:
+            run = manifest.result(product)
+        else:
+            runs = store['run'][store['area_fraction'] == phi]
+            run = int(runs.max()) + 1 if len(runs) else 0
 
-#plotting
-fig, (ax1) = plt.subplots(1,1, figsize=(12,8), sharey=False)
-ax1.errorbar(mean_acc[1:], mean_order[1:], yerr=std_order[1:], fmt="b^", ecolor="k", capsize=1, label="data")
-ax1.set_xlabel("Acceleration $\Gamma$", fontsize=20)
-ax1.set_ylabel("|$\Psi_6$|", fontsize=20)
+        data = np.loadtxt(data_file, dtype=float, ndmin=2)
+        acc = np.loadtxt(acc_file, dtype=float, ndmin=1)
+        if len(acc) != len(data):
+            raise ValueError(acc_file + " and " + data_file + " have different numbers of measurements")
+        store.add_run(phi, run, duty=data[:, 1], gamma=acc, order=data[:, 0])
+        manifest.record(product, inputs, result=run)
+        updated += 1
+    return updated
 
-midpoint_order = order_mid(mean_order[1:])
+if __name__ == '__main__':
+    root = sys.argv[1] if len(sys.argv) > 1 else "videos/"
 
-fit_xdata = ax1.lines[0].get_xdata()    #find x data of fit
-fit_ydata = ax1.lines[0].get_ydata()    #find y data of fit 
-x_interp = round(np.interp(midpoint_order, fit_ydata, fit_xdata), 4)    #interpolate points to find $\Gamma$ at avg global order param.
-ax1.plot(x_interp, midpoint_order, "go", label="$\Gamma$ at avg $|\Psi_6|$")
+    store = RunStore(os.path.join(root, "runs.npz"))
+    manifest = Manifest(os.path.join(root, "manifest.json"))
+    if update_store(root, store, manifest):
+        store.save()
+        manifest.save()
 
-print("$\Gamma$=", x_interp)
-print("midpoint of order= ", midpoint_order)
-data = np.vstack((mean_order,std_order, mean_acc,std_acc)) #stack global order params and acc data
-np.savetxt("order_acc_0.599.txt", data)    #save .txt file of orders and acc
+    area_fractions, curves = store.curves(min_step=MIN_STEP, by=GROUP_BY)
+    _, gamma_transition, order_mid = store.transitions(min_step=MIN_STEP, by=GROUP_BY)
+    _, _, lower, upper = store.bootstrap_transitions(min_step=MIN_STEP, by=GROUP_BY)  #95% confidence interval by resampling runs
 
-plt.xticks(fontsize=18)
-plt.yticks(fontsize=18)
-plt.legend()
-plt.show()
+    #plotting
+    fig, (ax1) = plt.subplots(1,1, figsize=(12,8), sharey=False)
+    for i, phi in enumerate(area_fractions):
+        line = ax1.errorbar(curves['gamma_mean'][i], curves['order_mean'][i], xerr=curves['gamma_std'][i],
+                            yerr=curves['order_std'][i], fmt="^", capsize=1, label="$\phi$="+str(phi))
+        #the percentile interval need not contain the estimate from all the runs so the error bars are clipped at 0
+        xerr = np.clip([[gamma_transition[i]-lower[i]], [upper[i]-gamma_transition[i]]], 0, None)
+        ax1.errorbar(gamma_transition[i], order_mid[i], xerr=xerr,
+                     fmt="o", color=line[0].get_color(), markeredgecolor="k", capsize=3)
+        print("$\phi$=", phi, "$\Gamma$=", round(gamma_transition[i], 4), "95% CI= ", (round(lower[i], 4), round(upper[i], 4)),
+              "midpoint of order= ", order_mid[i])
+    ax1.set_xlabel("Acceleration $\Gamma$", fontsize=20)
+    ax1.set_ylabel("|$\Psi_6$|", fontsize=20)
 
+    plt.xticks(fontsize=18)
+    plt.yticks(fontsize=18)
+    plt.legend()
+    plt.show()
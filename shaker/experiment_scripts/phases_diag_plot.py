@@ -1,24 +1,34 @@
+import sys
 import numpy as np
 import matplotlib.pyplot as plt
 import scipy.optimize as opt
+from shaker.analysis.runstore import RunStore
 '''
 This script plots the phase diagram.
-Requires a .txt file contining the area fraction and acceleration data.
+Requires the run store (runs.npz) built by phase_diagram_analysis.py. The acceleration at the transition
+is calculated for every area fraction from the store, with error bars from bootstrap resampling of the runs.
 '''
+MIN_STEP = 1    #first point of every run is measured straight after the initial ramp and is discarded
+
 def polynomial(x,a,b,c):
     return a*x**2+b*x+c
 
-data = np.loadtxt("code_files_phase_transitions/phase_diagram_data.txt")
-phi = data[0,:]
-gamma = data[1,:]
+store = RunStore(sys.argv[1] if len(sys.argv) > 1 else "videos/runs.npz")
+phi, gamma, lower, upper = store.bootstrap_transitions(min_step=MIN_STEP)    #95% confidence interval by resampling runs
+#no interval when no resample of the runs crosses the middle of the order
+found = ~(np.isnan(gamma) | np.isnan(lower) | np.isnan(upper))
+phi = phi[found]
+gamma = gamma[found]
+#the percentile interval need not contain the estimate from all the runs so the error bars are clipped at 0
+gamma_err = np.clip(np.stack((gamma - lower[found], upper[found] - gamma)), 0, None)
 
 fig, (ax) = plt.subplots(1,1,figsize=(12,8))
 
-popt, pcov = opt.curve_fit(polynomial, phi, gamma)
+popt, pcov = opt.curve_fit(polynomial, phi, gamma, sigma=np.maximum(gamma_err.mean(axis=0), 1e-6))
 perr = np.sqrt(np.diag(pcov))
 print(perr)
 ax.plot(phi, polynomial(phi, *popt), "k", linestyle="--")
-ax.plot(phi,gamma,".", markersize=10)
+ax.errorbar(phi,gamma,yerr=gamma_err,fmt=".", markersize=10, capsize=3)
 ax.set_xlabel("Area Fraction, $\phi$", fontsize=20)
 ax.set_ylabel("Dimensionless Acceleration, $\Gamma$", fontsize=20)
 
@@ -1,11 +1,18 @@
-import filehandling
 import numpy as np
 import pandas as pd
 import os
+import sys
+import glob
+import hashlib
 from tqdm import tqdm
 import matplotlib.pyplot as plt
 import moviepy.editor as mp
 from scipy.io.wavfile import read as wavread
+from shaker.analysis.tracking import read_tracking, convert_to_table, frame_order_stats
+from shaker.audio_duty import frame_frequency, convert_audio_frequency_to_duty_cycle
+from shaker.analysis.manifest import Manifest
+from shaker.analysis.hexatic import hexatic_order
+from shaker.settings import update_settings_file
 
 '''
 This script requires .hdf5 data files generated from the particle tracking software with specific postprocessing methods:
@@ -18,22 +25,70 @@ files generated by the experiment code script.
 
 This script will generate and save a .txt file containing columns containing: [global order param] [duty cycle]
 
+The data is expected to be organised as root/.../set_N/ folders, each containing the videos, .hdf5 files
+and acceleration_data_N.txt for one run. data_N.txt is written into each set folder. A manifest.json in root
+records the fingerprints of the files that fed each result so that rerunning
+
+    python process_data.py root [--all-frames] [--convert] [--boundary]
+
+only reprocesses videos that are new or have changed and only rewrites the data files of the sets affected.
+With --convert the .hdf5 files of the videos processed are rewritten in table format first
+(see shaker.analysis.tracking.convert_to_table) so that later reads only load the frames and columns used.
+The tracking files are only modified when --convert is given.
+
+With --boundary the local order is recalculated from the particle positions and particles at the boundary stored in
+the settings file (update_settings_file()['boundary_pts']) are left out (see shaker.analysis.hexatic).
+Results with and without the boundary, or with different boundaries, are kept separately in the manifest.
+
+By default the global order param is calculated from the first frame of each video. If framenumber is None every frame
+is used: the per frame global order param and duty cycle are saved to <video>_timeseries.csv and the values in the
+data file are averaged over the whole video.
+
 '''
-def hexatic(dataframe,framenumber):
+def read_order(filepath, frames=None, boundary_pts=None):
+    '''
+    Reads hexatic_order_abs for the requested frames from a .hdf5 file.
+    If boundary_pts is given the order is recalculated from the particle positions
+    (see shaker.analysis.hexatic) instead of using the values from the tracking software.
     '''
-    Extracts the hexatic order from a pandas dataframe.
-    Calculates the magnitude of the order.
+    if boundary_pts is None:
+        return read_tracking(filepath, frames=frames, columns=["hexatic_order_abs"])
+    positions = read_tracking(filepath, frames=frames, columns=["x", "y"])
+    return hexatic_order(positions, boundary_pts=boundary_pts)[["hexatic_order_abs"]]
+
+def hexatic(filepath,framenumber,boundary_pts=None):
+    '''
+    Extracts the hexatic order for one frame from a .hdf5 file.
+    Only the requested frame and the hexatic_order_abs column are read from disk
+    if the file is in table format (see shaker.analysis.tracking.convert_to_table).
 
     Inputs:
-    dataframe : pandas dataframe 
+    filepath : path to .hdf5 file
+    framenumber : frame to extract
+    boundary_pts : optional boundary polygon. If given the order is recalculated from the particle positions.
 
     Outputs : 
     order : array of magnitudes of heaxtic_order param
     '''
-    framedata = dataframe.loc[[framenumber]]
-    hexatic = framedata[["hexatic_order_abs"]]
+    hexatic = read_order(filepath, frames=framenumber, boundary_pts=boundary_pts)
     return hexatic
 
+def read_video_audio(video_filepath):
+    '''
+    Extracts audio information from .MP4 file using scipy.io.wavfile.
+
+    Returns:
+    rate : audio sample rate
+    audio_array : numpy array of audio from the first channel
+    num_frames : number of video frames
+    '''
+    clip = mp.VideoFileClip(video_filepath)
+    clip.audio.write_audiofile("audio_out.wav") #write audio file from .MP4
+    rate, data = wavread("audio_out.wav")   #read audio file
+    num_frames = int(round(clip.fps * clip.duration))
+    clip.close()
+    return rate, data[:,0], num_frames  #discard channel information
+
 def video_to_duty(video_filepath):
     '''
     Returns duty cycle from audio of .MP4 file
@@ -47,10 +102,7 @@ def video_to_duty(video_filepath):
     duty : duty cycle (as a percentage)
 
     '''
-    clip = mp.VideoFileClip(video_filepath)
-    clip.audio.write_audiofile("audio_out.wav") #write audio file from .MP4
-    rate, data = wavread("audio_out.wav")   #read audio file
-    audio_array = data[:,0] #discard channel information
+    rate, audio_array, _ = read_video_audio(video_filepath)
     
     ft = np.abs(np.fft.fft(audio_array, n=len(audio_array))) #fourier transform audio signal
     freq = np.fft.fftfreq(len(audio_array), 1/rate)
@@ -59,39 +111,110 @@ def video_to_duty(video_filepath):
     duty = (peak - 1000) / 15   #duty cycle conversion
     return duty
 
-if __name__ == '__main__':
+def order_time_series(filepath, boundary_pts=None):
+    '''
+    Calculates the global order param (mean, st. deviation and number of particles) and the duty cycle of every frame
+    of one video in a single pass. Only the hexatic_order_abs column is read from the .hdf5 file and the audio is
+    split into one chunk per video frame to get the duty cycle of each frame.
+    filepath is the path to the .hdf5 file without extension. The .MP4 file must have the same name.
 
-    path = "videos/08_02_area_f_0.598/set_3/" #specify filepath and file names
-    acc_file = "acceleration_data_3.txt"    #acceleration data
-    data_file = "data_3.txt"    #name of file to store data in
-
-    directory = filehandling.open_directory(path)   #create file directory and select files
-    files = filehandling.get_directory_filenames(directory+"/*.hdf5")
-    acceleration_data = np.loadtxt(path+acc_file, dtype=float)    #load in acc data
-
-    dutys = []  #initalise empty arrays and params
-    global_orders = []
-    framenumber = 0
-
-    if True:
-        for file in tqdm(files):
-            #asign filename and filepath
-            filename = os.path.splitext(os.path.split(file)[1])[0]
-            filepath = path+filename+".hdf5"
-            dataframe = pd.read_hdf(filepath)   #read .hdf5 file
-            
-            dataframe.index.name='index'    #set dataframe index to "index"
-
-            order = hexatic(dataframe, framenumber)   #extract mag of hexatic order param from dataframe
-            global_order = np.mean(order)   #calc global order param (mean of local param)
-            global_orders.append(global_order)    #append to array
-            
-            duty = video_to_duty(path+filename+".MP4")  #calculate duty from freq of audio signal
-            dutys.append(duty)          #append to array
-            
-        global_orders = np.transpose(np.array([global_orders]))   #create columns of data in numpy arrays
-        dutys = np.transpose(np.array([dutys]))
-
-        data = np.hstack((global_orders,dutys)) #stack global order params and duty data
-        np.savetxt(path+data_file, data)    #save .txt file of counts and duty
-        print("data saved to: ", path+data_file)
\ No newline at end of file
+    Returns:
+    dataframe indexed by frame with columns duty, order_mean, order_std, count
+    '''
+    stats = frame_order_stats(read_order(filepath+".hdf5", boundary_pts=boundary_pts))
+    rate, audio_array, num_frames = read_video_audio(filepath+".MP4")
+    duty = convert_audio_frequency_to_duty_cycle(frame_frequency(audio_array, num_frames, rate))
+    duty = pd.Series(duty, index=pd.Index(np.arange(num_frames), name='frame'), name='duty')
+    return stats.join(duty)[['duty', 'order_mean', 'order_std', 'count']]
+
+def process_video(filepath, framenumber=0, convert=False, boundary_pts=None):
+    '''
+    Calculates global order param and duty cycle for one video.
+    filepath is the path to the .hdf5 file without extension. The .MP4 file must have the same name.
+    If framenumber is None the values are averaged over every frame and the time series is saved.
+    If convert the .hdf5 file is first rewritten in table format so later reads only load the frames and columns used.
+    If boundary_pts is given particles at the boundary are left out of the global order param.
+    '''
+    if convert:
+        convert_to_table(filepath+".hdf5")
+    if framenumber is None:
+        time_series = order_time_series(filepath, boundary_pts=boundary_pts)
+        time_series.to_csv(filepath+"_timeseries.csv")
+        return float(time_series['order_mean'].mean()), float(time_series['duty'].median())
+
+    order = hexatic(filepath+".hdf5", framenumber, boundary_pts=boundary_pts)   #extract mag of hexatic order param from .hdf5 file
+    global_order = float(np.nanmean(order.values))   #calc global order param (mean of local param), boundary particles are nan
+    duty = float(video_to_duty(filepath+".MP4"))  #calculate duty from freq of audio signal
+    return global_order, duty
+
+def boundary_key(boundary_pts):
+    '''
+    Part of the manifest product names that identifies the boundary used so that results with different boundaries
+    are not mixed up.
+    '''
+    if boundary_pts is None:
+        return ""
+    pts = [[int(round(pt[0])), int(round(pt[1]))] for pt in boundary_pts]
+    return ":boundary_" + hashlib.md5(str(pts).encode()).hexdigest()[:8]
+
+def process_set(path, manifest, framenumber=0, convert=False, boundary_pts=None):
+    '''
+    Generates data_N.txt for the set folder path (ending in set_N/).
+    Videos are only processed if they are not in the manifest or their files have changed.
+    Returns True if data_N.txt was rewritten.
+    '''
+    set_number = os.path.basename(os.path.normpath(path)).split('_')[-1]
+    acc_file = path+"acceleration_data_"+set_number+".txt"    #acceleration data
+    data_file = path+"data_"+set_number+".txt"    #name of file to store data in
+    frames = ":frame_" + ("all" if framenumber is None else str(framenumber))   #results depend on frames used
+    frames += boundary_key(boundary_pts)    #and on the boundary
+
+    filepaths = [os.path.splitext(file)[0] for file in sorted(glob.glob(path+"*.hdf5"))]
+    set_inputs = [filepath+ext for filepath in filepaths for ext in (".hdf5", ".MP4")]
+    if os.path.exists(acc_file):
+        set_inputs.append(acc_file)
+    if not manifest.is_stale(manifest.relpath(data_file)+frames, set_inputs, outputs=[data_file]):
+        return False
+
+    data = []
+    for filepath in tqdm(filepaths):
+        product = manifest.relpath(filepath)+frames
+        inputs = [filepath+".hdf5", filepath+".MP4"]
+        outputs = [filepath+"_timeseries.csv"] if framenumber is None else []
+        if manifest.is_stale(product, inputs, outputs=outputs):
+            manifest.record(product, inputs, result=process_video(filepath, framenumber, convert=convert,
+                                                                    boundary_pts=boundary_pts))
+            manifest.save()     #save progress after every video
+        data.append(manifest.result(product))
+
+    np.savetxt(data_file, np.array(data).reshape(-1, 2))    #save .txt file of global order and duty
+    manifest.record(manifest.relpath(data_file)+frames, set_inputs)
+    manifest.save()
+    print("data saved to: ", data_file)
+    return True
+
+def analyse(root, framenumber=0, convert=False, boundary=False):
+    '''
+    Brings every set_N folder below root up to date, recomputing only the outputs whose inputs have changed.
+    boundary is False to use the order from the tracking software, True to leave out particles at the boundary in the
+    settings file or a list of (x, y) points of the boundary polygon.
+    Returns a list of the set folders whose data files were rewritten.
+    '''
+    if boundary is True:
+        boundary = update_settings_file()['boundary_pts'][0]
+    boundary_pts = boundary if boundary is not False else None
+    manifest = Manifest(os.path.join(root, "manifest.json"))
+    set_paths = sorted(glob.glob(os.path.join(root, "**", "set_*", ""), recursive=True))
+    if os.path.basename(os.path.normpath(root)).startswith("set_"):
+        set_paths = [os.path.join(root, "")]
+    return [path for path in set_paths
+            if process_set(path, manifest, framenumber, convert=convert, boundary_pts=boundary_pts)]
+
+if __name__ == '__main__':
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    root = args[0] if args else "videos/"  #folder containing set_N folders
+    framenumber = None if "--all-frames" in sys.argv else 0    #use every frame of each video
+    convert = "--convert" in sys.argv    #rewrite the .hdf5 files in table format
+    boundary = "--boundary" in sys.argv     #leave out particles at the boundary in the settings file
+    updated = analyse(root, framenumber=framenumber, convert=convert, boundary=boundary)
+    print(str(len(updated))+" sets updated")
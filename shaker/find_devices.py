@@ -1,4 +1,3 @@
-import win32com
 from enum import Enum
 
 class DeviceType(Enum):
@@ -16,6 +15,9 @@ def get_device_devices_on_windows(show=True):
     Builds a list of all devices in order specified by system. Assumes you don't have
     devices that are unlisted in DeviceType plugged in.
     """
+    # Windows only so imported here
+    import win32com.client
+
     wmi = win32com.client.GetObject("winmgmts:")
     device_names = [device.value['name'] for _, device in DeviceType.__members__.items()]
     device_types = [devicetype for _, devicetype in DeviceType.__members__.items()]
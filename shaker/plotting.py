@@ -1,10 +1,13 @@
+import os
+import time
+from functools import lru_cache
 import numpy as np
 import matplotlib.pyplot as plt
-from scipy.interpolate import griddata
+from matplotlib.collections import LineCollection
+from scipy.interpolate import CloughTocher2DInterpolator
 from matplotlib import gridspec
 from matplotlib.image import imread
 import cv2
-from IPython.display import display, clear_output
 
 
 def draw_img_axes(img):
@@ -21,22 +24,129 @@ def draw_img_axes(img):
         0.05*sz[1]), int(0.725*sz[0])), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 3)
     return img
 
-def update_plot(fig, ax, track_levelling):
-    x = range(len(track_levelling))
-    ax.errorbar(x[-1], track_levelling[-1][-2], yerr=track_levelling[-1][-1],
-                        fmt='o', ecolor='black', elinewidth=1, markerfacecolor='red', markeredgecolor='black')
-    ax.set_title('Levelling progress plot')
-    ax.set_xlabel('Iteration')
-    ax.set_ylabel('Cost')
-    display(fig)
-    clear_output(wait=True)
+class LevellingMonitor:
+    """Live plot of the cost of each levelling evaluation.
 
+    The points and error bars are persistent artists whose data is replaced on each update. Only these
+    artists are redrawn over a cached background (blitting), so an update costs about the same however long
+    the levelling has been running. The whole figure is only redrawn when the axes limits have to grow,
+    which happens a logarithmic number of times. Updates closer together than min_interval seconds only
+    store the data and are drawn with the next update.
+    """
+
+    def __init__(self, fig=None, ax=None, min_interval=0.5):
+        if ax is None:
+            plt.ion()
+            fig, ax = plt.subplots(nrows=1, ncols=1, figsize=(6, 6))
+        self.fig, self.ax = fig, ax
+        self.min_interval = min_interval
+        self._last_draw = 0
+
+        self.points, = ax.plot([], [], 'o', markerfacecolor='red', markeredgecolor='black', animated=True)
+        self.errors = LineCollection([], colors='black', linewidths=1, animated=True)
+        ax.add_collection(self.errors)
+        ax.set_title('Levelling progress plot')
+        ax.set_xlabel('Iteration')
+        ax.set_ylabel('Cost')
+        ax.set_xlim(0, 10)
+        ax.set_ylim(0, 1)
+
+        self.blit = fig.canvas.supports_blit
+        self.background = None
+        fig.canvas.mpl_connect('draw_event', self._on_draw)
+        fig.canvas.draw()
+        plt.show(block=False)
+
+    def _on_draw(self, event):
+        self.background = self.fig.canvas.copy_from_bbox(self.fig.bbox)
+        self._draw_artists()
+
+    def _draw_artists(self):
+        self.ax.draw_artist(self.errors)
+        self.ax.draw_artist(self.points)
+
+    def update(self, track_levelling, force=False):
+        """track_levelling is the list of levelling rows. The last two columns are the cost and its error."""
+        data = np.array(track_levelling, dtype=float)
+        x = np.arange(len(data))
+        cost, err = data[:, -2], data[:, -1]
+        self.points.set_data(x, cost)
+        self.errors.set_segments(np.stack((np.stack((x, cost - err), axis=1),
+                                           np.stack((x, cost + err), axis=1)), axis=1))
+
+        now = time.time()
+        if not force and now - self._last_draw < self.min_interval:
+            return
+        self._last_draw = now
+
+        xmax = self.ax.get_xlim()[1]
+        ymax = self.ax.get_ylim()[1]
+        if x[-1] >= xmax or np.max(cost + err) > ymax:
+            # Grow limits geometrically so full redraws are rare
+            self.ax.set_xlim(0, max(xmax, 2 * x[-1]))
+            self.ax.set_ylim(0, max(ymax, 1.5 * np.max(cost + err)))
+            self.fig.canvas.draw()
+        elif self.blit and self.background is not None:
+            self.fig.canvas.restore_region(self.background)
+            self._draw_artists()
+            self.fig.canvas.blit(self.fig.bbox)
+        else:
+            self.fig.canvas.draw_idle()
+        self.fig.canvas.flush_events()
+
+
+@lru_cache(maxsize=8)
+def _load_levelling(filepath, mtime):
+    """Load a track_levelling file and build the cubic interpolant of its cost surface. Cached until the file changes."""
+    data = np.atleast_2d(np.loadtxt(filepath, delimiter=','))
+    interpolant = CloughTocher2DInterpolator(data[:, :2], data[:, 4])
+    return data, interpolant
+
+
+def load_levelling(filepath):
+    """Returns the track_levelling data and a cached interpolant of the cost as a function of motor position"""
+    return _load_levelling(filepath, os.path.getmtime(filepath))
+
+
+def levelling_surface(x_motor, y_motor, interpolant=None, motor_step=1, max_points=300, result_gp=None):
+    """Evaluate the levelling cost surface on a grid and find its minimum
+
+    The grid resolution scales with the number of observations (a surface through N scattered points has
+    no more than ~sqrt(N) features per axis) and is never finer than the motor step size.
+
+    x_motor, y_motor : motor positions of the observations
+    interpolant : callable interpolant of the cost e.g. from load_levelling
+    motor_step : smallest motor step that is worth resolving
+    max_points : maximum grid points per axis
+    result_gp : optional result of gp_minimize. If given the mean of its final gaussian process surrogate is used
+    instead of the interpolant.
+
+    Returns xi, yi, cost_i, (x_min, y_min)
+    """
+    n = int(np.clip(20 * np.sqrt(np.size(x_motor)), 50, max_points))
+    nx = int(min(n, (np.max(x_motor) - np.min(x_motor)) / motor_step + 1))
+    ny = int(min(n, (np.max(y_motor) - np.min(y_motor)) / motor_step + 1))
+    xi = np.linspace(np.min(x_motor), np.max(x_motor), max(nx, 2))
+    yi = np.linspace(np.min(y_motor), np.max(y_motor), max(ny, 2))
+    xi, yi = np.meshgrid(xi, yi)
+
+    if result_gp is not None:
+        pts = np.column_stack((xi.ravel(), yi.ravel())).tolist()
+        cost_i = result_gp.models[-1].predict(result_gp.space.transform(pts)).reshape(xi.shape)
+    else:
+        cost_i = interpolant(xi, yi)
 
-def plot_levelling(folder, tracking_filename, img_filename):
+    min_index = np.nanargmin(cost_i.ravel())
+    return xi, yi, cost_i, (xi.ravel()[min_index], yi.ravel()[min_index])
+
+
+def plot_levelling(folder, tracking_filename, img_filename, result_gp=None, motor_step=1):
     """Takes a track_levelling file and plots the data in 2D and 3D. The first three columns of the file are assumed to be x, y, and z coordinates. The first subplot is a scatter plot of the z coordinates against the row number. The second subplot is a 3D surface plot of the x, y, and z coordinates.
     folder should end in a /
+    result_gp is the optional result returned by Balancer.level. If supplied the surface is the gaussian process surrogate rather than an interpolation of the data.
+    motor_step is the smallest motor step worth resolving on the surface.
     """
-    track_levelling = np.loadtxt(folder + tracking_filename, delimiter=',')
+    data, interpolant = load_levelling(folder + tracking_filename)
 
     # Create the figure and 2D subplots
     gs = gridspec.GridSpec(2, 1, height_ratios=[1, 2])
@@ -44,9 +154,6 @@ def plot_levelling(folder, tracking_filename, img_filename):
     ax0 = plt.subplot(gs[0])
     ax1 = fig.add_subplot(gs[1])#, projection='3d')
 
-    # Convert the first three columns of track_levelling to a numpy array
-    data = np.array(track_levelling)
-
     # Split the data into x, y, and z components
     x_motor = data[:, 0]
     y_motor = data[:, 1]
@@ -60,19 +167,9 @@ def plot_levelling(folder, tracking_filename, img_filename):
     ax0.set_xlabel('Step number')
     ax0.set_ylabel('Cost')
 
-    # Create a grid of x and y values
-    xi = np.linspace(min(x_motor), max(x_motor), 1000)
-    yi = np.linspace(min(y_motor), max(y_motor), 1000)
-    xi, yi = np.meshgrid(xi, yi)
-    # Interpolate z values on this grid
-    cost_i = griddata((x_motor, y_motor), cost, (xi, yi), method='cubic')
-    
-    # Find the indices of the minimum value in the interpolated grid
-    min_index = np.nanargmin(cost_i.flatten())
-
-    # Use these indices to find the corresponding values in xi and yi
-    xi_min = xi.flatten()[min_index]
-    yi_min = yi.flatten()[min_index]
+    # Evaluate cost on a grid and find the minimum
+    xi, yi, cost_i, (xi_min, yi_min) = levelling_surface(
+        x_motor, y_motor, interpolant=interpolant, motor_step=motor_step, result_gp=result_gp)
 
     print(f"The motor values that would give the minimum value of the cost are {xi_min} and {yi_min}, respectively.")
 
@@ -0,0 +1,232 @@
+import threading
+import time
+import traceback
+import numpy as np
+
+from .settings import rig_settings
+
+'''
+Run levelling, calibrations and experiment schedules on several shakers from one process.
+
+Jobs are added to a RigScheduler for a rig in RIGS in settings. Every rig works through its own jobs in order in
+its own thread and the rigs run at the same time, so a batch on N rigs takes about as long as the slowest rig.
+A job is any function called as fn(rig, *args, **kwargs). level, calibrate and run_schedule below open the
+devices of the rig for the job and close them again when it finishes.
+
+    scheduler = RigScheduler()
+    for rig, cam in cameras.items():
+        scheduler.add(rig, level, cam, com_balls, iterations=5)
+        scheduler.add(rig, run_schedule, cooling_sweep(710, 565, -5, 0.25), log_file=rig + '_log.csv')
+    scheduler.start()
+    while scheduler.running():
+        scheduler.print_status()
+        time.sleep(60)
+
+Rigs are isolated from each other. Each has its own ports and settings files, and its serial links are listed in
+serial_monitor under the rig's name. If a job raises, the exception and traceback are kept with the job, the rest
+of that rig's jobs are skipped (there is no point running an experiment on a shaker that failed to level) and the
+other rigs carry on. Jobs added while a rig is running are picked up by its thread, otherwise call start again.
+
+GUI backends (OpenCV HighGUI, TkAgg, QtAgg) only work in the main thread, so level runs the Balancer without
+display windows. The levelling data and final image of every rig are saved as usual.
+'''
+
+JOB_STATES = ('waiting', 'running', 'done', 'failed', 'skipped')
+
+
+class Job:
+    def __init__(self, rig, fn, args=(), kwargs=None, name=None):
+        """fn(rig, *args, **kwargs) run by a RigScheduler"""
+        self.rig = rig
+        self.fn = fn
+        self.args = args
+        self.kwargs = {} if kwargs is None else kwargs
+        self.name = getattr(fn, '__name__', str(fn)) if name is None else name
+        self.state = 'waiting'
+        self.result = None
+        self.error = None
+        self.traceback = None
+        self.start_time = None
+        self.end_time = None
+
+    @property
+    def duration(self):
+        """Seconds the job ran for, so far if it is still running. None if it has not started."""
+        if self.start_time is None:
+            return None
+        return (time.time() if self.end_time is None else self.end_time) - self.start_time
+
+    def run(self):
+        self.state = 'running'
+        self.start_time = time.time()
+        try:
+            self.result = self.fn(self.rig, *self.args, **self.kwargs)
+            self.state = 'done'
+        except Exception as error:
+            self.error = error
+            self.traceback = traceback.format_exc()
+            self.state = 'failed'
+        finally:
+            self.end_time = time.time()
+
+    def __repr__(self):
+        return 'Job(' + self.rig + ', ' + self.name + ', ' + self.state + ')'
+
+
+class RigScheduler:
+    def __init__(self):
+        self.jobs = {}
+        self._threads = {}
+        self._lock = threading.Lock()
+
+    def add(self, rig, fn, *args, name=None, **kwargs):
+        """Queue fn(rig, *args, **kwargs) to run on rig after the jobs already added to it. Returns the Job."""
+        # raises KeyError for an unknown rig
+        rig_settings(rig)
+        job = Job(rig, fn, args, kwargs, name=name)
+        with self._lock:
+            self.jobs.setdefault(rig, []).append(job)
+        return job
+
+    def start(self):
+        """Start a thread for every rig with waiting jobs that is not already running"""
+        with self._lock:
+            for rig, jobs in self.jobs.items():
+                if rig in self._threads or not any(job.state == 'waiting' for job in jobs):
+                    continue
+                thread = threading.Thread(target=self._run_rig, args=(rig,), name=rig, daemon=True)
+                self._threads[rig] = thread
+                thread.start()
+
+    def _run_rig(self, rig):
+        failed = False
+        while True:
+            with self._lock:
+                job = next((job for job in self.jobs[rig] if job.state == 'waiting'), None)
+                if job is None:
+                    # removed under the lock so that start never misses jobs added as the rig finishes
+                    del self._threads[rig]
+                    return
+                if failed:
+                    job.state = 'skipped'
+                    continue
+            job.run()
+            failed = job.state == 'failed'
+
+    def running(self):
+        with self._lock:
+            return len(self._threads) > 0
+
+    def join(self, timeout=None):
+        """Wait for all rigs to finish their jobs. Returns True if they have."""
+        end = None if timeout is None else time.time() + timeout
+        while True:
+            with self._lock:
+                threads = list(self._threads.values())
+            if not threads:
+                return True
+            for thread in threads:
+                thread.join(None if end is None else max(end - time.time(), 0))
+            if end is not None and time.time() >= end:
+                return not self.running()
+
+    def run(self):
+        """Run all waiting jobs and wait for them to finish. Returns status()"""
+        self.start()
+        self.join()
+        return self.status()
+
+    def status(self):
+        """dict of rig : dict with the state of the rig, the job it is on (or finished with), the number of jobs in
+        each state and the error of a failed job"""
+        status = {}
+        with self._lock:
+            for rig, jobs in self.jobs.items():
+                counts = {state: sum(job.state == state for job in jobs) for state in JOB_STATES}
+                current = next((job for job in jobs if job.state in ('running', 'failed')), None)
+                if current is None:
+                    started = [job for job in jobs if job.state != 'waiting']
+                    current = started[-1] if started else None
+                if counts['running']:
+                    state = 'running'
+                elif counts['failed']:
+                    state = 'failed'
+                elif counts['waiting']:
+                    state = 'waiting'
+                else:
+                    state = 'done'
+                failed = next((job for job in jobs if job.state == 'failed'), None)
+                status[rig] = dict(counts,
+                                   state=state,
+                                   job=None if current is None else current.name,
+                                   duration=None if current is None else current.duration,
+                                   error=None if failed is None else repr(failed.error))
+        return status
+
+    def summary(self):
+        """Number of jobs in each state over all rigs"""
+        with self._lock:
+            return {state: sum(job.state == state for jobs in self.jobs.values() for job in jobs)
+                    for state in JOB_STATES}
+
+    def print_status(self):
+        for rig, rig_status in self.status().items():
+            line = '{}: {} {} done, {} failed, {} skipped, {} waiting'.format(
+                rig, rig_status['state'], rig_status['done'], rig_status['failed'], rig_status['skipped'],
+                rig_status['waiting'])
+            if rig_status['job'] is not None:
+                line += ' - ' + rig_status['job'] + ' ({:.0f}s)'.format(rig_status['duration'])
+            if rig_status['error'] is not None:
+                line += ' - ' + rig_status['error']
+            print(line)
+
+
+"""------------------------------------------------------------------------------------------------------------------------
+Jobs
+--------------------------------------------------------------------------------------------------------------------------"""
+
+
+def level(rig, camera, measure_fn, iterations=10, ncalls=50, recorder=None, display=False):
+    """Level rig with a Balancer. camera is the rig's camera. Returns the best motor position and its cost.
+    display shows the Balancer windows, which only works if the job runs in the main thread."""
+    from .shaker import Shaker
+    from .stepperXY import StepperXY
+    from .balance import Balancer
+
+    with Shaker(rig=rig) as shaker, StepperXY(rig=rig) as motors:
+        balancer = Balancer(shaker, camera, motors, measure_fn=measure_fn, recorder=recorder, rig=rig,
+                            display=display)
+        result = balancer.level(iterations=iterations, ncalls=ncalls)
+    return result.x, result.fun
+
+
+def calibrate(rig, start=250, stop=750, step=25, save=True, **kwargs):
+    """Calibrate the accelerometer of rig with calibrate_accelerometer_adaptive. If save the calibration replaces
+    the rig's ACCELEROMETER_FILE. Returns duty_cycles, acceleration, uncertainty, settle_times."""
+    from .calibrate_accelerometer import calibrate_accelerometer_adaptive
+
+    duty_cycles, acceleration, uncertainty, settle_times = calibrate_accelerometer_adaptive(
+        start=start, stop=stop, step=step, rig=rig, **kwargs)
+    if save:
+        values = rig_settings(rig)
+        np.savetxt(values['SETTINGS_PATH'] + values['ACCELEROMETER_FILE'],
+                   np.column_stack((duty_cycles, acceleration, uncertainty, settle_times)), delimiter=',',
+                   header='duty_cycle,acceleration,uncertainty,settle_time', comments='')
+    return duty_cycles, acceleration, uncertainty, settle_times
+
+
+def run_schedule(rig, schedule, log_file=None):
+    """Run a schedule (list of steps or a file for load_schedule) on rig with its accelerometer.
+    Returns the (duty, Γ) measurements."""
+    from .shaker import Shaker
+    from .accelerometer import AccelerometerReader
+    from .schedule import ScheduleRunner, load_schedule
+
+    if isinstance(schedule, str):
+        schedule = load_schedule(schedule)
+    with Shaker(rig=rig) as shaker, AccelerometerReader(rig=rig) as accelerometer:
+        runner = ScheduleRunner(shaker, accelerometer)
+        measurements = runner.run(schedule)
+    if log_file is not None:
+        runner.save_log(log_file)
+    return measurements
@@ -0,0 +1,213 @@
+import json
+import time
+import numpy as np
+
+'''
+Declarative experiment schedules.
+
+A schedule is a list of steps, each a dict with an 'action' key. It can be written in python, or in a
+yaml / json file and read with load_schedule:
+
+    - {action: ramp, start: 715, stop: 710, rate: 0.25}          # duty cycles per second, optional step_size
+    - {action: hold, duty: 710, duration: 6, measure: 2}          # measure = seconds of accelerometer data averaged at the end
+    - {action: hold, duty: 705, duration: 10, settle: true}       # end as soon as the accelerometer settles (duration is the timeout)
+    - {action: record, duty: 710, duration: 3, gap: 1}            # gap = minimum time before the camera can record again
+    - {action: wait, duration: 1}
+
+The runner compiles the schedule into a list of timed events and executes them against absolute times,
+so there is no dead time between steps. The accelerometer is read continuously in the background, so a
+measurement costs no time: it is the mean of the samples already received. The camera gap after a recording
+only delays the next recording, duty changes carry on straight away. Every event is logged with the time it
+was scheduled and the time it actually happened.
+'''
+
+ACTIONS = ('ramp', 'hold', 'record', 'wait')
+
+
+def load_schedule(filename):
+    """Load a schedule from a .yaml/.yml (requires pyyaml) or .json file"""
+    with open(filename) as f:
+        if filename.endswith(('.yaml', '.yml')):
+            import yaml
+            schedule = yaml.safe_load(f)
+        else:
+            schedule = json.loads(f.read())
+    for step in schedule:
+        if step.get('action') not in ACTIONS:
+            raise ValueError("Unknown action in schedule step: " + str(step))
+    return schedule
+
+
+def cooling_sweep(start, stop, step, rate, settle_time=6, record_time=3, gap=1, measure=2):
+    """Schedule equivalent to the cooling cycle in experiment_code.py. At each duty cycle the shaker is ramped down,
+    held for settle_time, the acceleration measured and then a video recorded for record_time."""
+    schedule = []
+    d0 = start - step
+    for duty in np.arange(start, stop, step):
+        schedule.append({'action': 'ramp', 'start': int(d0), 'stop': int(duty), 'rate': rate})
+        schedule.append({'action': 'hold', 'duty': int(duty), 'duration': settle_time, 'measure': measure})
+        schedule.append({'action': 'record', 'duty': int(duty), 'duration': record_time, 'gap': gap})
+        d0 = duty
+    return schedule
+
+
+def compile_schedule(schedule):
+    """Convert a schedule into a time ordered list of events (time, action, duty, args). Times are in seconds
+    from the start of the schedule, assuming every step takes its nominal time."""
+    events = []
+    t = 0
+    record_free = 0
+    for step in schedule:
+        action = step['action']
+        if action == 'ramp':
+            step_size = step.get('step_size', 1)
+            direction = -1 if step['start'] > step['stop'] else 1
+            duties = np.arange(step['start'], step['stop'] + direction, direction * step_size)
+            delay = step_size / step['rate']
+            for i, duty in enumerate(duties):
+                events.append((t + i * delay, 'duty', int(duty), None))
+            t += (len(duties) - 1) * delay
+        elif action == 'hold':
+            if 'duty' in step:
+                events.append((t, 'duty', step['duty'], None))
+            if step.get('settle'):
+                settle = step['settle'] if isinstance(step['settle'], dict) else {}
+                events.append((t, 'settle', step.get('duty'), dict(settle, timeout=step['duration'])))
+            t += step['duration']
+            if 'measure' in step:
+                events.append((t, 'measure', step.get('duty'), step['measure']))
+        elif action == 'record':
+            t = max(t, record_free)
+            events.append((t, 'record_start', step['duty'], None))
+            t += step['duration']
+            events.append((t, 'record_stop', step['duty'], step.get('gap', 0)))
+            if 'measure' in step:
+                events.append((t, 'measure', step['duty'], step['measure']))
+            record_free = t + step.get('gap', 0)
+        elif action == 'wait':
+            t += step['duration']
+        else:
+            raise ValueError("Unknown action in schedule step: " + str(step))
+    # sort is stable so events at the same time keep their order
+    return sorted(events, key=lambda event: event[0])
+
+
+class ScheduleRunner:
+    """Executes a schedule on a shaker
+
+    shaker : an instance of Shaker
+    accelerometer : optional running AccelerometerReader. Required for measure and settle.
+
+    ----Example Usage: ----
+
+    with Shaker() as shaker, AccelerometerReader() as acc:
+        runner = ScheduleRunner(shaker, acc)
+        measurements = runner.run(cooling_sweep(710, 565, -5, 0.25))
+        runner.save_log('schedule_log.csv')
+    """
+
+    def __init__(self, shaker, accelerometer=None):
+        self.shaker = shaker
+        self.accelerometer = accelerometer
+        self.log = []
+
+    def run(self, schedule):
+        """Run the schedule. Returns a list of (duty, Γ) measurements in the order they were made."""
+        events = compile_schedule(schedule)
+        measurements = []
+        start = time.time()
+        # shift is added to all later events when a settle step finishes early or late
+        shift = 0
+        record_free = start
+        for t, action, duty, args in events:
+            scheduled = start + t + shift
+            if action == 'record_start' and scheduled < record_free:
+                # an earlier settle step finished early but the camera is not ready
+                shift += record_free - scheduled
+                scheduled = record_free
+            interval = scheduled - time.time()
+            if interval > 0:
+                time.sleep(interval)
+            actual = time.time()
+            value = None
+
+            if action == 'duty':
+                self.shaker.set_duty(duty)
+            elif action == 'record_start':
+                self.shaker.set_duty_and_record(duty)
+            elif action == 'record_stop':
+                self.shaker.set_duty_and_record(duty)
+                record_free = actual + args
+            elif action == 'measure':
+                value = self.accelerometer.mean(args)
+                measurements.append((duty, value))
+            elif action == 'settle':
+                value, _, settle_time, settled = self.accelerometer.wait_until_settled(
+                    actual, window=args.get('window', 1.0), tolerance=args.get('tolerance', 0.02),
+                    timeout=args['timeout'])
+                shift += (time.time() - actual) - args['timeout']
+
+            if self.accelerometer is not None and action != 'measure':
+                self.accelerometer.mark(action, duty)
+            self.log.append((scheduled, actual, action, duty, value))
+        return measurements
+
+    def save_log(self, filename):
+        """Save the scheduled and actual time of every event as csv"""
+        with open(filename, 'w') as f:
+            f.write('scheduled,actual,action,duty,value\n')
+            for scheduled, actual, action, duty, value in self.log:
+                f.write('{},{},{},{},{}\n'.format(scheduled, actual, action, duty, value))
+
+
+def adaptive_sweep(measure, start, stop, step, min_step=1, max_points=None, time_budget=None):
+    """Sweep the duty cycle on a coarse grid and then refine it where the measured signal changes fastest
+
+    The coarse grid np.arange(start, stop, step) is measured first, in order. The interval between neighbouring
+    duty cycles with the largest change in signal is then bisected and its midpoint measured, and this is repeated
+    until there are max_points measurements, the time_budget is used up or no interval is wider than min_step.
+
+    Args:
+        measure (callable): measure(duty) makes a measurement at duty and returns a scalar proxy for the order
+            (e.g. the acceleration or the order parameter of a quick image).
+        start, stop, step (int): coarse grid as for np.arange
+        min_step (int, optional): intervals are not refined below this. Defaults to 1.
+        max_points (int, optional): maximum number of measurements. Defaults to None (no limit).
+        time_budget (float, optional): seconds available. No new measurement is started if the average time per
+            measurement so far would exceed the budget. Defaults to None (no limit).
+
+    Returns:
+        duties, values: in the order they were measured
+    """
+    t0 = time.time()
+    duties = []
+    values = []
+
+    def budget_left():
+        if max_points is not None and len(duties) >= max_points:
+            return False
+        if time_budget is not None and duties:
+            elapsed = time.time() - t0
+            return elapsed + elapsed / len(duties) <= time_budget
+        return True
+
+    for duty in np.arange(start, stop, step):
+        if not budget_left():
+            return duties, values
+        duties.append(int(duty))
+        values.append(measure(int(duty)))
+
+    while budget_left():
+        order = np.argsort(duties)
+        sorted_duties = np.array(duties)[order]
+        sorted_values = np.array(values)[order]
+        change = np.abs(np.diff(sorted_values))
+        change[np.diff(sorted_duties) < 2 * min_step] = -1
+        if len(change) == 0 or change.max() < 0:
+            break
+        i = np.argmax(change)
+        midpoint = (sorted_duties[i] + sorted_duties[i + 1]) / 2
+        duty = int(sorted_duties[i] + min_step * np.round((midpoint - sorted_duties[i]) / min_step))
+        duties.append(duty)
+        values.append(measure(duty))
+    return duties, values
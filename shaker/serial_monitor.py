@@ -0,0 +1,263 @@
+import json
+import re
+import threading
+import time
+import weakref
+import numpy as np
+
+from .settings import SETTINGS_PATH, SERIAL_LOG_FILE, SERIAL_LOG_INTERVAL
+
+'''
+Statistics of the serial links to the Arduinos.
+
+InstrumentedArduino wraps an Arduino (or anything with the same methods) and is used in its place. Every
+line sent is treated as a command. The latency of a command is the time from the start of send_serial_line
+until the last read before the next command is sent, so it includes the reply, e.g. the read_all after a
+duty change or the wait for "M1 moved" after a stepper move. Reads with no command outstanding, such as the
+accelerometer stream, are timed under the name 'read'.
+
+For each command the number of calls and a histogram of latencies on logarithmic bins are kept. The link also
+counts bytes sent and received, reads that timed out (returned nothing), exceptions raised by the port and
+replies that look like firmware error messages.
+
+    shaker.power.summary()          # statistics for one link
+    serial_monitor.summaries()      # statistics for every open link
+    serial_monitor.print_summary()
+
+If dump_file is set the summary is appended to it as a line of json every dump_interval seconds. instrument
+uses SERIAL_LOG_FILE and SERIAL_LOG_INTERVAL from settings.
+'''
+
+# Latency histogram bin edges in seconds: 4 bins per decade from 10 µs to 100 s
+LATENCY_BINS = 10 ** np.arange(-5, 2.01, 0.25)
+
+# Replies from the sketches in ArduinoSketches that indicate a rejected command. The help text printed by 'h'
+# also mentions the maximum command length and the valid commands, so only these exact messages are matched.
+ERROR_REPLIES = re.compile(r'^\s*ERROR:'
+                           r'|Invalid ramp'
+                           r'|Invalid value setting'
+                           r'|Syntax error setting'
+                           r'|is an invalid command'
+                           r'|Buffer overflow'
+                           r'|Maximum (?:phase|steps) exceeded'
+                           r'|Not valid motor')
+
+# Command letters (with motor number and direction for stepper moves) followed by an integer argument
+_COMMAND = re.compile(r'^\s*([A-Za-z]*(?:\d[+-])?)(\d*)')
+
+_links = weakref.WeakSet()
+
+
+class CommandStats:
+    """Latency statistics for one command"""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.argument_total = 0
+        self.histogram = np.zeros(len(LATENCY_BINS) + 1, dtype=int)
+
+    def add(self, latency, argument=0):
+        self.count += 1
+        self.total += latency
+        self.max = max(self.max, latency)
+        self.argument_total += argument
+        self.histogram[np.searchsorted(LATENCY_BINS, latency)] += 1
+
+    def percentile(self, q):
+        """Upper bin edge below which q percent of latencies fall"""
+        if self.count == 0:
+            return np.nan
+        index = np.searchsorted(np.cumsum(self.histogram), q / 100 * self.count)
+        return float(LATENCY_BINS[min(index, len(LATENCY_BINS) - 1)])
+
+    def summary(self):
+        summary = {'count': self.count,
+                   'mean': self.total / self.count if self.count else np.nan,
+                   'max': self.max,
+                   'p50': self.percentile(50),
+                   'p95': self.percentile(95),
+                   'p99': self.percentile(99),
+                   'histogram': self.histogram.tolist()}
+        if self.argument_total:
+            # e.g. seconds per step for stepper moves
+            summary['seconds_per_unit'] = self.total / self.argument_total
+        return summary
+
+
+class InstrumentedArduino:
+    """Wraps an Arduino and records statistics of the traffic on it
+
+    ard : instance of Arduino
+    name : name used in summaries
+    dump_file : optional file the summary is appended to every dump_interval seconds
+    dump_interval : seconds between dumps
+
+    All other attributes are passed through to the wrapped Arduino.
+    """
+
+    def __init__(self, ard, name='arduino', dump_file=None, dump_interval=600):
+        self.ard = ard
+        self.name = name
+        self.dump_file = dump_file
+        self.dump_interval = dump_interval
+        self._lock = threading.Lock()
+        self.reset()
+        self._last_dump = time.time()
+        _links.add(self)
+
+    @classmethod
+    def wrap(cls, ard, name='arduino', **kwargs):
+        """Instrument ard unless it is already instrumented"""
+        return ard if isinstance(ard, cls) else cls(ard, name=name, **kwargs)
+
+    def reset(self):
+        with self._lock:
+            self.commands = {}
+            self.bytes_out = 0
+            self.bytes_in = 0
+            self.lines_in = 0
+            self.timeouts = 0
+            self.errors = 0
+            self.error_replies = 0
+            self.last_error_reply = None
+            self._pending = None
+            self.start_time = time.time()
+
+    def __getattr__(self, name):
+        # Only called for attributes not found on the wrapper
+        return getattr(self.__dict__['ard'], name)
+
+    def send_serial_line(self, line, *args, **kwargs):
+        start = time.perf_counter()
+        with self._lock:
+            self._finish()
+        try:
+            result = self.ard.send_serial_line(line, *args, **kwargs)
+        except Exception:
+            with self._lock:
+                self.errors += 1
+            raise
+        key, argument = _parse_command(line)
+        with self._lock:
+            self.bytes_out += len(line)
+            self._pending = [key, start, time.perf_counter(), argument]
+        self._maybe_dump()
+        return result
+
+    def read_serial_line(self, *args, **kwargs):
+        return self._read(self.ard.read_serial_line, args, kwargs, line=True)
+
+    def read_all(self, *args, **kwargs):
+        return self._read(self.ard.read_all, args, kwargs, line=False)
+
+    def _read(self, read, args, kwargs, line):
+        start = time.perf_counter()
+        try:
+            reply = read(*args, **kwargs)
+        except Exception:
+            with self._lock:
+                self.errors += 1
+            raise
+        end = time.perf_counter()
+        text = _text(reply)
+        with self._lock:
+            if self._pending is not None:
+                self._pending[2] = end
+            elif line:
+                self._stats('read').add(end - start)
+            if text:
+                self.bytes_in += len(text)
+                self.lines_in += text.count('\n') or 1
+                if ERROR_REPLIES.search(text):
+                    self.error_replies += 1
+                    self.last_error_reply = text.strip()
+            elif line:
+                self.timeouts += 1
+        self._maybe_dump()
+        return reply
+
+    def _stats(self, key):
+        if key not in self.commands:
+            self.commands[key] = CommandStats()
+        return self.commands[key]
+
+    def _finish(self):
+        """Record the outstanding command. Called with the lock held."""
+        if self._pending is not None:
+            key, start, end, argument = self._pending
+            self._stats(key).add(end - start, argument)
+            self._pending = None
+
+    def summary(self):
+        """Dict of the statistics of this link. The last command sent is included once the next one is sent,
+        as its reply may still be being read."""
+        with self._lock:
+            return {'name': self.name,
+                    'time': time.time(),
+                    'duration': time.time() - self.start_time,
+                    'bytes_out': self.bytes_out,
+                    'bytes_in': self.bytes_in,
+                    'lines_in': self.lines_in,
+                    'timeouts': self.timeouts,
+                    'errors': self.errors,
+                    'error_replies': self.error_replies,
+                    'last_error_reply': self.last_error_reply,
+                    'commands': {key: stats.summary() for key, stats in self.commands.items()}}
+
+    def dump(self, filename=None):
+        """Append the summary to filename (defaults to dump_file) as one line of json"""
+        filename = self.dump_file if filename is None else filename
+        self._last_dump = time.time()
+        with open(filename, 'a') as f:
+            f.write(json.dumps(self.summary()) + '\n')
+
+    def _maybe_dump(self):
+        if self.dump_file is not None and time.time() - self._last_dump >= self.dump_interval:
+            self.dump()
+
+    def quit_serial(self, *args, **kwargs):
+        with self._lock:
+            self._finish()
+        if self.dump_file is not None:
+            self.dump()
+        return self.ard.quit_serial(*args, **kwargs)
+
+
+def instrument(ard, name):
+    """Wrap ard in an InstrumentedArduino that dumps to the SERIAL_LOG_FILE in settings"""
+    dump_file = None if SERIAL_LOG_FILE is None else SETTINGS_PATH + SERIAL_LOG_FILE
+    return InstrumentedArduino.wrap(ard, name=name, dump_file=dump_file, dump_interval=SERIAL_LOG_INTERVAL)
+
+
+def summaries():
+    """Summaries of all instrumented links that are still in use"""
+    return [link.summary() for link in list(_links)]
+
+
+def print_summary():
+    for summary in summaries():
+        print('{name}: {bytes_out} bytes out, {bytes_in} bytes in, {timeouts} timeouts, {errors} errors, '
+              '{error_replies} error replies'.format(**summary))
+        for key, stats in summary['commands'].items():
+            print('    {:>6} n={:<7} mean={:.4f}s p95<{:.4f}s max={:.4f}s'.format(
+                key, stats['count'], stats['mean'], stats['p95'], stats['max']))
+
+
+def _parse_command(line):
+    """Command name and integer argument e.g. 'd500' -> ('d', 500), 'M1+1000' -> ('M1+', 1000)"""
+    match = _COMMAND.match(_text(line))
+    key = match.group(1) or '?'
+    argument = int(match.group(2)) if match.group(2) else 0
+    return key, argument
+
+
+def _text(value):
+    if value is None:
+        return ''
+    if isinstance(value, bytes):
+        return value.decode(errors='replace')
+    if isinstance(value, (list, tuple)):
+        return ''.join(_text(item) for item in value)
+    return str(value)
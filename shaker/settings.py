@@ -1,6 +1,7 @@
 import json
 
 from .centre_mass import com_bubble, com_balls
+from .telemetry import traced
 
 # --------------------------------------------------------------------
 SHAKER_ARDUINO = {"PORT": "COM5_SETPORTNUM",
@@ -15,6 +16,18 @@ ACCELEROMETER_SHAKER = {"PORT": "COM3_SETPORTNUM",
                         "BAUDRATE": 9600
                         }
 
+# Maximum number of duty cycle commands sent to the shaker Arduino per second. The firmware redraws the LCD for every
+# byte it receives, so each command takes several ms to process, and the duty cycle only changes at the next zero
+# crossing of the mains. Faster updates are coalesced to the latest value.
+SHAKER_MAX_RATE = 25
+
+# Local daemon holding the Arduino connections open. See daemon.py. The key clients authenticate with is read from
+# the environment variable SHAKER_DAEMON_AUTHKEY or from AUTHKEY_FILE, which must be kept out of the repository.
+# Create it with python -m shaker.daemon --new-key
+DAEMON = {"ADDRESS": ("localhost", 6000),
+          "AUTHKEY_FILE": "~/.shaker_daemon_key"
+          }
+
 SETTINGS_PATH = "Z:/shaker_config/_SETPATHCORRECTLY"
 
 SETTINGS_FILE = "shaker1_params.txt_SETFILENAME"
@@ -23,6 +36,12 @@ ACCELEROMETER_FILE = "shaker1_accelerometer.csv_SETFILENAME"
 
 TRACK_LEVEL = "shaker1_level.txtSETFILENAME"
 
+# Statistics of the serial links to the Arduinos are appended to this file every SERIAL_LOG_INTERVAL seconds.
+# None switches the dumps off. The statistics are always available from serial_monitor.summaries()
+SERIAL_LOG_FILE = None
+
+SERIAL_LOG_INTERVAL = 600
+
 SETTINGS_com_bubble = {
     'img_processing':   {
         'img_fn': com_bubble,
@@ -56,9 +75,39 @@ SETTINGS_com_balls = {
 }
 
 
-def update_settings_file(motor_pos=None, motor_limits=None, motor_pts=None, boundary_pts=None):
+# Several shakers can be run from one process (see rigs.py). Each rig only lists the values that differ from the
+# module level settings above, which are the settings of the default rig (rig=None).
+RIGS = {
+    'shaker1': {},
+    'shaker2': {'SHAKER_ARDUINO': {"PORT": "COM8_SETPORTNUM", "BAUDRATE": 115200},
+                'STEPPER_ARDUINO': {"PORT": "COM7_SETPORTNUM", "BAUDRATE": 115200},
+                'ACCELEROMETER_SHAKER': {"PORT": "COM6_SETPORTNUM", "BAUDRATE": 9600},
+                'SETTINGS_FILE': "shaker2_params.txt_SETFILENAME",
+                'ACCELEROMETER_FILE': "shaker2_accelerometer.csv_SETFILENAME",
+                'TRACK_LEVEL': "shaker2_level.txtSETFILENAME"
+                }
+}
+
+RIG_KEYS = ('SHAKER_ARDUINO', 'STEPPER_ARDUINO', 'ACCELEROMETER_SHAKER', 'SETTINGS_PATH', 'SETTINGS_FILE',
+            'ACCELEROMETER_FILE', 'TRACK_LEVEL', 'SETTINGS_com_bubble', 'SETTINGS_com_balls')
+
+
+def rig_settings(rig=None):
+    """dict of the settings in RIG_KEYS for rig. Values not given in RIGS[rig] are the module level settings."""
+    values = {key: globals()[key] for key in RIG_KEYS}
+    if rig is not None:
+        if rig not in RIGS:
+            raise KeyError("No rig " + str(rig) + " in RIGS. Choose from " + str(tuple(RIGS)))
+        values.update(RIGS[rig])
+    return values
+
+
+@traced('settings.update_settings_file')
+def update_settings_file(motor_pos=None, motor_limits=None, motor_pts=None, boundary_pts=None, rig=None):
+    values = rig_settings(rig)
+    filename = values['SETTINGS_PATH'] + values['SETTINGS_FILE']
     try:
-        with open(SETTINGS_PATH + SETTINGS_FILE) as f:
+        with open(filename) as f:
             settings = json.loads(f.read())
     except:
         settings = {'motor_pos': "0, 0",
@@ -78,7 +127,7 @@ def update_settings_file(motor_pos=None, motor_limits=None, motor_pts=None, boun
     if boundary_pts:
         settings['boundary_pts'] = boundary_pts
 
-    with open(SETTINGS_PATH + SETTINGS_FILE, 'w') as f:
+    with open(filename, 'w') as f:
         f.write(json.dumps(settings))
 
     return settings
@@ -1,11 +1,24 @@
 
-from .settings import SHAKER_ARDUINO
+from .settings import rig_settings, SHAKER_MAX_RATE
+from .calibration import AccelerationCalibration
+from .control import AccelerationController, AccelerationRegulator, control_loop
+from .telemetry import traced
+from .serial_monitor import instrument, _text
 from labequipment.arduino import Arduino
+from concurrent.futures import Future
 import numpy as np
+import threading
 import time
 import sys
 sys.path.insert(0, '..')
 
+# Firmware that runs ramps itself lists this 'r' command in its help
+FIRMWARE_RAMP_HELP = 'rssss,eeee,tttt,nnn'
+# Longest line the firmware accepts. ARDSHK_v4 keeps 20 bytes including the terminating 0.
+MAX_COMMAND_LENGTH = 19
+# Seconds allowed on top of its nominal duration for a firmware ramp to report completion
+RAMP_TIMEOUT_MARGIN = 2
+
 
 class Shaker:
     """Shaker class handles communication between pc and Red Shaker. It can be used
@@ -25,54 +38,223 @@ class Shaker:
 
     """
 
-    def __init__(self):
+    def __init__(self, calibration=None, rig=None, max_rate=None):
+        """calibration is an optional AccelerationCalibration used by set_acceleration and ramp_acceleration.
+        If not supplied it is loaded from the accelerometer calibration file the first time it is needed.
+        rig is a name in RIGS in settings. The port and calibration file of that rig are used. Defaults to the
+        module level settings.
+        max_rate is the maximum number of duty cycle commands sent per second. Defaults to SHAKER_MAX_RATE."""
         print("shaker init")
-        self.power = Arduino(SHAKER_ARDUINO)
+        self.rig = rig
+        self._calibration = calibration
+        # Last duty cycle sent in serial mode. None when it is not known.
+        self.duty = None
+        self.max_rate = SHAKER_MAX_RATE if max_rate is None else max_rate
+        self._last_sent = float('-inf')
+        # Value held back by the rate limit and the timer that will send it
+        self._pending = None
+        self._timer = None
+        self._lock = threading.RLock()
+        # True if the firmware runs ramps itself. None until the first ramp checks. Set False to always send
+        # one command per step.
+        self.firmware_ramp = None
+        # Token of the firmware ramp being followed. Cleared by any other command, which stops the ramp.
+        self._ramp = None
+        # Firmware ramps still being followed. While there are any the follower owns the port and is the only
+        # thread that reads it, so _send leaves the replies to the follower instead of clearing the buffer.
+        self._followers = 0
+        self._follow_lock = threading.Lock()
+        self.power = instrument(Arduino(rig_settings(rig)['SHAKER_ARDUINO']), 'shaker' if rig is None else rig + '.shaker')
         time.sleep(1)
         self.power.read_all()
         self.switch_serial_mode()
 
     def switch_serial_mode(self):
         """Put shaker in serial mode"""
+        # The Arduino goes back to the last duty cycle it was sent, possibly by another process
+        self.duty = None
+        self._ramp = None
         self.power.send_serial_line('s')
         print(self.power.read_serial_line())
         #print(self.power.read_serial_line()[:-2])# This line was used in version 3 of shaker Arduino code. Removed in v4.
 
     def switch_manual_mode(self):
+        self.flush()
+        self.duty = None
+        self._ramp = None
         self.power.send_serial_line('m')
         print(self.power.read_serial_line())
         #print(self.power.read_serial_line()[:-2])# This line was used in version 3 of shaker Arduino code. Removed in v4.
         
+    @traced('shaker.set_duty')
     def set_duty(self, val: int):
         """Set a new value of the duty cycle
 
         val is a 3 digit number indicating new duty cycle
-        """
-        string = 'd{:03}'.format(val)
-        self.power.send_serial_line(string)
 
-        self._clear_buffer()
+        Nothing is sent if the shaker is already at val. At most max_rate commands are sent per second. A value set
+        sooner than that after the last command is held back and sent by a timer when the interval is up, and is
+        replaced by any value set in the meantime, so a fast ramp never backs up the serial link.
+        Setting the duty cycle stops a firmware ramp that is running.
+        """
+        val = int(val)
+        with self._lock:
+            if val == self.duty and self._ramp is None:
+                # supersedes any value held back
+                self._pending = None
+                return
+            wait = self._last_sent + 1 / self.max_rate - time.perf_counter()
+            if wait > 0:
+                self._pending = val
+                if self._timer is None:
+                    self._timer = threading.Timer(wait, self.flush)
+                    self._timer.daemon = True
+                    self._timer.start()
+                return
+            self._send('d', val)
 
+    @traced('shaker.set_duty_and_record')
     def set_duty_and_record(self, val: int):
         """Sets new duty cycle but also sends a TTL signal to camera output 
             to trigger camera. This starts or stops the camera recording as appropriate.
 
             Works with Panasonic HC-X1000 and probably others
+
+            Always sent straight away, replacing any value held back by set_duty.
         """
-        string = 'i{:03}'.format(val)
-        self.power.send_serial_line(string)
+        with self._lock:
+            self._send('i', int(val))
 
-        self._clear_buffer()
+    def flush(self):
+        """Send a duty cycle held back by the rate limit, waiting for the rest of the interval if necessary"""
+        with self._lock:
+            # also when the value held back was superseded, so that the next one held back gets a timer
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if self._pending is None:
+                return
+            wait = self._last_sent + 1 / self.max_rate - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+            self._send('d', self._pending)
+
+    def _send(self, command, val):
+        # the firmware stops any ramp when it receives another command
+        self._ramp = None
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._pending = None
+        self.power.send_serial_line('{}{:03}'.format(command, val))
+        self._last_sent = time.perf_counter()
+        self.duty = val
+        if self._followers == 0:
+            self._clear_buffer()
+
+    @property
+    def calibration(self):
+        if getattr(self, '_calibration', None) is None:
+            self._calibration = AccelerationCalibration.from_file(rig=getattr(self, 'rig', None))
+        return self._calibration
+
+    def set_acceleration(self, gamma: float, record: bool = False):
+        """Set the duty cycle that gives a peak acceleration gamma according to the calibration.
+        Returns the duty cycle applied."""
+        duty_cycle = int(self.calibration.duty(gamma))
+        self.set_duty_and_record(duty_cycle) if record else self.set_duty(duty_cycle)
+        return duty_cycle
 
+    @traced('shaker.hold_acceleration')
+    def hold_acceleration(self,
+                          gamma: float,
+                          accelerometer,
+                          tolerance: float = 0.05,
+                          hold_time: float = 1.0,
+                          interval: float = 0.2,
+                          timeout: float = 30,
+                          kp: float = 0.5,
+                          ki: float = 1.0):
+        """Closed loop control of the acceleration. The duty cycle is adjusted from the live accelerometer stream
+        by a PI controller, with the calibration as a feed-forward term, until gamma is reached and held.
+
+        Args:
+            gamma (float): target peak acceleration Γ
+            accelerometer (AccelerometerReader): running accelerometer reader
+            tolerance (float, optional): Γ is on target when within tolerance. Defaults to 0.05.
+            hold_time (float, optional): Γ must stay on target for hold_time seconds. Defaults to 1.0.
+            interval (float, optional): seconds between control updates. Γ is averaged over this interval. Defaults to 0.2.
+            timeout (float, optional): give up after timeout seconds. Defaults to 30.
+            kp (float, optional): proportional gain. Defaults to 0.5.
+            ki (float, optional): integral gain in 1/s. Defaults to 1.0.
+
+        Returns:
+            time_to_target, duty: seconds taken to reach the target (nan if not reached) and the duty cycle holding it.
+        """
+        controller = AccelerationController(self.calibration, kp=kp, ki=ki)
+        time_to_target, duty = control_loop(controller, self.set_duty, lambda: accelerometer.mean(interval), gamma,
+                                            tolerance=tolerance, hold_time=hold_time, interval=interval, timeout=timeout)
+        print('Time to target : ', time_to_target)
+        return time_to_target, duty
+
+    def regulate_acceleration(self,
+                              gamma: float,
+                              accelerometer,
+                              tolerance: float = 0.05,
+                              interval: float = 0.2,
+                              kp: float = 0.5,
+                              ki: float = 1.0):
+        """Closed loop control of the acceleration that keeps running until it is stopped. Unlike
+        hold_acceleration, which returns once gamma is reached, drift during the experiment is corrected.
+
+        Args are as for hold_acceleration. Returns the running AccelerationRegulator. Call its stop method
+        (or use it as a context manager) before setting the duty cycle directly again.
+        """
+        controller = AccelerationController(self.calibration, kp=kp, ki=ki)
+        regulator = AccelerationRegulator(controller, self.set_duty, lambda: accelerometer.mean(interval),
+                                          interval=interval, tolerance=tolerance)
+        return regulator.start(gamma)
+
+    def ramp_acceleration(self,
+                          g0: float,
+                          g1: float,
+                          rate: float,
+                          record: bool = False,
+                          stop_at_end: bool = False):
+        """Ramp the acceleration linearly in Γ between two values
+
+        The whole duty cycle schedule is calculated from the calibration before the ramp starts.
+
+        Args:
+            g0 (float): initial peak acceleration Γ
+            g1 (float): final peak acceleration Γ
+            rate (float): rate in Γ per second
+            record (bool, optional): Records entire sequence. Defaults to False.
+            stop_at_end (bool, optional): Whether to stop shaker when ramp is complete. The recording will stop regardless. Defaults to False.
+        """
+        duty_cycles, times = self.calibration.ramp_schedule(g0, g1, rate)
+        self.schedule(duty_cycles, times, record=record, stop_at_end=stop_at_end)
+
+    @traced('shaker.ramp')
     def ramp(self,
              start: int,
              stop: int,
              rate: float,
              step_size: int = 1,
              record: bool = False,
-             stop_at_end: bool = False):
+             stop_at_end: bool = False,
+             progress=None,
+             wait: bool = True):
         """Ramp the acceleration between two values at a constant rate
 
+        If the firmware supports it the whole ramp is a single 'r' command timed by the Arduino, and the duty cycle
+        of every step is read back as it is applied. Otherwise one duty cycle command is sent per step. Both take
+        the same time: a step of step_size every step_size / rate seconds.
+
+        With wait=False the ramp is followed, or run, in a background thread and a concurrent.futures.Future that
+        completes with the ramp is returned straight away. The shaker can be used in the meantime, but any other
+        duty cycle command stops the ramp.
+
         Args:
             start (int): duty_cycle integer 
             stop (int): duty_cycle integer 
@@ -80,14 +262,127 @@ class Shaker:
             step_size (int, optional): Modify the duty_cycle in steps of .... Defaults to 1.
             record (bool, optional): Records entire sequence. Defaults to False.
             stop_at_end (bool, optional): Whether to stop shaker when ramp is complete. The recording will stop regardless. Defaults to False.
+            progress (callable, optional): called with the duty cycle of every step the firmware reports. Defaults to None.
+            wait (bool, optional): Whether to return only when the ramp is complete. Defaults to True.
         """
+        if not wait:
+            future = Future()
+
+            def run():
+                try:
+                    self.ramp(start, stop, rate, step_size=step_size, record=record, stop_at_end=stop_at_end,
+                              progress=progress)
+                    future.set_result(None)
+                except Exception as error:
+                    future.set_exception(error)
+            threading.Thread(target=run, daemon=True).start()
+            return future
+
+        command = self._ramp_command(start, stop, rate, step_size)
+        if command is not None:
+            self._firmware_ramp(command, start, stop, rate, record=record, stop_at_end=stop_at_end,
+                                progress=progress)
+            return
         if start > stop:
             duty_cycles = np.arange(start, stop - 1, -step_size)
         else:
             duty_cycles = np.arange(start, stop + 1, step_size)
-        self.sequence(duty_cycles, rate*step_size, record=record,
+        self.sequence(duty_cycles, rate/step_size, record=record,
                       stop_at_end=stop_at_end)
 
+    def supports_firmware_ramp(self):
+        """True if the firmware can run ramps itself. Read from its help text the first time."""
+        if self.firmware_ramp is None:
+            with self._lock:
+                self.flush()
+                self.power.send_serial_line('h')
+                time.sleep(0.5)
+                self.firmware_ramp = FIRMWARE_RAMP_HELP in _text(self.power.read_all())
+        return self.firmware_ramp
+
+    def _ramp_command(self, start, stop, rate, step_size):
+        """The 'r' command for a ramp, or None if it has to be run from here"""
+        interval = 1000 * step_size / rate
+        command = 'r{},{},{},{}'.format(int(start), int(stop), int(round(interval)), int(step_size))
+        # The firmware times steps in whole ms
+        if not 1 <= round(interval) <= 60000 or abs(round(interval) - interval) > 0.01 * interval:
+            return None
+        if len(command) > MAX_COMMAND_LENGTH or not self.supports_firmware_ramp():
+            return None
+        return command
+
+    @traced('shaker.firmware_ramp')
+    def _firmware_ramp(self, command, start, stop, rate, record=False, stop_at_end=False, progress=None):
+        with self._lock:
+            if record:
+                self._send('i', int(start))
+            else:
+                self.flush()
+            # a ramp being followed is stopped by this one and its remaining lines come first
+            superseded = self._ramp is not None
+            self._followers += 1
+            self.power.send_serial_line(command)
+            self._last_sent = time.perf_counter()
+            ramp = self._ramp = object()
+
+        # The progress lines are read without the lock so that other calls, e.g. from daemon clients, are not held
+        # up for the whole ramp. If one of them sends a command it clears _ramp and the ramp is no longer followed.
+        # Only the follower reads the port until it is done, after the follower of any ramp this one stopped.
+        complete = None
+        try:
+            with self._follow_lock:
+                complete = self._follow_ramp(command, ramp, start, stop, rate, superseded, progress)
+        finally:
+            with self._lock:
+                self._followers -= 1
+                followed = self._ramp is ramp
+                if followed:
+                    self._ramp = None
+                elif self._ramp is None and self._followers == 0:
+                    # the replies to the commands sent while the ramp was followed
+                    self._clear_buffer()
+                if followed and complete is False:
+                    print('Ramp did not report completion, setting final duty cycle')
+                    self._send('d', int(stop))
+        if not followed:
+            # stopped by another command, which set the duty cycle
+            return
+
+        if stop_at_end:
+            self.set_duty_and_record(0) if record else self.set_duty(0)
+        elif record:
+            # The second trigger stops the recording
+            self.set_duty_and_record(stop)
+
+    def _follow_ramp(self, command, ramp, start, stop, rate, superseded, progress):
+        """Read the progress of a firmware ramp until it completes, times out or is stopped by another command.
+        Returns True if the ramp reported completion."""
+        deadline = time.time() + abs(stop - start) / rate + RAMP_TIMEOUT_MARGIN
+        # The Arduino reports "Ramp <duty>" for every step, "Ramp complete <duty>" for the last one and
+        # "Ramp stopped <duty>" when another command takes over. After a ramp this one stopped the lines up to
+        # the first step of this ramp belong to the old one.
+        started = not superseded
+        while time.time() < deadline and self._ramp is ramp:
+            words = _text(self.power.read_serial_line()).split()
+            if len(words) < 2 or words[0] != 'Ramp' or not words[-1].isdigit():
+                if words[:2] == ['Invalid', 'ramp']:
+                    raise ValueError("Firmware rejected ramp " + command)
+                continue
+            duty = int(words[-1])
+            if not started:
+                started = words[1] != 'stopped' and duty == int(start)
+                if not started:
+                    continue
+            with self._lock:
+                if self._ramp is not ramp:
+                    break
+                self.duty = duty
+            if progress is not None:
+                progress(duty)
+            if words[1] in ('complete', 'stopped'):
+                return True
+        return False
+
     def sequence(self,
                  values: list[int],
                  rate: float,
@@ -101,26 +396,52 @@ class Shaker:
             record (bool, optional): Records entire sequence. Defaults to False.
             stop_at_end (bool, optional): Whether to stop shaker when ramp is complete. The recording will stop regardless. Defaults to False.
         """
-        self.set_duty_and_record(
-            values[0]) if record else self.set_duty(values[0])
         delay = 1/rate
-        time.sleep(delay)
+        self.schedule(values, np.arange(len(values))*delay, record=record,
+                      stop_at_end=stop_at_end, end=len(values)*delay)
+
+    @traced('shaker.schedule')
+    def schedule(self,
+                 values: list[int],
+                 times: list[float],
+                 record: bool = False,
+                 stop_at_end: bool = False,
+                 end: float = None):
+        """Apply duty_cycle values at the times given
 
-        if len(values) > 1:
-            for duty_cycle in values[1:]:
-                t = time.time()
+        Args:
+            values (list[int]): sequential list of duty_cycle values to be applied.
+            times (list[float]): time in seconds after the start at which each value is applied.
+            record (bool, optional): Records entire sequence. Defaults to False.
+            stop_at_end (bool, optional): Whether to stop shaker when complete. The recording will stop regardless. Defaults to False.
+            end (float, optional): time at which the sequence finishes. Defaults to the last time.
+        """
+        start = time.time()
+        on_time = True
+        for i, (duty_cycle, t) in enumerate(zip(values, times)):
+            interval = start + t - time.time()
+            if interval > 0:
+                time.sleep(interval)
+            elif i > 0 and on_time:
+                on_time = False
+                print('Rate too high, timing will not be accurate')
+            if i == 0 and record:
+                self.set_duty_and_record(duty_cycle)
+            else:
                 self.set_duty(duty_cycle)
-                interval = delay - time.time() + t
-                if interval > 0:
-                    time.sleep(interval)
-                else:
-                    print('Rate too high, timing will not be accurate')
+
+        end = times[-1] if end is None else end
+        interval = start + end - time.time()
+        if interval > 0:
+            time.sleep(interval)
 
         if stop_at_end:
             self.set_duty_and_record(0) if record else self.set_duty(0)
-        else:
-            self.set_duty_and_record(
-                values[-1]) if record else self.set_duty(values[-1])
+        elif record:
+            # The second trigger stops the recording
+            self.set_duty_and_record(values[-1])
+        # The last value may still be held back by the rate limit
+        self.flush()
 
     def _clear_buffer(self):
         self.power.read_all()
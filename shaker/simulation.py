@@ -0,0 +1,207 @@
+import numpy as np
+
+from .analysis.hexatic import inside_polygon
+
+'''
+Simulated shaker rig for testing and benchmarking levelling without hardware.
+
+SimulatedRig holds the state of a tilted tray of particles and provides motors, shaker and camera objects
+with the methods Balancer and measure_com use:
+
+    rig = SimulatedRig(boundary_pts, particles='balls', level=(120, -80))
+    balancer = Balancer(rig.shaker, rig.camera, rig.motors, measure_fn=com_balls)
+    result = balancer.level(iterations=2, ncalls=20)
+
+The motors tilt the tray in proportion to their distance from the level position. Particles are placed
+uniformly inside boundary_pts weighted by the Boltzmann factor of the tilt, so balls collect downhill and
+bubbles uphill and the centre of mass saturates as the particles fill one side of the tray. For small tilts the
+centre of mass moves sensitivity pixels per motor step. Nothing moves until the shaker anneals the tray by
+dropping the duty cycle from above melt_duty, when a fraction decorrelation of the particles is given new positions.
+With decorrelation=1 every measurement is independent, with smaller values successive measurements are correlated
+as they are on a real shaker that is not fully melted.
+
+The camera renders balls as dark discs on a light tray and bubbles as light discs on a dark tray, matching
+the thresholds in SETTINGS_com_balls and SETTINGS_com_bubble, with gaussian pixel noise. Nothing sleeps so a
+levelling run takes as long as the image processing and optimisation.
+'''
+
+PARTICLES = {'balls': {'sign': 1, 'background': 200, 'foreground': 30},
+             'bubbles': {'sign': -1, 'background': 40, 'foreground': 220}}
+
+
+class SimulatedRig:
+    def __init__(self,
+                 boundary_pts,
+                 particles='balls',
+                 level=(0, 0),
+                 sensitivity=0.15,
+                 n_particles=300,
+                 radius=6,
+                 img_shape=(480, 640),
+                 noise=5.0,
+                 decorrelation=1.0,
+                 melt_duty=600,
+                 motor_pos=(0, 0),
+                 seed=None):
+        """
+        Args:
+            boundary_pts (list of (x, y)): tray boundary in image coordinates
+            particles (str, optional): 'balls' or 'bubbles'. Defaults to 'balls'.
+            level (tuple, optional): motor position (x, y) at which the tray is level. Defaults to (0, 0).
+            sensitivity (float, optional): pixels the centre of mass moves per motor step for small tilts. Defaults to 0.15.
+            n_particles (int, optional): number of particles. Defaults to 300.
+            radius (int, optional): particle radius in pixels. Defaults to 6.
+            img_shape (tuple, optional): (height, width) of frames. Defaults to (480, 640).
+            noise (float, optional): standard deviation of pixel noise. Defaults to 5.0.
+            decorrelation (float, optional): fraction of particles moved by each anneal. Defaults to 1.0.
+            melt_duty (int, optional): the tray is annealed when the duty cycle drops from at or above this. Defaults to 600.
+            motor_pos (tuple, optional): initial motor position. Defaults to (0, 0).
+            seed (int, optional): random seed. Defaults to None.
+        """
+        if particles not in PARTICLES:
+            raise ValueError("particles must be one of " + str(tuple(PARTICLES)))
+        self.boundary_pts = boundary_pts
+        self.particles = particles
+        self.level = level
+        self.sensitivity = sensitivity
+        self.n_particles = n_particles
+        self.radius = radius
+        self.img_shape = img_shape
+        self.noise = noise
+        self.decorrelation = decorrelation
+        self.melt_duty = melt_duty
+        self.rng = np.random.default_rng(seed)
+        self.anneal_count = 0
+
+        pts = np.array([[pt[0], pt[1]] for pt in boundary_pts], dtype=float)
+        self._bounds = pts.min(axis=0), pts.max(axis=0)
+        # Tilt needed for the chosen sensitivity: for small tilts the mean moves by variance * tilt
+        sample = self._uniform(20000)
+        self.centre = sample.mean(axis=0)
+        self._tilt_per_step = sensitivity / sample.var(axis=0)
+
+        self.motors = SimulatedMotors(self, *motor_pos)
+        self.shaker = SimulatedShaker(self)
+        self.camera = SimulatedCamera(self)
+        self.positions = self._sample(n_particles)
+
+        # disc stencil used to render every particle in one indexing operation
+        dy, dx = np.mgrid[-radius:radius + 1, -radius:radius + 1]
+        inside = dx**2 + dy**2 <= radius**2
+        self._stencil = dx[inside], dy[inside]
+
+    @property
+    def tilt(self):
+        """Tilt (1/pixels) in x and y from the motor positions. Particles are weighted by exp(sign * tilt . r)"""
+        offset = np.array([self.motors.x - self.level[0], self.motors.y - self.level[1]], dtype=float)
+        return self._tilt_per_step * offset
+
+    def _uniform(self, n):
+        """n points uniformly distributed inside the boundary"""
+        lower, upper = self._bounds
+        points = np.zeros((0, 2))
+        while len(points) < n:
+            candidates = lower + (upper - lower) * self.rng.random((2 * n, 2))
+            candidates = candidates[inside_polygon(candidates[:, 0], candidates[:, 1], self.boundary_pts)]
+            points = np.concatenate((points, candidates))
+        return points[:n]
+
+    def _sample(self, n):
+        """n positions drawn from the tilted distribution"""
+        candidates = self._uniform(20 * n)
+        energy = PARTICLES[self.particles]['sign'] * (candidates - self.centre) @ self.tilt
+        weights = np.exp(energy - energy.max())
+        chosen = self.rng.choice(len(candidates), size=n, replace=False, p=weights / weights.sum())
+        return candidates[chosen]
+
+    def anneal(self):
+        """Melt and recrystallise the tray. A fraction decorrelation of particles take new positions."""
+        moved = self.rng.random(self.n_particles) < self.decorrelation
+        if np.any(moved):
+            self.positions[moved] = self._sample(np.count_nonzero(moved))
+        self.anneal_count += 1
+
+    def com(self):
+        """Centre of mass of the particles (x, y)"""
+        return tuple(self.positions.mean(axis=0))
+
+    def render(self):
+        """BGR image of the tray"""
+        style = PARTICLES[self.particles]
+        height, width = self.img_shape
+        img = np.full((height, width), style['background'], dtype=float)
+        x = np.rint(self.positions[:, 0, None]).astype(int) + self._stencil[0][None, :]
+        y = np.rint(self.positions[:, 1, None]).astype(int) + self._stencil[1][None, :]
+        visible = (x >= 0) & (x < width) & (y >= 0) & (y < height)
+        img[y[visible], x[visible]] = style['foreground']
+        if self.noise > 0:
+            img += self.rng.normal(scale=self.noise, size=img.shape)
+        img = np.clip(img, 0, 255).astype(np.uint8)
+        return np.repeat(img[:, :, None], 3, axis=2)
+
+
+class SimulatedMotors:
+    """Stands in for StepperXY"""
+
+    def __init__(self, rig, x=0, y=0):
+        self.rig = rig
+        self.x = x
+        self.y = y
+
+    def movexy(self, x: int, y: int):
+        self.x = x
+        self.y = y
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+class SimulatedShaker:
+    """Stands in for Shaker. Dropping the duty cycle from at or above the rig's melt_duty anneals the tray."""
+
+    def __init__(self, rig):
+        self.rig = rig
+        self.duty = 0
+
+    def set_duty(self, val: int):
+        if self.duty >= self.rig.melt_duty and val < self.duty:
+            self.rig.anneal()
+        self.duty = val
+
+    def set_duty_and_record(self, val: int):
+        self.set_duty(val)
+
+    def ramp(self, start: int, stop: int, rate: float, step_size: int = 1, record: bool = False,
+             stop_at_end: bool = False, progress=None):
+        self.set_duty(start)
+        self.set_duty(0 if stop_at_end else stop)
+
+    def sequence(self, values, rate, record=False, stop_at_end=False):
+        for value in values:
+            self.set_duty(value)
+        if stop_at_end:
+            self.set_duty(0)
+
+    def quit(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+class SimulatedCamera:
+    """Stands in for a labvision camera"""
+
+    def __init__(self, rig):
+        self.rig = rig
+        self.frame_count = 0
+
+    def get_frame(self):
+        self.frame_count += 1
+        return self.rig.render()
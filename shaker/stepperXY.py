@@ -3,8 +3,10 @@ import numpy as np
 
 from labequipment import stepper
 from labequipment.arduino import Arduino
-from .settings import STEPPER_ARDUINO
-from .balance import update_settings_file
+from .settings import rig_settings
+from .settings import update_settings_file
+from .telemetry import traced
+from .serial_monitor import instrument
 
 
 """-------------------------------------------------------------------------------------------------------------------
@@ -42,18 +44,21 @@ class StepperXY(stepper.Stepper):
 
     """
 
-    def __init__(self):
+    def __init__(self, rig=None):
+        """rig is a name in RIGS in settings. The port and settings file of that rig are used."""
         print("stepperxy init")
-        ard = Arduino(STEPPER_ARDUINO)
+        self.rig = rig
+        ard = instrument(Arduino(rig_settings(rig)['STEPPER_ARDUINO']), 'stepper' if rig is None else rig + '.stepper')
         super().__init__(ard)
 
         # read initial positions from file and put in self.x and self.y
-        motor_data = update_settings_file()['motor_pos']
+        motor_data = update_settings_file(rig=rig)['motor_pos']
         motor_data = motor_data.split(",")
         self.x = int(motor_data[0])
         self.y = int(motor_data[1])
         time.sleep(5)
 
+    @traced('stepper.movexy')
     def movexy(self, x: int, y: int):
         """
         x and y are the requested new positions of the motors translated into x and y coordingates.
@@ -86,6 +91,7 @@ class StepperXY(stepper.Stepper):
 
         self._update_motors(motor1_steps, motor2_steps, motor1_dir, motor2_dir)
 
+    @traced('stepper.move_motors')
     def _update_motors(self, motor1_steps, motor2_steps, motor1_dir, motor2_dir):
         success1 = self.move_motor(1, abs(motor1_steps), motor1_dir)
         success2 = self.move_motor(2, abs(motor2_steps), motor2_dir)
@@ -93,7 +99,7 @@ class StepperXY(stepper.Stepper):
         if success1 and success2:
             # Write positions to file
             new_motor_pos = str(self.x) + "," + str(self.y)
-            update_settings_file(motor_pos=new_motor_pos)
+            update_settings_file(motor_pos=new_motor_pos, rig=getattr(self, 'rig', None))
 
         else:
             raise StepperMotorException(success1, success2)
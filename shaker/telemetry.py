@@ -0,0 +1,179 @@
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+
+'''
+Lightweight timing spans to find out where the wall clock goes during levelling and experiments.
+
+Telemetry is off by default. Switch it on with enable() or by setting the environment variable
+SHAKER_TELEMETRY=1 before starting python. When it is off span() returns a shared do-nothing context
+manager, so an instrumented block costs one function call and one flag check.
+
+    from shaker import telemetry
+
+    telemetry.enable()
+    with telemetry.span('get_frame'):
+        img = cam.get_frame()
+
+    @telemetry.traced('stepper.movexy')
+    def movexy(self, x, y):
+        ...
+
+    telemetry.breakdown(since=mark)                 # total seconds in each span since mark = telemetry.mark()
+    telemetry.save_chrome_trace('trace.json')       # open in chrome://tracing or https://ui.perfetto.dev
+
+Spans can be nested and used from several threads. Every span is kept as (name, start, duration, thread, args)
+with times in seconds from time.perf_counter(). Only the last MAX_EVENTS spans are kept so that long running
+processes, such as the daemon or several rigs, do not grow without bound. Save or summarise them at least that
+often.
+'''
+
+MAX_EVENTS = 100000
+
+_enabled = os.environ.get('SHAKER_TELEMETRY', '') not in ('', '0')
+_events = deque(maxlen=MAX_EVENTS)
+# Number of spans ever recorded. Marks count from the start so they stay valid when old spans are dropped.
+_count = 0
+_lock = threading.Lock()
+_origin = time.perf_counter()
+
+
+def enable(on=True):
+    global _enabled
+    _enabled = on
+
+
+def disable():
+    enable(False)
+
+
+def enabled():
+    return _enabled
+
+
+def reset():
+    """Discard all recorded spans"""
+    with _lock:
+        _events.clear()
+
+
+def mark():
+    """Position in the record. Pass to events / breakdown to select only spans that finish after this point."""
+    return _count
+
+
+def events(since=0):
+    """Spans recorded since mark that are still kept"""
+    with _lock:
+        kept = list(_events)
+        dropped = _count - len(kept)
+    return kept[max(since - dropped, 0):]
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ('name', 'args', 'start')
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        global _count
+        end = time.perf_counter()
+        event = (self.name, self.start, end - self.start, threading.get_ident(), self.args)
+        with _lock:
+            _events.append(event)
+            _count += 1
+        return False
+
+
+def span(name, **args):
+    """Context manager timing the enclosed block. args are stored with the span and shown in the trace viewer."""
+    if not _enabled:
+        return _NULL_SPAN
+    return _Span(name, args)
+
+
+def traced(name=None):
+    """Decorator timing every call of a function. The span name defaults to the function's qualified name."""
+    def decorator(fn):
+        span_name = fn.__qualname__ if name is None else name
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            with _Span(span_name, {}):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def breakdown(since=0, thread=None):
+    """Total time and number of calls of each span name recorded since mark
+
+    Times of nested spans are included in their parents as well as being listed on their own.
+    thread is a threading.get_ident() to count only the spans of one thread, e.g. one rig when several are run
+    from one process. Spans recorded by worker threads with a thread=ident arg are counted with that thread.
+
+    Returns dict of name : (total seconds, count)
+    """
+    result = {}
+    for name, _, duration, tid, args in events(since):
+        if thread is not None and tid != thread and args.get('thread') != thread:
+            continue
+        total, count = result.get(name, (0.0, 0))
+        result[name] = (total + duration, count + 1)
+    return result
+
+
+def save_breakdown(filename, since=0, thread=None, **info):
+    """Append the breakdown since mark to filename as one line of json. info (e.g. evaluation number,
+    motor positions) is stored alongside."""
+    record = dict(info, spans={name: {'seconds': total, 'count': count}
+                               for name, (total, count) in breakdown(since, thread=thread).items()})
+    with open(filename, 'a') as f:
+        f.write(json.dumps(record) + '\n')
+
+
+def save_chrome_trace(filename, since=0):
+    """Save spans in the Chrome trace event format"""
+    pid = os.getpid()
+    trace = [{'name': name,
+              'ph': 'X',
+              'ts': (start - _origin) * 1e6,
+              'dur': duration * 1e6,
+              'pid': pid,
+              'tid': tid,
+              'args': {key: _jsonable(value) for key, value in args.items()}}
+             for name, start, duration, tid, args in events(since)]
+    tmp_filename = filename + '.tmp'
+    with open(tmp_filename, 'w') as f:
+        json.dump({'traceEvents': trace, 'displayTimeUnit': 'ms'}, f)
+    os.replace(tmp_filename, filename)
+
+
+def _jsonable(value):
+    try:
+        json.dumps(value)
+        return value
+    except TypeError:
+        return str(value)
@@ -0,0 +1,15 @@
+# Boundary of the tray in the synthetic 480x640 frames
+BOUNDARY_PTS = ((227, 5), (429, 7), (522, 181), (422, 349), (225, 347), (126, 174))
+
+
+class FakeDisplayer:
+    """Stands in for labvision.images.Displayer so tests and benchmarks open no windows"""
+
+    def __init__(self, img, title=''):
+        self.window_name = title
+
+    def update_im(self, img):
+        pass
+
+    def close_window(self):
+        pass
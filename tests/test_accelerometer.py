@@ -0,0 +1,71 @@
+import time
+import numpy as np
+import pytest
+
+pytest.importorskip('labequipment')
+from shaker.accelerometer import AccelerometerReader, RingBuffer
+
+
+class FakeAccelerometerArduino:
+    """Emulates the accelerometer Arduino sending a line every few ms"""
+
+    def __init__(self, peak_z=2.5):
+        self.peak_z = peak_z
+        self.error = None
+
+    def read_serial_line(self):
+        time.sleep(0.002)
+        if self.error is not None:
+            raise self.error
+        return '0.1,0.2,{}'.format(self.peak_z)
+
+
+def test_ring_buffer_keeps_latest_rows():
+    buffer = RingBuffer(3, columns=1)
+    for i in range(5):
+        buffer.append(i)
+    np.testing.assert_array_equal(buffer.get()[:, 0], [2, 3, 4])
+
+
+def test_reader_buffers_stream():
+    ard = FakeAccelerometerArduino()
+    with AccelerometerReader(ard=ard, buffer_size=1000) as acc:
+        t0 = time.time()
+        times, values = acc.wait_for_samples(10, since=t0, timeout=2)
+        assert len(values) >= 10
+        assert np.all(times >= t0)
+        np.testing.assert_allclose(acc.mean(1), 2.5)
+        ard.peak_z = 3.0
+        t1 = acc.mark('duty', 600)
+        _, values = acc.wait_for_samples(5, since=t1 + 0.01, timeout=2)
+        np.testing.assert_allclose(values, 3.0)
+        assert acc.events[0][1:] == ('duty', 600)
+
+
+def test_wait_until_settled_returns_after_transient():
+    ard = FakeAccelerometerArduino(peak_z=1.0)
+    with AccelerometerReader(ard=ard) as acc:
+        t0 = acc.mark('duty', 600)
+        ard.peak_z = 2.0
+        mean, uncertainty, settle_time, settled = acc.wait_until_settled(
+            t0, window=0.05, tolerance=0.01, timeout=2)
+        assert settled
+        assert time.time() - t0 < 1
+        np.testing.assert_allclose(mean, 2.0)
+        assert uncertainty < 0.01
+        assert settle_time >= 0
+
+
+def test_port_error_is_raised_by_queries():
+    ard = FakeAccelerometerArduino()
+    with AccelerometerReader(ard=ard) as acc:
+        t0 = time.time()
+        acc.wait_for_samples(5, since=t0, timeout=2)
+        ard.error = OSError('device disconnected')
+        # a wait that started before the error is woken up by it
+        with pytest.raises(OSError, match='disconnected'):
+            acc.wait_for_samples(10 ** 6, since=t0, timeout=2)
+        assert time.time() - t0 < 1
+        for query in (lambda: acc.mean(1), acc.latest, lambda: acc.wait_until_settled(t0, timeout=2)):
+            with pytest.raises(OSError, match='disconnected'):
+                query()
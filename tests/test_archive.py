@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from shaker.archive import Archive, ArchiveWriter, ReplayRig, replay_com, replay_settings
+from shaker.centre_mass import find_com, measure_com
+from shaker.settings import SETTINGS_com_balls
+from shaker.simulation import SimulatedRig
+from conftest import BOUNDARY_PTS
+
+POSITIONS = [(0, 0), (200, 0), (0, 200)]
+
+
+def dark_com(img, pts, img_settings=None, debug=False):
+    """Centre of mass of dark pixels, standing in for com_balls"""
+    return find_com(img[:, :, 0] < img_settings['threshold'])
+
+
+def record_session(path, chunk_size=4):
+    rig = SimulatedRig(BOUNDARY_PTS, img_shape=(360, 640), seed=0)
+    settings = replay_settings(SETTINGS_com_balls)
+    settings['img_processing'] = dict(settings['img_processing'], img_fn=dark_com)
+    coms = []
+    with ArchiveWriter(path, chunk_size=chunk_size, info={'boundary_pts': BOUNDARY_PTS}) as recorder:
+        shaker, cam, motors = recorder.shaker(rig.shaker), recorder.camera(rig.camera), recorder.motors(rig.motors)
+        for evaluation, position in enumerate(POSITIONS):
+            recorder.state['evaluation'] = evaluation
+            motors.movexy(*position)
+            for _ in range(3):
+                coms.append(measure_com(cam, shaker, BOUNDARY_PTS, settings=settings))
+            recorder.log('evaluation', cost=1.0)
+    return settings, np.array(coms)
+
+
+def test_record_and_read(tmp_path):
+    path = str(tmp_path / 'session')
+    record_session(path)
+    archive = Archive(path)
+
+    assert len(archive) == 9
+    assert archive.info['boundary_pts'][0] == list(BOUNDARY_PTS[0])
+    # frames are stored as grayscale and returned as bgr
+    assert archive.frame(8, bgr=False).shape == (360, 640)
+    assert archive.frame(8).shape == (360, 640, 3)
+    assert archive.frame(8).dtype == np.uint8
+    np.testing.assert_array_equal(archive.positions()[::3], POSITIONS)
+    frame = archive.frame_events[4]
+    assert frame['evaluation'] == 1
+    assert frame['duty'] == SETTINGS_com_balls['shaker_settings']['measure_duty']
+    assert [event['type'] for event in archive.select('evaluation')] == ['evaluation'] * 3
+    with pytest.raises(IndexError):
+        archive.frame(9)
+
+
+def test_replay(tmp_path):
+    path = str(tmp_path / 'session')
+    settings, coms = record_session(path)
+    archive = Archive(path)
+
+    # recomputing the centre of mass of the recorded frames reproduces the session
+    np.testing.assert_allclose(replay_com(archive, BOUNDARY_PTS, settings['img_processing']), coms)
+
+    rig = ReplayRig(archive)
+    rig.motors.movexy(190, 10)
+    replayed = [measure_com(rig.camera, rig.shaker, BOUNDARY_PTS, settings=settings) for _ in range(4)]
+    # frames at the nearest recorded position are replayed in order and then repeated
+    np.testing.assert_allclose(replayed, np.concatenate((coms[3:6], coms[3:4])))
@@ -1,98 +1,101 @@
-import sys
 import os
-sys.path.insert(1, os.path.join(sys.path[0], '..'))
+import types
+import time
 
 import numpy as np
-from time import sleep
-from labvision.images import read_img, display
-from distutils.command.check import check
-from balance import Balancer, check_convergence, find_centre
-from labvision.images import draw_circle
-
-
-
-home = os.environ['USERPROFILE']
-
-
-class FakeCam:
-    def __init__(self):
-        self.filename = 'tests/test_resources/shaker_pic.jpg'
-
-    def get_frame(self):
-        img = read_img(self.filename)
-        print(np.shape(img))
-        return img
-
-
-class FakeShaker:
-    def __init__(self):
-        pass
-
-    def change_duty(self, val):
-        print(val)
-
-    def ramp(self, start_val, stop_val, step):
-        for val in range(start_val, stop_val, step):
-            self.change_duty(val)
-
-
-class FakeMotors:
-    def __init__(self):
-        self.reset_origin()
-
-    def movexy(self, x: float, y: float):
-        """This assumes that the 2 motors are front left and right. dY requires moving both in same direction. 
-        dX requires moving in opposite direction. dx and dy are measured in steps"""
-        dx = x-self.x_motor
-        dy = y-self.y_motor
-
-        self.x_motor = x
-        self.y_motor = y
-
-    def reset_origin(self):
-        self.x_motor = 0
-        self.y_motor = 0
-
-
-def fake_measure_com(cam, pts, shaker, new_xy_coords):
-    """Make up a relationship between motor position and the com of the particles which has one global minimum and add some noise"""
-    xc, yc = find_centre(pts)
-    x_coord, y_coord = new_xy_coords
-
-    x_result = np.sqrt((50+x_coord-xc)**2) + np.random.normal(scale=10)
-    y_result = np.sqrt((100+y_coord-yc)**2) + np.random.normal(scale=10)
-    return x_result, y_result
-
-
-def patch_find_boundary(self):
-    pts = ((483, 14), (873, 14), (1069, 343),
-           (877, 685), (490, 689), (296, 355))
-    cx, cy = find_centre(pts)
-    return pts, cx, cy
-
-
-"""--------------------------------------------------------------------------------------------------------------------------
-Tests
------------------------------------------------------------------------------------------------------------------------"""
-
-
-def test_balance():
-    cam = FakeCam()
-    shaker = FakeShaker()
-    motors = FakeMotors()
-
-    dimensions = [(-100, 100), (-100, 100)]
-    initial_pts = [(-50, 0), (50, -50)]
-
-    setattr(Balancer, "_find_boundary", patch_find_boundary)
-    bal = Balancer(shaker, cam, motors, test=True)
-    result = bal.level(fake_measure_com, dimensions,
-                       initial_pts=initial_pts, initial_iterations=10, ncalls=40, tolerance=2)
-    print(result)
-    print("System has been levelled: {}".format(result.x))
-    print("Reduce tolerance and increase iterations and rerun to improve accuracy. Recall sig_2_noise scales as sqrt(N)")
-    return result
-
-
-if __name__ == '__main__':
-    result = test_balance()
\ No newline at end of file
+import pytest
+
+os.environ.setdefault('MPLBACKEND', 'Agg')
+pytest.importorskip('skopt')
+pytest.importorskip('labvision')
+import labvision.images
+
+from shaker import balance, centre_mass, plotting, settings
+from shaker.balance import Balancer
+from shaker.centre_mass import com_balls
+from shaker.simulation import SimulatedRig
+from shaker.archive import Archive, ArchiveWriter, ReplayRig, replay_settings
+from conftest import BOUNDARY_PTS, FakeDisplayer
+
+# Motor position at which the tray is level
+LEVEL = (120, -80)
+
+
+@pytest.fixture
+def rig(tmp_path, monkeypatch):
+    """Simulated rig with settings in tmp_path, no display windows and no waiting"""
+    monkeypatch.setattr(settings, 'SETTINGS_PATH', str(tmp_path) + '/')
+    monkeypatch.setattr(labvision.images, 'Displayer', FakeDisplayer)
+    no_sleep = types.SimpleNamespace(sleep=lambda t: None, time=time.time)
+    monkeypatch.setattr(balance, 'time', no_sleep)
+    monkeypatch.setattr(centre_mass, 'time', no_sleep)
+    rig = SimulatedRig(BOUNDARY_PTS, level=LEVEL, img_shape=(360, 640), seed=0)
+    settings.update_settings_file(motor_pos='0,0', motor_limits=[(-400, 400), (-400, 400)],
+                                  motor_pts=[(200, 100), (450, 100), (450, 250), (200, 250)],
+                                  boundary_pts=(BOUNDARY_PTS, *rig.centre))
+    return rig
+
+
+def test_balance(rig):
+    bal = Balancer(rig.shaker, rig.camera, rig.motors, measure_fn=com_balls)
+    assert bal.cx == pytest.approx(rig.centre[0])
+
+    result = bal.level(iterations=2, ncalls=20)
+
+    # Every evaluation is logged
+    track = np.loadtxt(settings.SETTINGS_PATH + settings.TRACK_LEVEL, delimiter=',')
+    assert len(track) == 20
+    # Every measurement annealed the tray
+    assert rig.anneal_count >= 40
+    # The best point is much closer to level than the furthest corner of the search space
+    worst = rig.sensitivity * np.hypot(400 + abs(LEVEL[0]), 400 + abs(LEVEL[1]))
+    assert result.fun < worst / 4
+    assert (rig.motors.x, rig.motors.y) == tuple(result.x)
+
+
+def test_record_and_replay(rig, tmp_path):
+    with ArchiveWriter(str(tmp_path / 'session')) as recorder:
+        bal = Balancer(rig.shaker, rig.camera, rig.motors, measure_fn=com_balls, recorder=recorder)
+        bal.level(iterations=2, ncalls=10)
+    archive = Archive(str(tmp_path / 'session'))
+    assert len(archive.select('evaluation')) == 10
+    assert archive.info['measure_fn'] == 'com_balls'
+
+    replay = ReplayRig(archive)
+    bal = Balancer(replay.shaker, replay.camera, replay.motors, measure_fn=com_balls)
+    bal.com_settings = replay_settings(bal.com_settings)
+    result = bal.level(iterations=2, ncalls=10)
+    assert len(result.func_vals) == 10
+
+
+def test_level_rigs_concurrently(rig, monkeypatch):
+    from shaker.rigs import RigScheduler
+
+    monkeypatch.setattr(settings, 'RIGS', {'shaker1': {},
+                                           'shaker2': {'SETTINGS_FILE': 'shaker2_params.txt',
+                                                       'TRACK_LEVEL': 'shaker2_level.txt'}})
+    rigs = {'shaker1': rig, 'shaker2': SimulatedRig(BOUNDARY_PTS, level=(-50, 30), img_shape=(360, 640), seed=1)}
+    settings.update_settings_file(motor_pos='0,0', motor_limits=[(-400, 400), (-400, 400)],
+                                  motor_pts=[(200, 100), (450, 100), (450, 250), (200, 250)],
+                                  boundary_pts=(BOUNDARY_PTS, *rigs['shaker2'].centre), rig='shaker2')
+
+    def no_windows(*args, **kwargs):
+        raise RuntimeError('windows can only be opened in the main thread')
+    monkeypatch.setattr(labvision.images, 'Displayer', no_windows)
+    monkeypatch.setattr(plotting, 'LevellingMonitor', no_windows)
+
+    def level(name):
+        sim = rigs[name]
+        bal = Balancer(sim.shaker, sim.camera, sim.motors, measure_fn=com_balls, rig=name, display=False)
+        return bal.level(iterations=1, ncalls=8)
+
+    scheduler = RigScheduler()
+    for name in rigs:
+        scheduler.add(name, level)
+    status = scheduler.run()
+
+    assert [status[name]['state'] for name in rigs] == ['done', 'done'], status
+    for name in rigs:
+        track_file = settings.SETTINGS_PATH + settings.rig_settings(name)['TRACK_LEVEL']
+        assert len(np.loadtxt(track_file, delimiter=',')) == 8
+        assert (rigs[name].motors.x, rigs[name].motors.y) == tuple(scheduler.jobs[name][0].result.x)
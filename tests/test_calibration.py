@@ -0,0 +1,57 @@
+import numpy as np
+
+from shaker import settings
+from shaker.calibration import AccelerationCalibration
+
+
+def make_calibration_file(tmp_path, name='accelerometer.csv'):
+    duty_cycles = np.arange(0, 1000, 50)
+    acceleration = np.clip((duty_cycles - 200) / 150, 0, None)
+    acceleration[10] -= 0.3     # noisy non-monotone point
+    filename = str(tmp_path / name)
+    np.savetxt(filename, np.stack((duty_cycles, acceleration), axis=1), delimiter=',',
+               header='duty_cycle,acceleration', comments='')
+    return filename
+
+
+def test_calibration_is_monotone_and_invertible(tmp_path):
+    cal = AccelerationCalibration.from_file(make_calibration_file(tmp_path))
+    assert np.all(np.diff(cal.table_gamma) >= 0)
+
+    gamma = np.array([0.5, 1.0, 2.0, 4.0])
+    duty = cal.duty(gamma)
+    assert np.all(cal.gamma(duty) >= gamma)
+    assert np.all(cal.gamma(duty - 1) < gamma)
+    assert cal.duty(100) == 950
+
+
+def test_duty_is_clipped_to_calibrated_duty_cycles():
+    cal = AccelerationCalibration([300, 500, 700], [1.0, 2.0, 3.0])
+    assert cal.duty(0.5) == 300
+    assert cal.duty(10) == 700
+    np.testing.assert_array_equal(cal.duty([0, 2.0, 10]), [300, 500, 700])
+
+
+def test_calibration_is_cached(tmp_path):
+    filename = make_calibration_file(tmp_path)
+    assert AccelerationCalibration.from_file(filename) is AccelerationCalibration.from_file(filename)
+
+
+def test_default_file_is_looked_up_when_called(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, 'SETTINGS_PATH', str(tmp_path) + '/')
+    monkeypatch.setattr(settings, 'ACCELEROMETER_FILE', 'shaker1.csv')
+    monkeypatch.setattr(settings, 'RIGS', {'shaker2': {'ACCELEROMETER_FILE': 'shaker2.csv'}})
+    shaker1 = make_calibration_file(tmp_path, 'shaker1.csv')
+    shaker2 = make_calibration_file(tmp_path, 'shaker2.csv')
+    assert AccelerationCalibration.from_file() is AccelerationCalibration.from_file(shaker1)
+    assert AccelerationCalibration.from_file(rig='shaker2') is AccelerationCalibration.from_file(shaker2)
+
+
+def test_ramp_schedule_is_linear_in_gamma(tmp_path):
+    cal = AccelerationCalibration.from_file(make_calibration_file(tmp_path))
+    duty_cycles, times = cal.ramp_schedule(3.0, 1.0, rate=0.5)
+    assert duty_cycles[0] == cal.duty(3.0)
+    assert duty_cycles[-1] == cal.duty(1.0)
+    assert np.all(np.diff(times) > 0)
+    np.testing.assert_allclose(times, np.abs(cal.gamma(duty_cycles) - cal.gamma(duty_cycles[0])) / 0.5)
+    np.testing.assert_allclose(times[-1], 4.0, atol=0.05)
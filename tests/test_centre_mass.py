@@ -0,0 +1,65 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from shaker import telemetry
+from shaker.centre_mass import find_com, measure_com, measure_com_repeated
+from shaker.simulation import SimulatedRig
+from conftest import BOUNDARY_PTS
+
+DELAY = 0.1
+
+
+def slow_com(img, pts, img_settings=None, debug=False):
+    """Centre of mass of dark pixels taking img_settings['delay'] seconds like com_balls"""
+    if img_settings.get('fail'):
+        raise ValueError('bad frame')
+    time.sleep(img_settings['delay'])
+    return find_com(img[:, :, 0] < 100)
+
+
+def make_settings(**img_processing):
+    return {'img_processing': dict({'img_fn': slow_com, 'delay': DELAY}, **img_processing),
+            'shaker_settings': {'initial_duty': 650, 'measure_duty': 560, 'wait_time': DELAY,
+                                'measure_time': 0, 'ramp_time': 0}}
+
+
+def test_pipelined_measurements_match_sequential():
+    settings = make_settings()
+    rig = SimulatedRig(BOUNDARY_PTS, img_shape=(360, 640), seed=0)
+    expected = [measure_com(rig.camera, rig.shaker, BOUNDARY_PTS, settings=settings) for _ in range(4)]
+
+    rig = SimulatedRig(BOUNDARY_PTS, img_shape=(360, 640), seed=0)
+    x, y = measure_com_repeated(rig.camera, rig.shaker, BOUNDARY_PTS, settings=settings, iterations=4)
+    np.testing.assert_allclose(np.column_stack((x, y)), expected)
+    assert rig.anneal_count == 4
+
+
+def test_processing_overlaps_next_anneal():
+    rig = SimulatedRig(BOUNDARY_PTS, img_shape=(360, 640), seed=0)
+    start = time.perf_counter()
+    measure_com_repeated(rig.camera, rig.shaker, BOUNDARY_PTS, settings=make_settings(), iterations=4)
+    elapsed = time.perf_counter() - start
+    # 4 anneals and only the last processing are on the critical path, rather than 8 * DELAY in sequence
+    assert elapsed < 6.5 * DELAY
+
+
+def test_processing_errors_are_raised():
+    rig = SimulatedRig(BOUNDARY_PTS, img_shape=(360, 640), seed=0)
+    with pytest.raises(ValueError, match='bad frame'):
+        measure_com_repeated(rig.camera, rig.shaker, BOUNDARY_PTS, settings=make_settings(fail=True), iterations=2)
+
+
+def test_worker_processing_is_counted_with_caller():
+    rig = SimulatedRig(BOUNDARY_PTS, img_shape=(360, 640), seed=0)
+    telemetry.enable()
+    try:
+        mark = telemetry.mark()
+        measure_com_repeated(rig.camera, rig.shaker, BOUNDARY_PTS, settings=make_settings(delay=0), iterations=3)
+        spans = telemetry.breakdown(mark, thread=threading.get_ident())
+    finally:
+        telemetry.disable()
+    assert spans['measure_com.processing'][1] == 3
+    assert spans['camera.get_frame'][1] == 3
@@ -0,0 +1,116 @@
+import time
+
+import numpy as np
+import pytest
+
+from shaker.calibration import AccelerationCalibration
+from shaker.control import AccelerationController, AccelerationRegulator, control_loop
+
+
+def make_calibration():
+    duty_cycles = np.arange(0, 1000, 50)
+    return AccelerationCalibration(duty_cycles, np.clip((duty_cycles - 200) / 150, 0, None))
+
+
+class SimulatedPlant:
+    """First order response of the shaker to duty changes. The true acceleration differs from the
+    calibration by a gain (e.g. temperature drift) and the accelerometer adds noise."""
+
+    def __init__(self, calibration, gain=0.85, tau=0.3, noise=0.01, seed=0):
+        self.calibration = calibration
+        self.gain = gain
+        self.tau = tau
+        self.noise = noise
+        self.rng = np.random.default_rng(seed)
+        self.t = 0
+        self.gamma = 0
+        self.duty = 0
+
+    def set_duty(self, duty):
+        self.duty = duty
+
+    def sleep(self, dt):
+        steps = max(int(dt / 0.01), 1)
+        target = self.gain * self.calibration.gamma(self.duty)
+        for _ in range(steps):
+            self.gamma += (target - self.gamma) * (dt / steps) / self.tau
+        self.t += dt
+
+    def clock(self):
+        return self.t
+
+    def measure(self):
+        return self.gamma + self.rng.normal(scale=self.noise)
+
+
+def run(plant, controller, target):
+    return control_loop(controller, plant.set_duty, plant.measure, target, tolerance=0.05,
+                        hold_time=1.0, interval=0.1, timeout=30, clock=plant.clock, sleep=plant.sleep)
+
+
+def test_open_loop_misses_target_with_drift():
+    calibration = make_calibration()
+    plant = SimulatedPlant(calibration)
+    time_to_target, _ = run(plant, AccelerationController(calibration, kp=0, ki=0), 3.0)
+    assert np.isnan(time_to_target)
+
+
+def test_pi_control_reaches_and_holds_target():
+    calibration = make_calibration()
+    plant = SimulatedPlant(calibration)
+    controller = AccelerationController(calibration)
+    for target in (3.0, 1.5, 4.0):
+        time_to_target, duty = run(plant, controller, target)
+        assert time_to_target < 5
+        assert abs(plant.gamma - target) < 0.05
+        assert duty > calibration.duty(target)
+
+
+def test_regulator_corrects_drift_after_reaching_target():
+    calibration = make_calibration()
+    plant = SimulatedPlant(calibration)
+    regulator = AccelerationRegulator(AccelerationController(calibration), plant.set_duty, plant.measure,
+                                      interval=0.1, clock=plant.clock, sleep=plant.sleep)
+    regulator.set_target(3.0)
+    for gain in (0.85, 0.75, 0.95):
+        plant.gain = gain   # the shaker drifts while the experiment runs
+        for _ in range(100):
+            plant.sleep(regulator.interval)
+            regulator.step()
+        assert regulator.on_target()
+        assert abs(plant.gamma - 3.0) < 0.05
+
+
+def test_regulator_runs_until_stopped():
+    calibration = make_calibration()
+    plant = SimulatedPlant(calibration)
+    with AccelerationRegulator(AccelerationController(calibration), plant.set_duty, plant.measure,
+                               interval=0.01).start(2.0) as regulator:
+        assert regulator.running()
+        time.sleep(0.1)
+    assert not regulator.running()
+    assert regulator.duty == plant.duty
+
+
+def test_regulator_error_is_raised_by_stop():
+    calibration = make_calibration()
+    plant = SimulatedPlant(calibration)
+
+    applied = []
+
+    def set_duty(duty):
+        # the feed-forward duty cycle is applied, the first correction fails
+        if applied:
+            raise OSError('serial port closed')
+        applied.append(duty)
+        plant.set_duty(duty)
+
+    regulator = AccelerationRegulator(AccelerationController(calibration), set_duty, plant.measure, interval=0.01)
+    with pytest.raises(OSError, match='serial port closed'):
+        with regulator.start(2.0):
+            time.sleep(0.1)
+            # regulation stopped at the first step
+            assert not regulator.running()
+    assert isinstance(regulator.error, OSError)
+    # raised once
+    assert regulator.stop() == regulator.duty
@@ -0,0 +1,128 @@
+import threading
+import time
+
+import pytest
+
+from shaker import daemon as daemon_module
+from shaker.daemon import DaemonClient, DaemonError, ShakerDaemon, load_authkey, new_authkey
+from shaker.simulation import SimulatedRig
+from conftest import BOUNDARY_PTS
+
+AUTHKEY = b'test'
+
+
+class SlowShaker:
+    """Records the order in which duty cycles are applied"""
+
+    def __init__(self):
+        self.applied = []
+
+    def set_duty(self, val):
+        self.applied.append(('start', val))
+        time.sleep(0.01)
+        self.applied.append(('end', val))
+
+    def fail(self):
+        raise ValueError('firmware says no')
+
+    def quit(self):
+        self.applied.append(('quit', None))
+
+
+@pytest.fixture
+def daemon():
+    rig = SimulatedRig(BOUNDARY_PTS, seed=0)
+    daemon = ShakerDaemon({'shaker': SlowShaker(), 'motors': rig.motors, 'camera': rig.camera},
+                          address=('localhost', 0), authkey=AUTHKEY)
+    thread = daemon.start()
+    yield daemon
+    daemon.stop()
+    thread.join(timeout=2)
+
+
+def test_remote_devices(daemon):
+    with DaemonClient(daemon.address, authkey=AUTHKEY) as client:
+        assert set(client.devices()) == {'shaker', 'motors', 'camera'}
+        motors = client.device('motors')
+        motors.movexy(100, -20)
+        assert (motors.x, motors.y) == (100, -20)
+        assert client.device('camera').get_frame().shape == (480, 640, 3)
+
+        shaker = client.device('shaker')
+        with pytest.raises(DaemonError, match='firmware says no'):
+            shaker.fail()
+        with pytest.raises(AttributeError):
+            shaker.missing
+        with pytest.raises(DaemonError):
+            client.get('shaker', '_private')
+    # device state persists between clients
+    with DaemonClient(daemon.address, authkey=AUTHKEY) as client:
+        assert client.get('motors', 'x') == 100
+
+
+def test_clients_share_devices_safely(daemon):
+    def worker(offset):
+        with DaemonClient(daemon.address, authkey=AUTHKEY) as client:
+            shaker = client.device('shaker')
+            with client.lock('shaker'):
+                for val in range(offset, offset + 3):
+                    shaker.set_duty(val)
+
+    threads = [threading.Thread(target=worker, args=(offset,)) for offset in (100, 200, 300)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    applied = daemon.devices['shaker'].applied
+    # calls never overlap and each locked sequence runs without interruption
+    assert [step for step, _ in applied] == ['start', 'end'] * 9
+    values = [val for step, val in applied if step == 'start']
+    for i in range(0, 9, 3):
+        assert values[i:i + 3] == list(range(values[i], values[i] + 3))
+
+
+def test_wrong_authkey_is_refused(daemon):
+    with pytest.raises(Exception):
+        DaemonClient(daemon.address, authkey=b'wrong')
+
+
+def test_lifecycle_methods_are_blocked(daemon):
+    with DaemonClient(daemon.address, authkey=AUTHKEY) as client:
+        assert 'quit' not in client.devices()['shaker']
+        with pytest.raises(DaemonError, match='quit'):
+            client.call('shaker', 'quit')
+    assert daemon.devices['shaker'].applied == []
+
+
+def test_locks_in_any_order_do_not_deadlock(daemon):
+    def worker(devices):
+        with DaemonClient(daemon.address, authkey=AUTHKEY) as client:
+            for _ in range(20):
+                with client.lock(*devices):
+                    client.call('shaker', 'set_duty', 1)
+
+    threads = [threading.Thread(target=worker, args=(devices,), daemon=True)
+               for devices in (('shaker', 'motors'), ('motors', 'shaker'))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+    assert not any(thread.is_alive() for thread in threads)
+
+
+def test_authkey_comes_from_environment_or_key_file(tmp_path, monkeypatch):
+    key_file = str(tmp_path / 'daemon_key')
+    monkeypatch.setitem(daemon_module.DAEMON, 'AUTHKEY_FILE', key_file)
+    monkeypatch.delenv(daemon_module.AUTHKEY_ENV, raising=False)
+    with pytest.raises(ValueError, match='--new-key'):
+        load_authkey()
+    key = new_authkey()
+    assert load_authkey() == key
+    monkeypatch.setenv(daemon_module.AUTHKEY_ENV, 'from environment')
+    assert load_authkey() == b'from environment'
+    monkeypatch.setenv(daemon_module.AUTHKEY_ENV, 'shaker_SETAUTHKEY')
+    with pytest.raises(ValueError, match='placeholder'):
+        load_authkey()
+    with pytest.raises(ValueError, match='placeholder'):
+        ShakerDaemon({}, address=('localhost', 0), authkey=b'shaker_SETAUTHKEY')
@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+
+from shaker.analysis.hexatic import local_hexatic, hexatic_order, image_order, inside_polygon, distance_to_polygon
+
+
+def hexagonal_lattice(n, spacing=10.0):
+    i, j = np.meshgrid(np.arange(n), np.arange(n))
+    x = spacing * (i + 0.5 * (j % 2))
+    y = spacing * np.sqrt(3) / 2 * j
+    return x.ravel(), y.ravel()
+
+
+def test_polygon_helpers():
+    square = ((0, 0), (10, 0), (10, 10), (0, 10))
+    np.testing.assert_array_equal(inside_polygon([5, 15, 1], [5, 5, 9], square), [True, False, True])
+    np.testing.assert_allclose(distance_to_polygon([5, 15, 1], [5, 5, 9], square), [5, 5, 1])
+
+
+def test_hexagonal_lattice_is_ordered_in_every_frame():
+    x, y = hexagonal_lattice(20)
+    rng = np.random.default_rng(0)
+    frames = np.repeat([0, 1], len(x))
+    x = np.concatenate((x, x + 3))
+    y = np.concatenate((y, rng.permutation(y)))
+    boundary = ((20, 20), (170, 20), (170, 140), (20, 140))
+
+    psi6 = local_hexatic(x, y, frames=frames, boundary_pts=boundary)
+    ordered = psi6[frames == 0]
+    disordered = psi6[frames == 1]
+    interior = ~np.isnan(ordered)
+    assert interior.sum() > 50
+    np.testing.assert_allclose(np.abs(ordered[interior]), 1)
+    assert np.nanmean(np.abs(disordered)) < 0.6
+    assert np.all(np.isnan(ordered[~inside_polygon(x[:len(interior)], y[:len(interior)], boundary)]))
+
+
+def test_hexatic_order_adds_columns():
+    x, y = hexagonal_lattice(10)
+    dataframe = pd.DataFrame({'x': x, 'y': y}, index=np.zeros(len(x), dtype=int))
+    result = hexatic_order(dataframe)
+    assert {'hexatic_order', 'hexatic_order_abs'} <= set(result.columns)
+    assert 'hexatic_order' not in dataframe.columns
+
+
+def test_image_order_separates_crystal_from_disorder():
+    shape = (200, 200)
+    boundary = ((10, 10), (190, 10), (190, 190), (10, 190))
+    x, y = hexagonal_lattice(20, spacing=10.0)
+    rng = np.random.default_rng(0)
+    images = []
+    for px, py in ((x, y), (rng.uniform(0, 190, len(x)), rng.uniform(0, 170, len(x)))):
+        img = np.zeros(shape, dtype=bool)
+        img[np.rint(py).astype(int) + 2, np.rint(px).astype(int) + 2] = True
+        images.append(img)
+    assert image_order(images[0], boundary_pts=boundary) > 0.9
+    assert image_order(images[1], boundary_pts=boundary) < 0.6
+    assert np.isnan(image_order(np.zeros(shape, dtype=bool)))
@@ -0,0 +1,44 @@
+import importlib.util
+import json
+import subprocess
+import sys
+
+import pytest
+
+# Control and analysis modules must not pull in GUI, plotting, optimisation or Windows-only packages
+HEAVY_MODULES = ('PyQt6', 'IPython', 'matplotlib', 'skopt', 'labvision', 'cv2', 'win32com')
+
+# Seconds to import the module once numpy is already loaded
+IMPORT_BUDGET = 0.5
+
+MODULES = ['shaker.settings', 'shaker.centre_mass', 'shaker.balance', 'shaker.calibration',
+           'shaker.control', 'shaker.schedule', 'shaker.find_devices', 'shaker.simulation', 'shaker.archive',
+           'shaker.daemon', 'shaker.rigs', 'shaker.analysis.manifest', 'shaker.analysis.runstore',
+           'shaker.analysis.hexatic']
+# These talk to the arduinos through labequipment
+HARDWARE_MODULES = ['shaker.shaker', 'shaker.stepperXY', 'shaker.accelerometer']
+
+SCRIPT = '''
+import json, sys, time
+import numpy
+t = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - t
+print(json.dumps({{'elapsed': elapsed, 'modules': sorted(sys.modules)}}))
+'''
+
+
+def import_in_subprocess(module):
+    output = subprocess.run([sys.executable, '-c', SCRIPT.format(module=module)],
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+@pytest.mark.parametrize('module', MODULES + HARDWARE_MODULES)
+def test_import_is_fast_and_headless(module):
+    if module in HARDWARE_MODULES and importlib.util.find_spec('labequipment') is None:
+        pytest.skip('labequipment not installed')
+    result = import_in_subprocess(module)
+    loaded = {name.split('.')[0] for name in result['modules']}
+    assert not loaded.intersection(HEAVY_MODULES)
+    assert result['elapsed'] < IMPORT_BUDGET
@@ -0,0 +1,38 @@
+import os
+
+from shaker.analysis.manifest import Manifest
+
+
+def test_manifest_detects_changed_inputs(tmp_path):
+    input_file = tmp_path / 'run.hdf5'
+    input_file.write_text('a')
+    manifest_file = str(tmp_path / 'manifest.json')
+
+    manifest = Manifest(manifest_file)
+    assert manifest.is_stale('run', [str(input_file)])
+    manifest.record('run', [str(input_file)], result=[0.5, 600.0])
+    manifest.save()
+
+    manifest = Manifest(manifest_file)
+    assert not manifest.is_stale('run', [str(input_file)])
+    assert manifest.result('run') == [0.5, 600.0]
+
+    input_file.write_text('ab')
+    assert manifest.is_stale('run', [str(input_file)])
+
+
+def test_manifest_detects_added_inputs_and_missing_outputs(tmp_path):
+    inputs = [str(tmp_path / 'a.txt')]
+    open(inputs[0], 'w').close()
+    manifest = Manifest(str(tmp_path / 'manifest.json'))
+    manifest.record('data', inputs)
+
+    output = str(tmp_path / 'data.txt')
+    assert manifest.is_stale('data', inputs, outputs=[output])
+    open(output, 'w').close()
+    assert not manifest.is_stale('data', inputs, outputs=[output])
+
+    inputs.append(str(tmp_path / 'b.txt'))
+    open(inputs[1], 'w').close()
+    assert manifest.is_stale('data', inputs)
+    assert os.path.isabs(manifest.root)
@@ -0,0 +1,129 @@
+import os
+import types
+
+import numpy as np
+
+os.environ.setdefault('MPLBACKEND', 'Agg')
+from shaker import plotting
+from shaker.plotting import levelling_surface, load_levelling
+
+
+def cost(x, y):
+    return np.hypot(x - 120, y + 80)
+
+
+def write_levelling(filepath, n=25, seed=0):
+    """track_levelling rows: x_motor, y_motor, x_com, y_com, cost, fluctuation"""
+    rng = np.random.default_rng(seed)
+    x, y = rng.uniform(-400, 400, n), rng.uniform(-400, 400, n)
+    corners = np.array([[-400, -400], [-400, 400], [400, -400], [400, 400]])
+    x, y = np.append(x, corners[:, 0]), np.append(y, corners[:, 1])
+    data = np.column_stack((x, y, x, y, cost(x, y), np.ones_like(x)))
+    np.savetxt(filepath, data, delimiter=',')
+    return data
+
+
+def test_load_levelling_is_cached_until_the_file_changes(tmp_path):
+    filepath = str(tmp_path / 'level.txt')
+    data = write_levelling(filepath)
+    loaded, interpolant = load_levelling(filepath)
+    np.testing.assert_allclose(loaded, data)
+    assert load_levelling(filepath)[1] is interpolant
+
+    data = write_levelling(filepath, seed=1)
+    mtime = os.path.getmtime(filepath) + 10
+    os.utime(filepath, (mtime, mtime))
+    loaded, changed = load_levelling(filepath)
+    assert changed is not interpolant
+    np.testing.assert_allclose(loaded, data)
+
+
+def test_levelling_surface_resolution():
+    x = np.array([0, 1000, 0, 1000] * 4)
+    y = np.array([0, 0, 1000, 1000] * 4)
+
+    def interpolant(xi, yi):
+        return cost(xi, yi)
+
+    # 20 sqrt(16) = 80 points per axis
+    xi, yi, cost_i, _ = levelling_surface(x, y, interpolant)
+    assert xi.shape == (80, 80)
+    # never more than max_points
+    xi, _, _, _ = levelling_surface(np.tile(x, 100), np.tile(y, 100), interpolant, max_points=120)
+    assert xi.shape == (120, 120)
+    # nor finer than the motor step
+    xi, yi, _, _ = levelling_surface(x, y // 10, interpolant, motor_step=5)
+    assert xi.shape == (21, 80)
+    assert np.diff(xi[0]).min() >= 5 and np.diff(yi[:, 0]).min() >= 5
+
+
+def test_levelling_surface_finds_minimum(tmp_path):
+    filepath = str(tmp_path / 'level.txt')
+    write_levelling(filepath, n=200)
+    data, interpolant = load_levelling(filepath)
+    xi, yi, cost_i, (x_min, y_min) = levelling_surface(data[:, 0], data[:, 1], interpolant)
+    assert abs(x_min - 120) < 30 and abs(y_min + 80) < 30
+
+
+def test_levelling_surface_uses_gaussian_process_surrogate():
+    class Model:
+        def predict(self, pts):
+            pts = np.asarray(pts)
+            return cost(pts[:, 0], pts[:, 1])
+
+    # the surrogate is evaluated in the transformed search space
+    transformed = []
+
+    def transform(pts):
+        transformed.append(len(pts))
+        return pts
+
+    result_gp = types.SimpleNamespace(models=[None, Model()], space=types.SimpleNamespace(transform=transform))
+    x = np.array([-400, 400, -400, 400])
+    y = np.array([-400, -400, 400, 400])
+    xi, yi, cost_i, (x_min, y_min) = levelling_surface(x, y, interpolant=None, result_gp=result_gp)
+    assert transformed == [xi.size]
+    np.testing.assert_allclose(cost_i, cost(xi, yi))
+    assert abs(x_min - 120) < 20 and abs(y_min + 80) < 20
+
+
+def test_levelling_monitor_throttles_and_blits(monkeypatch):
+    import matplotlib.pyplot as plt
+
+    clock = types.SimpleNamespace(time=lambda: now)
+    monkeypatch.setattr(plotting, 'time', clock)
+    now = 100.0
+    monitor = plotting.LevellingMonitor(min_interval=1)
+    canvas = monitor.fig.canvas
+    assert monitor.blit and monitor.background is not None
+    calls = []
+    for name in ('draw', 'restore_region', 'draw_idle'):
+        method = getattr(canvas, name)
+        monkeypatch.setattr(canvas, name, lambda *args, name=name, method=method: calls.append(name) or method(*args))
+
+    track = [[0, 0, 0, 0, 0.5, 0.1], [10, 5, 0, 0, 0.4, 0.05]]
+    monitor.update(track)
+    # only the points and error bars are drawn over the saved background
+    assert calls == ['restore_region']
+    np.testing.assert_allclose(monitor.points.get_ydata(), [0.5, 0.4])
+    np.testing.assert_allclose(monitor.errors.get_segments()[1], [[1, 0.35], [1, 0.45]])
+    pixels = np.asarray(canvas.buffer_rgba())
+    assert np.any((pixels[..., 0] == 255) & (pixels[..., 1] == 0) & (pixels[..., 2] == 0))
+
+    # too soon after the last draw: the data is stored but not drawn
+    now += 0.5
+    track.append([20, 5, 0, 0, 0.3, 0.05])
+    monitor.update(track)
+    assert calls == ['restore_region']
+    np.testing.assert_allclose(monitor.points.get_ydata(), [0.5, 0.4, 0.3])
+
+    monitor.update(track, force=True)
+    assert calls == ['restore_region', 'restore_region']
+
+    # the axes grow with a full redraw when the points leave them
+    now += 1
+    track.extend([[30, 5, 0, 0, 2.0, 0.1]] * 10)
+    monitor.update(track)
+    assert 'draw' in calls[2:]
+    assert monitor.ax.get_xlim()[1] >= 12 and monitor.ax.get_ylim()[1] >= 2.1
+    plt.close(monitor.fig)
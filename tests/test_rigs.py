@@ -0,0 +1,90 @@
+import threading
+import time
+
+import pytest
+
+from shaker import settings
+from shaker.rigs import RigScheduler
+
+RIGS = {'shaker1': {},
+        'shaker2': {'SETTINGS_FILE': 'shaker2_params.txt', 'TRACK_LEVEL': 'shaker2_level.txt'}}
+
+
+@pytest.fixture
+def rigs(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, 'SETTINGS_PATH', str(tmp_path) + '/')
+    monkeypatch.setattr(settings, 'SETTINGS_FILE', 'shaker1_params.txt')
+    monkeypatch.setattr(settings, 'RIGS', RIGS)
+    return tmp_path
+
+
+def test_rig_settings(rigs):
+    assert settings.rig_settings('shaker1') == settings.rig_settings()
+    shaker2 = settings.rig_settings('shaker2')
+    assert shaker2['SETTINGS_FILE'] == 'shaker2_params.txt'
+    assert shaker2['SHAKER_ARDUINO'] == settings.SHAKER_ARDUINO
+    with pytest.raises(KeyError):
+        settings.rig_settings('shaker3')
+
+    settings.update_settings_file(motor_pos='1,2', rig='shaker1')
+    settings.update_settings_file(motor_pos='3,4', rig='shaker2')
+    assert settings.update_settings_file()['motor_pos'] == '1,2'
+    assert settings.update_settings_file(rig='shaker2')['motor_pos'] == '3,4'
+    assert (rigs / 'shaker2_params.txt').exists()
+
+
+def test_rigs_run_concurrently_and_in_order(rigs):
+    log = []
+    barrier = threading.Barrier(2, timeout=5)
+
+    def job(rig, value):
+        log.append((rig, value))
+        return value
+
+    def meet(rig):
+        # only returns if both rigs are running at the same time
+        barrier.wait()
+
+    scheduler = RigScheduler()
+    for rig in ('shaker1', 'shaker2'):
+        scheduler.add(rig, meet)
+        for value in range(3):
+            scheduler.add(rig, job, value)
+    status = scheduler.run()
+
+    assert not scheduler.running()
+    for rig in ('shaker1', 'shaker2'):
+        assert [value for r, value in log if r == rig] == [0, 1, 2]
+        assert status[rig]['state'] == 'done'
+        assert status[rig]['done'] == 4
+    assert [job.result for job in scheduler.jobs['shaker2']] == [None, 0, 1, 2]
+
+
+def test_failure_is_isolated_to_its_rig(rigs):
+    def fail(rig):
+        raise RuntimeError('motor stalled')
+
+    def slow(rig):
+        time.sleep(0.05)
+        return rig
+
+    scheduler = RigScheduler()
+    scheduler.add('shaker1', fail)
+    skipped = scheduler.add('shaker1', slow)
+    other = scheduler.add('shaker2', slow)
+    status = scheduler.run()
+
+    assert status['shaker1']['state'] == 'failed'
+    assert 'motor stalled' in status['shaker1']['error']
+    assert 'RuntimeError' in scheduler.jobs['shaker1'][0].traceback
+    assert skipped.state == 'skipped'
+    assert other.state == 'done' and other.result == 'shaker2'
+    assert scheduler.summary() == {'waiting': 0, 'running': 0, 'done': 1, 'failed': 1, 'skipped': 1}
+
+    # new jobs run after the failure when started again
+    retry = scheduler.add('shaker1', slow)
+    scheduler.run()
+    assert retry.state == 'done'
+
+    with pytest.raises(KeyError):
+        scheduler.add('shaker3', slow)
@@ -0,0 +1,69 @@
+import numpy as np
+
+from shaker.analysis.runstore import RunStore, mid_crossing
+
+
+def test_mid_crossing_interpolates_each_row():
+    gamma = np.array([[1.0, 2.0, 3.0, 4.0],
+                      [4.0, 3.0, 2.0, np.nan]])
+    order = np.array([[0.8, 0.7, 0.3, 0.2],
+                      [0.1, 0.1, 0.9, np.nan]])
+    gamma_transition, order_mid = mid_crossing(gamma, order)
+    np.testing.assert_allclose(order_mid, [0.5, 0.5])
+    np.testing.assert_allclose(gamma_transition, [2.5, 2.5])
+
+
+def test_runstore_aggregate_and_transitions(tmp_path):
+    filepath = str(tmp_path / 'runs.npz')
+    store = RunStore(filepath)
+    duty = [700, 650, 600, 550]
+    for run, offset in enumerate([-0.1, 0.0, 0.1]):
+        store.add_run(0.6, run, duty, [4.0 + offset, 3.0, 2.0, 1.0], [0.2, 0.3, 0.7, 0.8])
+        store.add_run(0.7, run, duty, [4.0, 3.0, 2.0, 1.0], [0.2, 0.6, 0.7, 0.8])
+    store.add_run(0.7, 2, duty, [4.0, 3.0, 2.0, 1.0], [0.2, 0.6, 0.7, 0.8])
+    assert len(store) == 24
+    store.save()
+
+    store = RunStore(filepath)
+    agg = store.aggregate()
+    assert len(agg['n']) == 8
+    np.testing.assert_allclose(agg['gamma_mean'][0], 4.0)
+    np.testing.assert_allclose(agg['gamma_std'][0], np.std([3.9, 4.0, 4.1]))
+
+    area_fractions, gamma_transition, order_mid = store.transitions()
+    np.testing.assert_allclose(area_fractions, [0.6, 0.7])
+    np.testing.assert_allclose(gamma_transition, [2.5, 3.25])
+
+
+def test_bootstrap_transitions_confidence_interval():
+    store = RunStore()
+    rng = np.random.default_rng(1)
+    gamma = np.linspace(4, 1, 10)
+    for phi, gamma_t in ((0.6, 2.0), (0.7, 3.0)):
+        for run in range(8):
+            shift = rng.normal(scale=0.1)
+            store.add_run(phi, run, np.arange(700, 600, -10), gamma, 1 / (1 + np.exp((gamma - gamma_t - shift) / 0.2)))
+    store.add_run(0.7, 8, np.arange(700, 650, -10), gamma[:5], np.zeros(5))
+
+    area_fractions, gamma_transition, lower, upper = store.bootstrap_transitions(n_boot=500, seed=0)
+    np.testing.assert_allclose(area_fractions, [0.6, 0.7])
+    assert np.all(lower <= gamma_transition) and np.all(gamma_transition <= upper)
+    assert np.all(upper - lower > 0)
+    assert abs(gamma_transition[0] - 2.0) < 0.15
+
+
+def test_aggregate_by_duty_matches_rows_of_adaptive_runs():
+    store = RunStore()
+    # the same curve measured at different duty cycles in a different order in each run
+    store.add_run(0.6, 0, [700, 600, 650], [4.0, 2.0, 3.0], [0.2, 0.8, 0.5])
+    store.add_run(0.6, 1, [700, 650, 620, 600], [4.2, 3.2, 2.6, 2.2], [0.2, 0.6, 0.7, 0.8])
+
+    agg = store.aggregate(by='duty')
+    np.testing.assert_allclose(agg['duty_mean'], [700, 650, 620, 600])
+    np.testing.assert_array_equal(agg['n'], [2, 2, 1, 2])
+    np.testing.assert_allclose(agg['gamma_mean'], [4.1, 3.1, 2.6, 2.1])
+
+    by_step = store.aggregate()
+    assert by_step['duty_std'][1] > 0   # different duty cycles mixed at step 1
+    _, n_runs, runs = store.runs(by='duty')
+    np.testing.assert_allclose(runs['duty'][0, 0], [700, 650, np.nan, 600])
@@ -0,0 +1,67 @@
+import time
+import numpy as np
+
+from shaker.schedule import ScheduleRunner, compile_schedule, cooling_sweep, adaptive_sweep
+
+
+class FakeShaker:
+    def __init__(self):
+        self.commands = []
+
+    def set_duty(self, val):
+        self.commands.append(('d', val))
+
+    def set_duty_and_record(self, val):
+        self.commands.append(('i', val))
+
+
+class FakeAccelerometer:
+    def mean(self, seconds):
+        return 2.0
+
+    def mark(self, label, value=None):
+        pass
+
+    def wait_until_settled(self, since, window=1.0, tolerance=0.02, timeout=10):
+        return 2.0, 0.01, 0.0, True
+
+
+def test_compile_schedule_overlaps_camera_gap_with_ramp():
+    schedule = cooling_sweep(710, 700, -5, rate=10, settle_time=1, record_time=2, gap=1, measure=0.5)
+    events = compile_schedule(schedule)
+    times = {}
+    for t, action, duty, _ in events:
+        times.setdefault((action, duty), []).append(t)
+    # ramp 715 -> 710 takes 0.5 s then 1 s settle
+    np.testing.assert_allclose(times[('measure', 710)], [1.5])
+    np.testing.assert_allclose(times[('record_start', 710)], [1.5])
+    # next ramp starts straight after recording stops, not after the camera gap
+    np.testing.assert_allclose(times[('duty', 709)], [3.6])
+    assert times[('record_start', 705)][0] >= times[('record_stop', 710)][0] + 1
+
+
+def test_runner_executes_and_logs_events():
+    shaker = FakeShaker()
+    runner = ScheduleRunner(shaker, FakeAccelerometer())
+    schedule = [{'action': 'ramp', 'start': 502, 'stop': 500, 'rate': 100},
+                {'action': 'hold', 'duty': 500, 'duration': 5, 'settle': True, 'measure': 0.1},
+                {'action': 'record', 'duty': 500, 'duration': 0.02}]
+    t0 = time.time()
+    measurements = runner.run(schedule)
+    # settle finishes immediately so the 5 s hold is cut short
+    assert time.time() - t0 < 1
+    assert measurements == [(500, 2.0)]
+    assert shaker.commands == [('d', 502), ('d', 501), ('d', 500), ('d', 500), ('i', 500), ('i', 500)]
+    assert all(actual >= scheduled - 1e-3 for scheduled, actual, *_ in runner.log)
+
+
+def test_adaptive_sweep_refines_around_transition():
+    def measure(duty):
+        return 1.0 / (1 + np.exp((duty - 633) / 2))
+
+    duties, values = adaptive_sweep(measure, 710, 565, -20, min_step=1, max_points=20)
+    assert len(duties) == 20
+    assert duties[:8] == list(range(710, 565, -20))
+    refined = np.sort(duties[8:])
+    assert np.all(np.abs(refined - 633) < 15)
+    assert len(set(duties)) == len(duties)
@@ -0,0 +1,70 @@
+import json
+import time
+
+from shaker.serial_monitor import InstrumentedArduino, summaries
+
+
+class FakeArduino:
+    """Replies to stepper moves after a delay proportional to the number of steps"""
+
+    def __init__(self):
+        self.replies = []
+        self.port = 'COM_TEST'
+
+    def send_serial_line(self, line):
+        self.replies.append(line)
+
+    def read_serial_line(self):
+        if not self.replies:
+            return ''
+        line = self.replies.pop(0)
+        if line.startswith('M'):
+            time.sleep(int(line[3:]) * 1e-5)
+            return line[:2] + ' moved\n'
+        if line.startswith('x'):
+            return "'x' is an invalid command. Type 'h' for a list of accepted commands\n"
+        if line.startswith('h'):
+            return 'Maximum command length = 19\n'
+        return ''
+
+    def read_all(self):
+        self.replies = []
+        return b''
+
+
+def test_latency_bytes_and_errors(tmp_path):
+    dump_file = str(tmp_path / 'serial.jsonl')
+    ard = InstrumentedArduino(FakeArduino(), name='stepper', dump_file=dump_file, dump_interval=0)
+    assert ard.port == 'COM_TEST'
+    assert InstrumentedArduino.wrap(ard) is ard
+
+    for steps in (100, 1000, 1000):
+        ard.send_serial_line('M1+{}'.format(steps))
+        assert ard.read_serial_line().endswith('moved\n')
+    ard.send_serial_line('d500')
+    ard.read_all()
+    ard.send_serial_line('x')
+    ard.read_serial_line()
+    assert ard.read_serial_line() == ''
+    ard.send_serial_line('h')     # help text is not an error
+    ard.read_serial_line()
+    ard.send_serial_line('s')
+
+    summary = ard.summary()
+    moves = summary['commands']['M1+']
+    assert moves['count'] == 3
+    assert moves['max'] >= 0.01
+    assert moves['p50'] >= moves['mean'] / 10
+    assert 0 < moves['seconds_per_unit'] < 1e-3
+    assert summary['commands']['d']['count'] == 1
+    assert summary['bytes_out'] == len('M1+100') + 2 * len('M1+1000') + len('d500') + len('x') + len('h') + len('s')
+    assert summary['bytes_in'] == 3 * len('M1 moved\n') + len(summary['last_error_reply']) + 1 + \
+        len('Maximum command length = 19\n')
+    assert summary['timeouts'] == 1
+    assert summary['error_replies'] == 1
+    assert 'stepper' in [link['name'] for link in summaries()]
+
+    with open(dump_file) as f:
+        dumps = [json.loads(line) for line in f]
+    assert len(dumps) > 1
+    assert dumps[-1]['name'] == 'stepper'
@@ -0,0 +1,234 @@
+import time
+
+import numpy as np
+import pytest
+
+pytest.importorskip('labequipment')
+from shaker import shaker as shaker_module
+
+
+class FakeShakerArduino:
+    """Records every line sent to the shaker Arduino with the time it was sent"""
+
+    def __init__(self, *args):
+        self.sent = []
+
+    def send_serial_line(self, line):
+        self.sent.append((time.perf_counter(), line))
+
+    def read_serial_line(self):
+        return 'Serial control enabled.'
+
+    def read_all(self):
+        return ''
+
+    def quit_serial(self):
+        pass
+
+    def duties(self):
+        return [line for _, line in self.sent if line[0] in 'di']
+
+
+class FakeRampArduino(FakeShakerArduino):
+    """Firmware with the 'r' command. Ramps are reported straight away, stalled ramps never complete. Any other
+    command except 'h' stops a ramp that has not been read to the end. Counts reads from two threads at once."""
+
+    def __init__(self, *args, stall=False, delay=0):
+        super().__init__()
+        self.stall = stall
+        self.delay = delay
+        self.replies = []
+        self.reading = 0
+        self.overlapping_reads = 0
+
+    def send_serial_line(self, line):
+        super().send_serial_line(line)
+        ramp = [reply for reply in self.replies if reply.startswith('Ramp')]
+        if line != 'h' and ramp:
+            self.replies = [reply for reply in self.replies if not reply.startswith('Ramp')]
+            self.replies.append('Ramp stopped {}'.format(ramp[0].split()[-1]))
+        if line == 'h':
+            self.replies.append('dxxxx \t- Sets the duty cycle\n' + shaker_module.FIRMWARE_RAMP_HELP + ' \t- Ramps')
+        elif line[0] == 'r':
+            start, stop, interval, step = (int(value) for value in line[1:].split(','))
+            direction = 1 if stop >= start else -1
+            values = list(range(start, stop, direction * step)) + [stop]
+            for value in values[:-1]:
+                self.replies.append('Ramp {}'.format(value))
+            if not self.stall:
+                self.replies.append('Ramp complete {}'.format(stop))
+
+    def read_serial_line(self):
+        self.overlapping_reads += self.reading
+        self.reading += 1
+        # delay is the time between steps
+        time.sleep(self.delay)
+        self.reading -= 1
+        return self.replies.pop(0) if self.replies else ''
+
+    def read_all(self):
+        self.overlapping_reads += self.reading
+        replies = '\n'.join(self.replies)
+        self.replies = []
+        return replies
+
+
+def make_shaker(monkeypatch, arduino):
+    with monkeypatch.context() as m:
+        m.setattr(shaker_module, 'Arduino', lambda *args: arduino)
+        m.setattr(shaker_module.time, 'sleep', lambda t: None)
+        return shaker_module.Shaker(max_rate=20)
+
+
+@pytest.fixture
+def shaker(monkeypatch):
+    return make_shaker(monkeypatch, FakeShakerArduino())
+
+
+def test_redundant_duty_is_not_sent(shaker):
+    ard = shaker.power.ard
+    shaker.set_duty(500)
+    shaker.set_duty(500)
+    assert ard.duties() == ['d500']
+    assert shaker.duty == 500
+    # recording always triggers the camera
+    shaker.set_duty_and_record(500)
+    assert ard.duties() == ['d500', 'i500']
+
+
+def test_fast_updates_are_coalesced(shaker):
+    ard = shaker.power.ard
+    start = time.perf_counter()
+    for duty in range(600, 500, -1):
+        shaker.set_duty(duty)
+        time.sleep(0.002)
+    shaker.flush()
+    elapsed = time.perf_counter() - start
+
+    duties = ard.duties()
+    # the first and the latest values are always sent
+    assert duties[0] == 'd600' and duties[-1] == 'd501'
+    assert len(duties) <= elapsed * shaker.max_rate + 2
+    times = np.array([t for t, line in ard.sent if line[0] == 'd'])
+    assert np.all(np.diff(times) >= 1 / shaker.max_rate - 1e-3)
+    assert shaker.duty == 501
+
+
+def test_value_held_back_is_sent_by_timer(shaker):
+    ard = shaker.power.ard
+    shaker.set_duty(600)
+    shaker.set_duty(550)
+    assert ard.duties() == ['d600']
+    time.sleep(2 / shaker.max_rate)
+    assert ard.duties() == ['d600', 'd550']
+
+    # returning to the current value cancels the held back one. A lower rate makes sure 540 is held back.
+    shaker.max_rate = 2
+    shaker.set_duty(540)
+    shaker.set_duty(550)
+    time.sleep(1.2 / shaker.max_rate)
+    assert ard.duties() == ['d600', 'd550']
+
+
+def test_value_held_back_after_firmware_ramp_is_sent(monkeypatch):
+    shaker = make_shaker(monkeypatch, FakeRampArduino())
+    shaker.max_rate = 2
+    shaker.set_duty(500)
+    # a value held back and superseded leaves its timer to run out
+    shaker.set_duty(510)
+    shaker.set_duty(500)
+    time.sleep(1.2 / shaker.max_rate)
+    shaker.ramp(500, 520, 100, step_size=10)
+    # held back because the ramp command was just sent
+    shaker.set_duty(400)
+    assert shaker.power.ard.duties()[-1] == 'd500'
+    time.sleep(1.2 / shaker.max_rate)
+    assert shaker.power.ard.duties()[-1] == 'd400'
+
+
+def test_sequence_does_not_resend_last_value(shaker):
+    ard = shaker.power.ard
+    shaker.sequence([500, 500, 510], rate=10)
+    assert ard.duties() == ['d500', 'd510']
+    shaker.sequence([510, 520], rate=10, record=True)
+    assert ard.duties()[2:] == ['i510', 'd520', 'i520']
+
+
+def test_firmware_ramp_is_one_command(monkeypatch):
+    shaker = make_shaker(monkeypatch, FakeRampArduino())
+    ard = shaker.power.ard
+    reported = []
+    shaker.ramp(650, 560, 9, step_size=10, progress=reported.append)
+    assert [line for _, line in ard.sent if line != 'h'][-1] == 'r650,560,1111,10'
+    assert reported == list(range(650, 560, -10)) + [560]
+    assert shaker.duty == 560
+
+    # the recording is started before and stopped after the ramp
+    ard.sent = []
+    shaker.ramp(560, 600, 10, record=True)
+    assert [line for _, line in ard.sent] == ['i560', 'r560,600,100,1', 'i600']
+
+
+def test_ramp_falls_back_to_host(monkeypatch, shaker):
+    # steps that cannot be timed in whole ms are sent from the host
+    firmware = make_shaker(monkeypatch, FakeRampArduino())
+    firmware.ramp(500, 503, 300)
+    assert 'r' not in [line[0] for _, line in firmware.power.ard.sent]
+    assert firmware.duty == 503
+
+    # firmware without the 'r' command
+    shaker.ramp(500, 503, 300)
+    assert not shaker.supports_firmware_ramp()
+    assert shaker.power.ard.duties()[-1] == 'd503'
+
+
+def test_stalled_firmware_ramp_sets_final_duty(monkeypatch):
+    monkeypatch.setattr(shaker_module, 'RAMP_TIMEOUT_MARGIN', 0.05)
+    shaker = make_shaker(monkeypatch, FakeRampArduino(stall=True))
+    shaker.ramp(500, 505, 1000)
+    assert shaker.power.ard.duties()[-1] == 'd505'
+    assert shaker.duty == 505
+
+
+def test_ramp_rate_is_the_same_on_both_paths(monkeypatch, shaker):
+    # steps of 10 at 100 duty cycles per second are 0.1 s apart
+    shaker.ramp(500, 550, 100, step_size=10)
+    times = [t for t, line in shaker.power.ard.sent if line[0] == 'd']
+    assert shaker.power.ard.duties() == ['d500', 'd510', 'd520', 'd530', 'd540', 'd550']
+    np.testing.assert_allclose(times[-1] - times[0], 0.5, atol=0.05)
+
+    firmware = make_shaker(monkeypatch, FakeRampArduino())
+    firmware.ramp(500, 550, 100, step_size=10)
+    assert firmware.power.ard.sent[-1][1] == 'r500,550,100,10'
+
+
+def test_firmware_ramp_can_run_in_background(monkeypatch):
+    shaker = make_shaker(monkeypatch, FakeRampArduino(delay=0.01))
+    future = shaker.ramp(500, 400, 100, step_size=10, wait=False)
+    assert not future.done()
+    assert future.result(timeout=2) is None
+    assert shaker.duty == 400
+
+    # the shaker can be used while the ramp runs and another duty cycle stops it
+    future = shaker.ramp(400, 200, 100, step_size=10, wait=False)
+    time.sleep(0.1)
+    shaker.set_duty(450)
+    future.result(timeout=2)
+    assert shaker.duty == 450
+    assert shaker.power.ard.duties()[-1] == 'd450'
+    # only the thread following the ramp reads the port
+    assert shaker.power.ard.overlapping_reads == 0
+    assert shaker.power.ard.replies == []
+
+
+def test_ramp_started_during_another_follows_its_own_steps(monkeypatch):
+    shaker = make_shaker(monkeypatch, FakeRampArduino(delay=0.01))
+    first = shaker.ramp(500, 300, 100, step_size=10, wait=False)
+    time.sleep(0.05)
+    reported = []
+    shaker.ramp(450, 400, 100, step_size=10, progress=reported.append)
+    first.result(timeout=2)
+    assert reported == [450, 440, 430, 420, 410, 400]
+    assert shaker.duty == 400
+    assert 'd300' not in shaker.power.ard.duties()
+    assert shaker.power.ard.overlapping_reads == 0
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from shaker.centre_mass import find_com
+from shaker.simulation import SimulatedRig
+from conftest import BOUNDARY_PTS
+
+
+def measured_com(rig, n=20):
+    """Mean and standard deviation of the thresholded centre of mass over n annealed frames"""
+    coms = []
+    for _ in range(n):
+        rig.shaker.set_duty(650)
+        rig.shaker.ramp(650, 560, 10)
+        img = rig.camera.get_frame()[:, :, 0]
+        coms.append(find_com(img < 87 if rig.particles == 'balls' else img > 79))
+    return np.mean(coms, axis=0), np.std(coms, axis=0)
+
+
+def test_com_follows_tilt():
+    rig = SimulatedRig(BOUNDARY_PTS, level=(100, -50), motor_pos=(100, -50), seed=0)
+    level_com, spread = measured_com(rig)
+    np.testing.assert_allclose(level_com, rig.centre, atol=3)
+    assert np.all(spread > 0)
+
+    rig.motors.movexy(300, -50)
+    tilted_com, _ = measured_com(rig)
+    # balls move downhill about sensitivity pixels per step for small tilts
+    assert tilted_com[0] - level_com[0] == pytest.approx(200 * rig.sensitivity, rel=0.5)
+    assert abs(tilted_com[1] - level_com[1]) < 5
+
+    rig.motors.movexy(5000, -50)
+    saturated_com, _ = measured_com(rig, n=5)
+    assert tilted_com[0] < saturated_com[0] < max(pt[0] for pt in BOUNDARY_PTS)
+
+
+def test_bubbles_move_uphill():
+    rig = SimulatedRig(BOUNDARY_PTS, particles='bubbles', level=(0, 0), seed=0)
+    rig.motors.movexy(0, 300)
+    com, _ = measured_com(rig)
+    assert com[1] < rig.centre[1] - 10
+
+
+def test_anneal_decorrelation():
+    rig = SimulatedRig(BOUNDARY_PTS, decorrelation=0.1, seed=0)
+    before = rig.positions.copy()
+    # moving the motors does nothing until the tray is annealed
+    rig.motors.movexy(500, 500)
+    rig.shaker.set_duty(500)
+    np.testing.assert_array_equal(rig.positions, before)
+
+    rig.shaker.set_duty(650)
+    rig.shaker.set_duty(560)
+    moved = np.any(rig.positions != before, axis=1)
+    assert rig.anneal_count == 1
+    assert 0 < np.mean(moved) < 0.3
+
+
+def test_render():
+    rig = SimulatedRig(BOUNDARY_PTS, img_shape=(360, 640), noise=0, seed=0)
+    img = rig.camera.get_frame()
+    assert img.shape == (360, 640, 3)
+    assert img.dtype == np.uint8
+    x, y = rig.positions[0].round().astype(int)
+    assert img[y, x, 0] == 30
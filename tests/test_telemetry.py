@@ -0,0 +1,73 @@
+import collections
+import json
+
+import pytest
+
+from shaker import telemetry
+
+
+@pytest.fixture
+def recording():
+    telemetry.reset()
+    telemetry.enable()
+    yield
+    telemetry.disable()
+    telemetry.reset()
+
+
+def test_disabled_spans_record_nothing():
+    telemetry.disable()
+    start = telemetry.mark()
+    with telemetry.span('anything', duty=500):
+        pass
+    assert telemetry.span('a') is telemetry.span('b')
+    assert telemetry.events(start) == []
+
+
+def test_nested_spans_and_breakdown(recording):
+    @telemetry.traced('inner')
+    def inner():
+        return 3
+
+    start = telemetry.mark()
+    with telemetry.span('outer', evaluation=1):
+        assert inner() == 3
+        inner()
+
+    names = [event[0] for event in telemetry.events(start)]
+    assert names == ['inner', 'inner', 'outer']
+    breakdown = telemetry.breakdown(start)
+    assert breakdown['inner'][1] == 2
+    assert breakdown['outer'][0] >= breakdown['inner'][0]
+
+
+def test_exports(recording, tmp_path):
+    with telemetry.span('get_frame', camera=object()):
+        pass
+    timing_file = str(tmp_path / 'level_timing.jsonl')
+    telemetry.save_breakdown(timing_file, evaluation=1, cost=2.5)
+    telemetry.save_breakdown(timing_file, evaluation=2, cost=1.5)
+    with open(timing_file) as f:
+        records = [json.loads(line) for line in f]
+    assert [record['evaluation'] for record in records] == [1, 2]
+    assert records[0]['spans']['get_frame']['count'] == 1
+
+    trace_file = str(tmp_path / 'trace.json')
+    telemetry.save_chrome_trace(trace_file)
+    with open(trace_file) as f:
+        trace = json.load(f)['traceEvents']
+    assert trace[0]['name'] == 'get_frame'
+    assert trace[0]['ph'] == 'X'
+    assert trace[0]['dur'] >= 0
+
+
+def test_old_spans_are_dropped(recording, monkeypatch):
+    monkeypatch.setattr(telemetry, '_events', collections.deque(maxlen=3))
+    start = telemetry.mark()
+    for i in range(5):
+        with telemetry.span('step', i=i):
+            pass
+    assert [event[4]['i'] for event in telemetry.events(start)] == [2, 3, 4]
+    middle = telemetry.mark() - 1
+    assert [event[4]['i'] for event in telemetry.events(middle)] == [4]
+    assert telemetry.breakdown(start)['step'][1] == 3
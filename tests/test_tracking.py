@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from shaker.analysis.tracking import read_tracking, convert_to_table, is_table, frame_order_stats
+
+
+@pytest.fixture
+def tracking_file(tmp_path):
+    filepath = str(tmp_path / 'tracking.hdf5')
+    frames = np.repeat(np.arange(10), 5)
+    dataframe = pd.DataFrame({'x': np.arange(50.0),
+                              'y': np.arange(50.0),
+                              'hexatic_order_abs': np.linspace(0, 1, 50)}, index=frames)
+    dataframe.to_hdf(filepath, key='data')
+    return filepath, dataframe
+
+
+def test_convert_to_table(tracking_file):
+    filepath, _ = tracking_file
+    assert not is_table(filepath)
+    assert convert_to_table(filepath)
+    assert is_table(filepath)
+    assert not convert_to_table(filepath)
+
+
+def test_read_tracking_selects_frames_and_columns(tracking_file):
+    filepath, dataframe = tracking_file
+    convert_to_table(filepath)
+    result = read_tracking(filepath, frames=[2, 7], columns=['hexatic_order_abs'])
+    expected = dataframe.loc[[2, 7], ['hexatic_order_abs']]
+    assert list(result.columns) == ['hexatic_order_abs']
+    assert result.index.name == 'index'
+    np.testing.assert_allclose(result.values, expected.values)
+
+
+def test_read_tracking_fixed_format_falls_back(tracking_file):
+    filepath, dataframe = tracking_file
+    with pytest.warns(UserWarning):
+        result = read_tracking(filepath, frames=3, columns=['x'])
+    np.testing.assert_allclose(result['x'].values, dataframe.loc[3, 'x'].values)
+
+
+def test_frame_order_stats(tracking_file):
+    _, dataframe = tracking_file
+    dataframe.iloc[0, 2] = np.nan
+    stats = frame_order_stats(dataframe)
+    expected = dataframe['hexatic_order_abs'].groupby(level=0)
+    np.testing.assert_allclose(stats['order_mean'], expected.mean())
+    np.testing.assert_allclose(stats['order_std'], expected.std(ddof=0))
+    np.testing.assert_array_equal(stats['count'], [4] + [5] * 9)
+
+
+def test_convert_to_table_keeps_other_keys(tracking_file):
+    filepath, dataframe = tracking_file
+    other = pd.DataFrame({'a': np.arange(3.0)})
+    other.to_hdf(filepath, key='other')
+    assert convert_to_table(filepath, key='data')
+    assert is_table(filepath, key='data')
+    assert not is_table(filepath, key='other')
+    pd.testing.assert_frame_equal(pd.read_hdf(filepath, key='other'), other)
+    np.testing.assert_allclose(read_tracking(filepath, key='data').values, dataframe.values)